@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Reports file size, write time and read time of the HDF5 output for
+# compression settings on synthetic logger data.
+# Usage: python benchmarks/compression_bench.py --devices 50 --rows 36000
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from datalogger_to_ml.storage import repack
+
+SETTINGS = [
+    {},
+    {'complib': 'zlib', 'complevel': 1},
+    {'complib': 'zlib', 'complevel': 5},
+    {'complib': 'blosc:lz4', 'complevel': 5},
+    {'complib': 'blosc:zstd', 'complevel': 5},
+    {'complib': 'blosc:zstd', 'complevel': 9},
+    {'complib': 'blosc:zstd', 'complevel': 5, 'chunkshape': 65536},
+]
+
+
+def generate_devices(devices, rows):
+    # Random walks sampled with jitter, like slow logger channels
+    rng = np.random.default_rng(0)
+    start = 1612224000000000
+    period = 3600 * 1000000 // rows
+
+    for index in range(devices):
+        jitter = rng.integers(0, period // 10, rows)
+        timestamps = start + np.arange(rows) * period + jitter
+        data = np.round(np.cumsum(rng.normal(0, 0.01, rows)) + index, 4)
+        yield f'Z:DEV{index:04d}@e,12', pd.DataFrame(data={
+            'Timestamps': timestamps,
+            'Data': data
+        })
+
+
+def run(setting, device_frames, rows, directory):
+    output_file = Path(directory).joinpath('bench.h5')
+    chunkshape = setting.get('chunkshape', None)
+
+    start = time.perf_counter()
+    with pd.HDFStore(
+        output_file,
+        mode='w',
+        complib=setting.get('complib', None),
+        complevel=setting.get('complevel', None)
+    ) as hdf:
+        for key, data_frame in device_frames:
+            hdf.append(key, data_frame, expectedrows=rows)
+
+    if chunkshape:
+        repack(output_file, chunkshape)
+
+    write_time = time.perf_counter() - start
+    size = os.path.getsize(output_file)
+
+    start = time.perf_counter()
+    with pd.HDFStore(output_file, mode='r') as hdf:
+        for key in hdf.keys():
+            hdf.select(key)
+
+    read_time = time.perf_counter() - start
+    os.remove(output_file)
+
+    name = ', '.join(f'{key}={value}' for key, value in setting.items())
+    print(f'{name or "uncompressed":<50} {size / 1048576:9.2f} MiB '
+          f'write {write_time:7.3f} s read {read_time:7.3f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compression benchmark')
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=36000)
+    args = parser.parse_args()
+
+    device_frames = list(generate_devices(args.devices, args.rows))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for setting in SETTINGS:
+            run(setting, device_frames, args.rows, directory)
+
+
+if __name__ == '__main__':
+    main()
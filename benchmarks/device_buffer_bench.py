@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Compares per-reply DataFrame accumulation against DeviceBuffer.
+# Usage: python benchmarks/device_buffer_bench.py --replies 10000
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from datalogger_to_ml.dpm_data.device_buffer import DeviceBuffer
+
+
+def generate_replies(replies, reply_size):
+    rng = np.random.default_rng(0)
+    start = 1612224000000000
+
+    for index in range(replies):
+        micros = start + np.arange(reply_size) + index * reply_size
+        yield micros.tolist(), rng.random(reply_size).tolist()
+
+
+def data_frame_path(replies):
+    # `DataFrame.append` was removed in pandas 2, `concat` is equivalent
+    data_store = None
+
+    for micros, data in replies:
+        data_frame = pd.DataFrame(data={'Timestamps': micros, 'Data': data})
+
+        if data_store is None:
+            data_store = data_frame
+        else:
+            data_store = pd.concat([data_store, data_frame])
+
+    return data_store
+
+
+def device_buffer_path(replies):
+    device_data = DeviceBuffer()
+
+    for micros, data in replies:
+        device_data.extend(micros, data)
+
+    return device_data.to_data_frame()
+
+
+def run(name, path, replies):
+    start = time.perf_counter()
+    data_frame = path(replies)
+    elapsed = time.perf_counter() - start
+    print(f'{name:>14}: {len(data_frame):>9} rows in {elapsed:8.3f} s '
+          f'({len(data_frame) / elapsed:,.0f} rows/s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DeviceBuffer benchmark')
+    parser.add_argument('--replies', type=int, default=10000)
+    parser.add_argument('--reply-size', type=int, default=10)
+    args = parser.parse_args()
+
+    replies = list(generate_replies(args.replies, args.reply_size))
+    run('DataFrame', data_frame_path, replies)
+    run('DeviceBuffer', device_buffer_path, replies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Runs a whole dpm_data window against the DPM simulator and reports
+# throughput and the maximum resident memory.
+# Usage: python benchmarks/simulator_bench.py --devices 5000 --minutes 10
+
+import argparse
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+import tempfile
+import resource
+import time
+from datalogger_to_ml.dpm_data import get_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DPM simulator benchmark')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--sample-rate', type=float, default=15.0)
+    parser.add_argument('--reply-size', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--output-format', default='hdf5')
+    args = parser.parse_args()
+
+    start_date = datetime(2021, 2, 1)
+    rows = int(args.minutes * 60 * args.sample_rate) * args.devices
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        output_file = Path(temp_path).joinpath(
+            'bench.parquet' if args.output_format == 'parquet'
+            else 'bench.h5'
+        )
+        start = time.perf_counter()
+        get_data(
+            start_date=start_date,
+            end_date=start_date + timedelta(minutes=args.minutes),
+            output_file=output_file,
+            output_format=args.output_format,
+            shards=args.shards,
+            simulator={
+                'devices': args.devices,
+                'sample_rate': args.sample_rate,
+                'reply_size': args.reply_size,
+                'device_info': False
+            }
+        )
+        elapsed = time.perf_counter() - start
+        # Kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        size = output_file.stat().st_size
+
+    print(f'{args.devices} devices, {rows} rows in {elapsed:.3f} s '
+          f'({rows / elapsed:,.0f} rows/s), max RSS {peak / 2 ** 20:.1f} MiB, '
+          f'{size / 2 ** 20:.1f} MiB written')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from . import h5_dump, h5_validator, nanny
+from . import align, catalog, compact, export, h5_dump, h5_validator, nanny
+from . import layout, reader
+from . import storage
 
 # https://packaging.python.org/guides/single-sourcing-package-version/#single-sourcing-the-version
 try:
@@ -19,7 +21,14 @@ except metadata.PackageNotFoundError:
 
 __all__ = [
     '__version__',
+    'align',
+    'catalog',
+    'compact',
+    'export',
     'h5_dump',
     'h5_validator',
-    'nanny'
+    'layout',
+    'nanny',
+    'reader',
+    'storage'
 ]
@@ -4,6 +4,8 @@
 import argparse
 from pathlib import Path
 import isodate
+from . import compact
+from . import export
 from . import h5_dump
 from . import nanny
 from . import h5_validator
@@ -57,6 +59,36 @@ def main():
         help='Validate output file contents'
     )
     validate_parser.set_defaults(func=h5_validator.validate)
+    catalog_parser = subparsers.add_parser(
+        'rebuild-catalog',
+        help='Rescan the output tree and rebuild its file catalog'
+    )
+    catalog_parser.set_defaults(func=nanny.rebuild_catalog)
+    gaps_parser = subparsers.add_parser(
+        'gaps',
+        help='List windows missing from the output tree'
+    )
+    gaps_parser.set_defaults(func=nanny.report_gaps)
+    repair_parser = subparsers.add_parser(
+        'repair',
+        help='Request devices missing from existing files again'
+    )
+    repair_parser.set_defaults(func=nanny.repair)
+    plan_parser = subparsers.add_parser(
+        'plan',
+        help='Print the shards of the device list and their predicted cost'
+    )
+    plan_parser.set_defaults(func=nanny.plan)
+    export_parser = subparsers.add_parser(
+        'export',
+        help='Export a time range to memory-mappable per-device arrays'
+    )
+    export_parser.set_defaults(func=export.export)
+    compact_parser = subparsers.add_parser(
+        'compact',
+        help='Roll completed hourly files into daily or monthly archives'
+    )
+    compact_parser.set_defaults(func=compact.compact)
 
     # sub-command arguments
     nanny_parser.add_argument(
@@ -77,16 +109,160 @@ def main():
         type=Path,
         help='Output directory for completed files to be moved to'
     )
+    nanny_parser.add_argument(
+        '--staging',
+        type=Path,
+        help=('Directory for files being written, renamed into the output '
+              'directory once complete. Defaults to .staging in it.')
+    )
     nanny_parser.add_argument(
         '--run-once',
         action='store_true',
         help='Generate only one file before exiting.'
     )
+    nanny_parser.add_argument(
+        '--backfill-workers',
+        type=int,
+        help=('Number of past windows fetched concurrently when catching '
+              'up to now.')
+    )
+    nanny_parser.add_argument(
+        '--max-window-rows',
+        type=int,
+        help=('Fetch windows expected to exceed this many rows, judged by '
+              'the newest files, as shorter sub-windows.')
+    )
+    nanny_parser.add_argument(
+        '--max-window-bytes',
+        type=int,
+        help='Like --max-window-rows, for the file size.'
+    )
+    nanny_parser.add_argument(
+        '--fill-gaps',
+        choices=['newest', 'oldest'],
+        help=('Fetch windows missing between the start time and the newest '
+              'file first, in this order.')
+    )
+    nanny_parser.add_argument(
+        '--align-period',
+        type=str,
+        help=('Grid period of an aligned companion written next to each '
+              'file, e.g. T1S.')
+    )
+    nanny_parser.add_argument(
+        '--align-mode',
+        choices=['last', 'linear', 'mean'],
+        help='Resampling of the aligned companion. Defaults to last.'
+    )
     nanny_parser.add_argument(
         '--start-time',
         type=isodate.parse_datetime,
         help='Date and time to start data acquisition.'
     )
+    nanny_parser.add_argument(
+        '--output-format',
+        choices=['hdf5', 'parquet'],
+        help='File format of the output. Parquet requires pyarrow.'
+    )
+    nanny_parser.add_argument(
+        '--complib',
+        type=str,
+        help=('Compression library of the output, e.g. blosc:lz4, '
+              'blosc:zstd or zlib.')
+    )
+    nanny_parser.add_argument(
+        '--complevel',
+        type=int,
+        help='Compression level of the output, 0-9.'
+    )
+    nanny_parser.add_argument(
+        '--expected-rows',
+        type=int,
+        help='Expected rows per device, used by PyTables to size chunks.'
+    )
+    nanny_parser.add_argument(
+        '--chunkshape',
+        type=int,
+        help='Rows per HDF5 chunk. Rewrites the file after acquisition.'
+    )
+    nanny_parser.add_argument(
+        '--device-flush-bytes',
+        type=int,
+        help=('Buffered bytes of one device that trigger a write to the '
+              'output file. 0 disables.')
+    )
+    nanny_parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='Use the built-in DPM simulator instead of DPM.'
+    )
+    nanny_parser.add_argument(
+        '--retries',
+        type=int,
+        help=('Times devices with a status or without a final reply are '
+              'requested again. Defaults to 2.')
+    )
+    nanny_parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        help='Seconds before the first retry, doubled for each following.'
+    )
+    nanny_parser.add_argument(
+        '--record',
+        type=str,
+        help='Directory the raw reply stream of each window is logged to.'
+    )
+    nanny_parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=('Profile acquisition, event processing and writing of each '
+              'window and print the top functions.')
+    )
+    nanny_parser.add_argument(
+        '--profile-output',
+        type=str,
+        help='Directory the profiles of each window are written to.'
+    )
+    nanny_parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='Also write the top memory allocations of each window.'
+    )
+    nanny_parser.add_argument(
+        '--metrics-file',
+        type=str,
+        help=('Prometheus textfile collector file (.prom) the totals of '
+              'each window are written to.')
+    )
+    nanny_parser.add_argument(
+        '--metrics-log',
+        type=str,
+        help='JSON lines file each window appends its device metrics to.'
+    )
+    nanny_parser.add_argument(
+        '--flush-bytes',
+        type=int,
+        help=('Buffered bytes of all devices that trigger writing the '
+              'largest buffers. 0 disables.')
+    )
+    nanny_parser.add_argument(
+        '--shards',
+        type=int,
+        help='Number of concurrent DPM contexts the device list is split into.'
+    )
+    nanny_parser.add_argument(
+        '--dpm-nodes',
+        nargs='+',
+        type=str,
+        help='DPM nodes to spread the device list over.'
+    )
+    nanny_parser.add_argument(
+        '--balance',
+        choices=['rows', 'bytes', 'seconds', 'none'],
+        help=('Cost from the history of each device the shards are '
+              'balanced by. Defaults to rows, none splits the list in '
+              'order.')
+    )
     dump_parser.add_argument(
         '-i',
         '--input-file',
@@ -100,6 +276,27 @@ def main():
         default=Path('dump_output.txt'),
         help='Text output of binary dump.'
     )
+    dump_parser.add_argument(
+        '--keys',
+        nargs='+',
+        help='Only dump keys matching these glob patterns, e.g. "G:*".'
+    )
+    dump_parser.add_argument(
+        '--head',
+        type=int,
+        help='Only dump the first rows of each key.'
+    )
+    dump_parser.add_argument(
+        '--tail',
+        type=int,
+        help='Only dump the last rows of each key.'
+    )
+    dump_parser.add_argument(
+        '--stats',
+        action='store_true',
+        help=('Dump count, min, max, mean, first and last timestamp of each '
+              'key instead of its rows.')
+    )
     validate_parser.add_argument(
         'validate-path',
         nargs='?',
@@ -107,6 +304,184 @@ def main():
         default=Path('.'),
         help='Directory of nanny output.'
     )
+    validate_parser.add_argument(
+        '--workers',
+        type=int,
+        help='Processes validating files. Defaults to the number of CPUs.'
+    )
+    validate_parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Validate files that passed before and are unchanged, too.'
+    )
+    validate_parser.add_argument(
+        '--report',
+        type=str,
+        help='Write a JSON report to this file, - prints it instead.'
+    )
+
+    catalog_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny.'
+    )
+    gaps_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny.'
+    )
+    gaps_parser.add_argument(
+        '--start-time',
+        type=isodate.parse_datetime,
+        help='Start of the range to check, e.g. 20200101T000000.'
+    )
+    gaps_parser.add_argument(
+        '--end-time',
+        type=isodate.parse_datetime,
+        help='End of the range to check. Defaults to the newest file.'
+    )
+    gaps_parser.add_argument(
+        '--duration',
+        type=str,
+        help='Window duration, e.g. T1H. Defaults to the config duration.'
+    )
+    repair_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny.'
+    )
+    repair_parser.add_argument(
+        '-r',
+        '--requests-list',
+        type=str,
+        help='Input file with line separated DRF requests'
+    )
+    repair_parser.add_argument(
+        '-l',
+        '--list-version',
+        type=str,
+        help='List version of the files to repair'
+    )
+    repair_parser.add_argument(
+        '--staging',
+        type=Path,
+        help='Directory for files being repaired. Defaults to .staging.'
+    )
+    repair_parser.add_argument(
+        '--start-time',
+        type=isodate.parse_datetime,
+        help='Only repair files after this time, e.g. 20200101T000000.'
+    )
+    repair_parser.add_argument(
+        '--end-time',
+        type=isodate.parse_datetime,
+        help='Only repair files before this time.'
+    )
+    repair_parser.add_argument(
+        '--retries',
+        type=int,
+        help='Times devices without a final reply are requested again.'
+    )
+    plan_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny, whose catalog holds the costs.'
+    )
+    plan_parser.add_argument(
+        '--shards',
+        type=int,
+        help='Number of DPM contexts. Defaults to the config.'
+    )
+    plan_parser.add_argument(
+        '--dpm-nodes',
+        nargs='+',
+        type=str,
+        help='DPM nodes. Defaults to the config.'
+    )
+    plan_parser.add_argument(
+        '--balance',
+        choices=['rows', 'bytes', 'seconds', 'none'],
+        help='Cost the shards are balanced by. Defaults to rows.'
+    )
+    plan_parser.add_argument(
+        '--duration',
+        type=str,
+        help='Window duration, e.g. T1H. Defaults to the config duration.'
+    )
+    export_parser.add_argument(
+        'export-path',
+        type=Path,
+        help='Directory of the export, extended if it exists.'
+    )
+    export_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny.'
+    )
+    export_parser.add_argument(
+        '--start-time',
+        type=isodate.parse_datetime,
+        help='Start of the range to export. Defaults to the oldest file.'
+    )
+    export_parser.add_argument(
+        '--end-time',
+        type=isodate.parse_datetime,
+        help='End of the range to export. Defaults to the newest file.'
+    )
+    export_parser.add_argument(
+        '--devices',
+        nargs='+',
+        type=str,
+        help='DRF requests to export. Defaults to all.'
+    )
+    compact_parser.add_argument(
+        '-o',
+        '--output-path',
+        type=Path,
+        help='Output directory of nanny.'
+    )
+    compact_parser.add_argument(
+        '--staging',
+        type=Path,
+        help='Directory for archives being written. Defaults to .staging.'
+    )
+    compact_parser.add_argument(
+        '--period',
+        choices=list(compact.PERIODS),
+        help='Period of each archive. Defaults to day.'
+    )
+    compact_parser.add_argument(
+        '--start-time',
+        type=isodate.parse_datetime,
+        help='Only compact periods after this time, e.g. 20200101T000000.'
+    )
+    compact_parser.add_argument(
+        '--end-time',
+        type=isodate.parse_datetime,
+        help='Only compact periods before this time.'
+    )
+    compact_parser.add_argument(
+        '--complib',
+        type=str,
+        help=('Compression library of the archives. Defaults to '
+              f'{compact.COMPLIB}.')
+    )
+    compact_parser.add_argument(
+        '--complevel',
+        type=int,
+        help=('Compression level of the archives. Defaults to '
+              f'{compact.COMPLEVEL}.')
+    )
+    compact_parser.add_argument(
+        '--delete',
+        action='store_true',
+        help='Delete the compacted files once the archive is verified.'
+    )
 
     args = parser.parse_args()
     # Filter None values from Namespace
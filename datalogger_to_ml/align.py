@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+import logging
+import numpy as np
+from . import reader
+from . import storage
+from .dpm_data import local_to_utc_ms
+
+logger = logging.getLogger(__name__)
+
+MODES = ('last', 'linear', 'mean')
+
+
+class _Aligner:
+    # Accumulates chunks of one device onto the grid
+    # start_us + k * period_us, k < rows. Chunks must arrive in time order.
+
+    def __init__(self, column, start_us, period_us, mode):
+        self.column = column
+        self.start_us = start_us
+        self.period_us = period_us
+        self.mode = mode
+        self.previous = None
+
+        if mode == 'mean':
+            self.sums = np.zeros(len(column))
+            self.counts = np.zeros(len(column))
+
+    def _grid_range(self, first_us, last_us):
+        # Grid indexes k with first_us <= t_k <= last_us
+        first = max(0, -(-(first_us - self.start_us) // self.period_us))
+        last = min(len(self.column) - 1,
+                   (last_us - self.start_us) // self.period_us)
+
+        return first, last + 1
+
+    def add(self, timestamps, values):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        values = values[order].astype(np.float64)
+
+        if self.mode == 'mean':
+            bins = (timestamps - self.start_us) // self.period_us
+            keep = (bins >= 0) & (bins < len(self.column))
+            bins = bins[keep]
+            values = values[keep]
+
+            if len(bins) == 0:
+                return
+
+            offset = bins[0]
+            local_bins = bins - offset
+            end = offset + local_bins[-1] + 1
+            self.sums[offset:end] += np.bincount(local_bins, weights=values)
+            self.counts[offset:end] += np.bincount(local_bins)
+            return
+
+        # Interpolation and carrying need the last sample of the chunk before
+        if self.previous is not None:
+            timestamps = np.concatenate(([self.previous[0]], timestamps))
+            values = np.concatenate(([self.previous[1]], values))
+
+        self.previous = (timestamps[-1], values[-1])
+        first, end = self._grid_range(timestamps[0], timestamps[-1])
+
+        if first >= end:
+            return
+
+        grid = self.start_us + np.arange(first, end) * self.period_us
+
+        if self.mode == 'linear':
+            self.column[first:end] = np.interp(grid, timestamps, values)
+        else:
+            positions = np.searchsorted(timestamps, grid, side='right') - 1
+            self.column[first:end] = values[positions]
+
+    def finish(self):
+        if self.mode == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.column[:] = self.sums / self.counts
+        elif self.mode == 'last' and self.previous is not None:
+            # Carry the last sample to the end of the grid
+            first, _ = self._grid_range(self.previous[0], self.previous[0])
+            self.column[first:] = self.previous[1]
+
+
+def align_chunks(chunks, devices, start_us, end_us, period_us, mode='last'):
+    # Builds a dense (time x device) float matrix from (device, DataFrame)
+    # chunks. Grid points without data are NaN. Modes:
+    #   last: value of the last sample at or before the grid point
+    #   linear: interpolated between the samples around the grid point
+    #   mean: mean of the samples in [t_k, t_k + period)
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode {mode}. Use one of {", ".join(MODES)}.')
+
+    rows = max(0, -(-(end_us - start_us) // period_us))
+    grid = start_us + np.arange(rows, dtype=np.int64) * period_us
+    matrix = np.full((rows, len(devices)), np.nan)
+    columns = {device: index for index, device in enumerate(devices)}
+    aligners = {}
+
+    for device, chunk in chunks:
+        if device not in columns or len(chunk) == 0:
+            continue
+
+        if device not in aligners:
+            aligners[device] = _Aligner(
+                matrix[:, columns[device]],
+                start_us,
+                period_us,
+                mode
+            )
+
+        aligners[device].add(
+            chunk['Timestamps'].to_numpy(dtype=np.int64),
+            chunk['Data'].to_numpy()
+        )
+
+    for aligner in aligners.values():
+        aligner.finish()
+
+    return grid, matrix
+
+
+def _period_us(period):
+    return int(period.total_seconds() * 1000000)
+
+
+def align(
+    output_path,
+    devices,
+    start_time,
+    end_time,
+    period,
+    mode='last',
+    chunksize=reader.CHUNKSIZE
+):
+    # Aligns nanny output in [start_time, end_time) onto a grid of `period`.
+    # Returns UTC microsecond grid timestamps and the (time x device) matrix.
+    start_us = local_to_utc_ms(start_time) * 1000
+    end_us = local_to_utc_ms(end_time) * 1000
+    chunks = reader.read(output_path, devices, start_time, end_time,
+                         chunksize)
+
+    return align_chunks(chunks, devices, start_us, end_us,
+                        _period_us(period), mode)
+
+
+def aligned_path(path):
+    # Companion file written next to a raw output file
+    path = Path(path)
+
+    return path.with_name(f'{path.name.split(".")[0]}.aligned.npz')
+
+
+def align_file(
+    path,
+    start_time,
+    duration,
+    period,
+    mode='last',
+    devices=None,
+    chunksize=reader.CHUNKSIZE
+):
+    # Writes the aligned matrix of one output file next to it
+    start_us = local_to_utc_ms(start_time) * 1000
+    end_us = local_to_utc_ms(start_time + duration) * 1000
+
+    with storage.open_store(path, mode='r') as store:
+        if devices is None:
+            devices = [key.lstrip('/') for key in store.keys()]
+
+        keys = set(store.keys())
+        chunks = (
+            (device, chunk)
+            for device in devices
+            if f'/{device}' in keys
+            for chunk in store.iter_chunks(f'/{device}', chunksize)
+        )
+        grid, matrix = align_chunks(chunks, devices, start_us, end_us,
+                                    _period_us(period), mode)
+
+    output_path = aligned_path(path)
+    np.savez(
+        output_path,
+        timestamps=grid,
+        matrix=matrix,
+        devices=np.array(devices)
+    )
+    logger.debug('Wrote aligned companion %s', output_path)
+
+    return output_path
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+from pathlib import PurePath
+from datetime import datetime
+from datetime import timedelta
+import hashlib
+import logging
+import sqlite3
+import isodate
+from . import layout
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = '.catalog.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    duration TEXT NOT NULL,
+    list_version TEXT,
+    size INTEGER,
+    rows INTEGER,
+    devices INTEGER,
+    checksum TEXT,
+    recorded TEXT,
+    archive INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_start ON files (start);
+CREATE INDEX IF NOT EXISTS files_end ON files (end);
+CREATE TABLE IF NOT EXISTS device_rows (
+    path TEXT NOT NULL,
+    device TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    PRIMARY KEY (path, device)
+);
+CREATE TABLE IF NOT EXISTS device_costs (
+    device TEXT PRIMARY KEY,
+    rows REAL NOT NULL,
+    bytes REAL NOT NULL,
+    seconds REAL NOT NULL,
+    windows INTEGER NOT NULL,
+    updated TEXT
+);
+'''
+
+# Weight of the newest window in the moving average of device costs
+COST_SMOOTHING = 0.3
+COSTS = ('rows', 'bytes', 'seconds')
+
+
+def catalog_path(output_path):
+    return Path(output_path).joinpath(CATALOG_FILENAME)
+
+
+def connect(output_path):
+    connection = sqlite3.connect(catalog_path(output_path))
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    columns = {
+        row['name'] for row in connection.execute('PRAGMA table_info(files)')
+    }
+
+    # Catalogs from before compaction have no archive flag
+    if 'archive' not in columns:
+        with connection:
+            connection.execute(
+                'ALTER TABLE files ADD COLUMN '
+                'archive INTEGER NOT NULL DEFAULT 0'
+            )
+            connection.execute(
+                'UPDATE files SET archive = 1 WHERE path LIKE ?',
+                (f'{layout.ARCHIVE_DIRECTORY}/%',)
+            )
+
+    return connection
+
+
+def is_archive(relative_path):
+    return PurePath(relative_path).parts[0] == layout.ARCHIVE_DIRECTORY
+
+
+def parse_output_filename(filename):
+    # e.g. 20200101T000000PT1H-1_0_0.h5 -> (start, duration, '1_0_0'),
+    # any output format extension works
+    # Raises ValueError for names that don't follow the convention.
+    stem = PurePath(filename).name.split('.')[0]
+    date_time_duration_str, _, list_version = stem.partition('-')
+    date_time_str, duration_str = date_time_duration_str.split('P')
+    start_time = isodate.parse_datetime(date_time_str)
+    duration = isodate.parse_duration(f'P{duration_str}')
+
+    return start_time, duration, list_version
+
+
+def file_checksum(path, block_size=1048576):
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file_handle:
+        for block in iter(lambda: file_handle.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def count_rows(path):
+    with storage.open_store(path, mode='r') as store:
+        return {key.lstrip('/'): store.nrows(key) for key in store.keys()}
+
+
+def record_file(connection, output_path, path):
+    path = Path(path)
+    start_time, duration, list_version = parse_output_filename(path.name)
+    device_rows = count_rows(path)
+    relative_path = path.resolve().relative_to(
+        Path(output_path).resolve()
+    ).as_posix()
+
+    with connection:
+        connection.execute(
+            'INSERT OR REPLACE INTO files VALUES '
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                relative_path,
+                start_time.isoformat(),
+                (start_time + duration).isoformat(),
+                isodate.duration_isoformat(duration),
+                list_version,
+                path.stat().st_size,
+                sum(device_rows.values()),
+                len(device_rows),
+                file_checksum(path),
+                datetime.now().isoformat(),
+                int(is_archive(relative_path))
+            )
+        )
+        connection.execute(
+            'DELETE FROM device_rows WHERE path = ?',
+            (relative_path,)
+        )
+        connection.executemany(
+            'INSERT INTO device_rows VALUES (?, ?, ?)',
+            [
+                (relative_path, device, rows)
+                for device, rows in device_rows.items()
+            ]
+        )
+
+    logger.debug('Cataloged %s', relative_path)
+
+
+def remove_files(connection, paths):
+    with connection:
+        connection.executemany(
+            'DELETE FROM files WHERE path = ?',
+            [(path,) for path in paths]
+        )
+        connection.executemany(
+            'DELETE FROM device_rows WHERE path = ?',
+            [(path,) for path in paths]
+        )
+
+
+def latest_file(connection, archives=True):
+    # The file covering the most recent time, answered from the index.
+    # Without archives it is the newest file nanny wrote.
+    return connection.execute(
+        'SELECT * FROM files ' + ('' if archives else 'WHERE archive = 0 ')
+        + 'ORDER BY end DESC, start DESC LIMIT 1'
+    ).fetchone()
+
+
+def recent_volume(connection, count):
+    # Highest rows and bytes per second of the `count` newest nonempty
+    # files, None without any
+    rows = connection.execute(
+        ('SELECT duration, rows, size FROM files WHERE rows > 0 '
+         'ORDER BY end DESC LIMIT ?'),
+        (count,)
+    ).fetchall()
+    rates = []
+
+    for row in rows:
+        duration = isodate.parse_duration(row['duration'])
+
+        # Calendar durations, e.g. P1M, have no fixed length
+        if isinstance(duration, timedelta) and duration.total_seconds() > 0:
+            seconds = duration.total_seconds()
+            rates.append((row['rows'] / seconds, row['size'] / seconds))
+
+    if not rates:
+        return None
+
+    return (
+        max(rows_rate for rows_rate, _ in rates),
+        max(bytes_rate for _, bytes_rate in rates)
+    )
+
+
+def files_between(connection, start_time, end_time, archives=True):
+    # Files overlapping [start_time, end_time), ordered by start
+    return connection.execute(
+        'SELECT * FROM files WHERE start < ? AND end > ? '
+        + ('' if archives else 'AND archive = 0 ') + 'ORDER BY start',
+        (end_time.isoformat(), start_time.isoformat())
+    ).fetchall()
+
+
+def window_of(row):
+    return (
+        isodate.parse_datetime(row['start']),
+        isodate.parse_duration(row['duration'])
+    )
+
+
+def record_costs(connection, window, device_metrics, start_time=None):
+    # Folds the acquisition metrics of one window into the cost history
+    # of each device. Costs are per second of window, so windows of any
+    # duration compare, and seconds are from first to final reply.
+    # Calendar durations, e.g. P1M, get their length from `start_time`.
+    start_time = start_time or datetime.now()
+    window_seconds = ((start_time + window) - start_time).total_seconds()
+    updated = datetime.now().isoformat()
+    costs = []
+
+    for device, metrics in device_metrics.items():
+        if metrics['final_reply_seconds'] is None or \
+                metrics['status'] != 'ok':
+            continue
+
+        seconds = metrics['final_reply_seconds'] - \
+            (metrics['first_reply_seconds'] or 0.0)
+        costs.append((
+            device,
+            metrics['rows'] / window_seconds,
+            metrics.get('bytes', 0) / window_seconds,
+            seconds / window_seconds,
+            updated
+        ))
+
+    with connection:
+        connection.executemany(
+            'INSERT INTO device_costs VALUES (?, ?, ?, ?, 1, ?) '
+            'ON CONFLICT (device) DO UPDATE SET ' + ', '.join(
+                f'{cost} = {cost} + {COST_SMOOTHING} * '
+                f'(excluded.{cost} - {cost})'
+                for cost in COSTS
+            ) + ', windows = windows + 1, updated = excluded.updated',
+            costs
+        )
+
+
+def device_costs(connection, cost='rows'):
+    # Cost per second of window of every device with a history
+    if cost not in COSTS:
+        raise ValueError(f'Unknown cost {cost}. Use one of {", ".join(COSTS)}.')
+
+    return {
+        row['device']: row[cost]
+        for row in connection.execute('SELECT * FROM device_costs')
+    }
+
+
+def rebuild(output_path):
+    file_paths = storage.find_outputs(output_path, recursive=True)
+    connection = connect(output_path)
+
+    with connection:
+        connection.execute('DELETE FROM files')
+        connection.execute('DELETE FROM device_rows')
+
+    recorded = 0
+
+    for file_path in file_paths:
+        try:
+            record_file(connection, output_path, file_path)
+            recorded += 1
+        except ValueError:
+            logger.debug('Ignoring %s for the catalog.', file_path)
+        except OSError as error:
+            logger.error('Could not catalog %s: %s', file_path, error)
+
+    logger.info('Cataloged %s of %s files', recorded, len(file_paths))
+
+    return connection
+
+
+def find_gaps(connection, start_time, end_time, duration):
+    # Start times of the windows on the grid start_time + n * duration,
+    # inside [start_time, end_time), that no file fully covers. A window
+    # that was fetched and came back empty isn't missing, `repair` checks
+    # files for devices without rows. One pass over the files sorted by
+    # start.
+    rows = connection.execute(
+        ('SELECT start, end FROM files '
+         'WHERE start < ? AND end > ? ORDER BY start'),
+        (end_time.isoformat(), start_time.isoformat())
+    ).fetchall()
+
+    # Merge touching and overlapping files into covered intervals
+    covered = []
+
+    for row in rows:
+        file_start = isodate.parse_datetime(row['start'])
+        file_end = isodate.parse_datetime(row['end'])
+
+        if covered and file_start <= covered[-1][1]:
+            covered[-1][1] = max(covered[-1][1], file_end)
+        else:
+            covered.append([file_start, file_end])
+
+    gaps = []
+    index = 0
+    window_start = start_time
+
+    while window_start + duration <= end_time:
+        window_end = window_start + duration
+
+        while index < len(covered) and covered[index][1] <= window_start:
+            index += 1
+
+        if not (index < len(covered)
+                and covered[index][0] <= window_start
+                and covered[index][1] >= window_end):
+            gaps.append(window_start)
+
+        window_start = window_end
+
+    return gaps
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Rolls the files of completed days or months into one archive per period
+# with one indexed, compressed table per device. The sources are streamed
+# into a copy in the staging directory, which is repacked, verified
+# against them and published to archive/YYYYMM. A progress sidecar next
+# to the copy lets an interrupted run continue with the next batch of
+# sources.
+
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+import json
+import logging
+import os
+import isodate
+from . import align
+from . import catalog
+from . import layout
+from . import nanny
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {
+    'day': timedelta(days=1),
+    'month': isodate.Duration(months=1)
+}
+COMPLIB = 'blosc:zstd'
+COMPLEVEL = 5
+# Rows per chunk read from a source
+CHUNKSIZE = 1000000
+# Sources read together, a day of hourly files. Memory holds one chunk at
+# a time.
+BATCH_SOURCES = 24
+PROGRESS_EXTENSION = '.progress'
+
+
+def get_compact_config(args, config):
+    compact_config = {
+        'period': 'day',
+        'complib': COMPLIB,
+        'complevel': COMPLEVEL
+    }
+
+    if 'compact' in config.keys():
+        compact_config.update({
+            key: value for key, value in config['compact'].items()
+            if key in compact_config
+        })
+
+    for key in compact_config:
+        if args.get(key, None) is not None:
+            compact_config[key] = args[key]
+
+    if compact_config['period'] not in PERIODS:
+        raise ValueError(
+            f'Unknown period {compact_config["period"]}. '
+            f'Use one of {", ".join(PERIODS)}.'
+        )
+
+    return compact_config
+
+
+def period_start(time, period):
+    start = datetime(time.year, time.month, time.day)
+
+    if period == 'month':
+        start = start.replace(day=1)
+
+    return start
+
+
+def tile(rows, start_time, end_time):
+    # Paths of the nonempty files that cover [start_time, end_time) end to
+    # end, in time order. Files inside a longer one, e.g. the hours of a
+    # day archive, are left out. None if time is missing or overlapped.
+    windows = []
+
+    for row in rows:
+        file_start, duration = catalog.window_of(row)
+        file_end = file_start + duration
+
+        if row['rows'] and start_time <= file_start and file_end <= end_time:
+            windows.append((file_start, file_end, row['path']))
+
+    # By start, the longest file first
+    windows.sort(key=lambda window: window[1], reverse=True)
+    windows.sort(key=lambda window: window[0])
+    sources = []
+    covered = start_time
+
+    for file_start, file_end, path in windows:
+        if file_end <= covered:
+            continue
+
+        if file_start != covered:
+            return None
+
+        sources.append(path)
+        covered = file_end
+
+    return sources if covered == end_time else None
+
+
+def progress_path(temp_path):
+    temp_path = Path(temp_path)
+
+    return temp_path.with_name(f'{temp_path.name}{PROGRESS_EXTENSION}')
+
+
+def load_progress(path, sources):
+    # Progress of an earlier run over the same sources, empty otherwise
+    try:
+        with open(path, encoding='utf8') as file_handle:
+            progress = json.load(file_handle)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logger.warning('Ignoring unreadable progress %s: %s', path, error)
+        return {}
+
+    if progress.get('sources') != sources:
+        logger.warning('Ignoring progress %s of other sources', path)
+        return {}
+
+    return progress
+
+
+def save_progress(path, progress, store=None):
+    # `store` is flushed first, so the progress never gets ahead of it
+    if store is not None:
+        store.flush()
+
+    path = Path(path)
+    temp_path = path.with_name(f'.{path.name}.tmp')
+
+    with open(temp_path, 'w', encoding='utf8') as file_handle:
+        json.dump(progress, file_handle)
+        file_handle.flush()
+        os.fsync(file_handle.fileno())
+
+    os.replace(temp_path, path)
+
+
+def _batches(sources, size):
+    for start in range(0, len(sources), size):
+        yield sources[start:start + size]
+
+
+def write_archive(
+    output_path,
+    temp_path,
+    sources,
+    progress,
+    complib=COMPLIB,
+    complevel=COMPLEVEL
+):
+    # Appends the sources not done yet, a batch at a time: each key is
+    # streamed from every source of the batch, a chunk at a time, so its
+    # table grows in time order. Before each batch the rows per key are
+    # saved, rows appended after that by an interrupted run are dropped on
+    # resume. Returns the rows per device of the sources.
+    path = progress_path(temp_path)
+    done = list(progress.get('done', []))
+    rows = dict(progress.get('rows', {}))
+    source_rows = dict(progress.get('source_rows', {}))
+
+    if not progress:
+        temp_path.unlink(missing_ok=True)
+
+    with storage.Hdf5Store(
+        temp_path,
+        mode='a',
+        complib=complib,
+        complevel=complevel
+    ) as store:
+        for key in store.keys():
+            store.truncate(key, rows.get(key, 0))
+
+        for batch in _batches(
+            [source for source in sources if source not in done],
+            BATCH_SOURCES
+        ):
+            save_progress(path, {
+                'sources': sources,
+                'done': done,
+                'rows': rows,
+                'source_rows': source_rows
+            }, store)
+            logger.debug('Compacting %s files from %s into %s', len(batch),
+                         batch[0], temp_path.name)
+            source_stores = [
+                storage.open_store(Path(output_path).joinpath(source),
+                                   mode='r')
+                for source in batch
+            ]
+
+            try:
+                source_keys = [
+                    set(source_store.keys()) for source_store in source_stores
+                ]
+
+                for key in sorted(set().union(*source_keys)):
+                    for source_store, keys in zip(source_stores, source_keys):
+                        if key not in keys:
+                            continue
+
+                        device = key.lstrip('/')
+                        source_rows[device] = source_rows.get(device, 0) \
+                            + source_store.nrows(key)
+
+                        for chunk in source_store.iter_chunks(key, CHUNKSIZE):
+                            store.append(key, chunk)
+                            rows[key] = rows.get(key, 0) + len(chunk)
+            finally:
+                for source_store in source_stores:
+                    source_store.close()
+
+            done.extend(batch)
+
+        save_progress(path, {
+            'sources': sources,
+            'done': done,
+            'rows': rows,
+            'source_rows': source_rows
+        }, store)
+
+    storage.repack(temp_path)
+
+    return source_rows
+
+
+def count_source_rows(source_paths):
+    source_rows = {}
+
+    for source_path in source_paths:
+        for device, rows in catalog.count_rows(source_path).items():
+            source_rows[device] = source_rows.get(device, 0) + rows
+
+    return source_rows
+
+
+def verify(archive, source_rows):
+    # Rows per device of the archive must add up to those of the sources
+    expected = {device: rows for device, rows in source_rows.items() if rows}
+    actual = catalog.count_rows(archive)
+    differences = sorted(
+        device for device in set(expected) | set(actual)
+        if expected.get(device, 0) != actual.get(device, 0)
+    )
+
+    if differences:
+        raise ValueError(
+            f'{archive} has other row counts than its sources for '
+            f'{len(differences)} devices, e.g. {differences[0]}'
+        )
+
+
+def delete_sources(connection, output_path, sources):
+    for source in sources:
+        path = Path(output_path).joinpath(source)
+        path.unlink(missing_ok=True)
+        align.aligned_path(path).unlink(missing_ok=True)
+
+    catalog.remove_files(connection, sources)
+    logger.info('Deleted %s compacted files', len(sources))
+
+
+def compact_period(
+    connection,
+    output_path,
+    staging_directory,
+    archive,
+    sources,
+    delete=False,
+    complib=COMPLIB,
+    complevel=COMPLEVEL
+):
+    # Returns whether a new archive was published. An existing archive is
+    # only verified when its sources are to be deleted.
+    output_path = Path(output_path)
+    temp_path = Path(staging_directory).joinpath(archive.name)
+    path = progress_path(temp_path)
+    progress = load_progress(path, sources)
+
+    # Without the staged copy the progress describes nothing, start over
+    if progress and not archive.exists() and not temp_path.exists():
+        logger.warning('Ignoring progress %s, %s is gone', path,
+                       temp_path.name)
+        progress = {}
+
+    source_paths = [output_path.joinpath(source) for source in sources]
+    relative_path = archive.relative_to(output_path).as_posix()
+    published = False
+
+    if not archive.exists():
+        source_rows = write_archive(output_path, temp_path, sources,
+                                    progress, complib, complevel)
+        verify(temp_path, source_rows)
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        storage.publish(temp_path, archive)
+        published = True
+        logger.info('Compacted %s files into %s', len(sources), relative_path)
+    elif delete and not progress.get('verified', False):
+        verify(archive, count_source_rows(source_paths))
+
+    if not connection.execute(
+        'SELECT path FROM files WHERE path = ?',
+        (relative_path,)
+    ).fetchone():
+        catalog.record_file(connection, output_path, archive)
+
+    # Once verified, a deletion cut short continues without the deleted
+    if delete:
+        save_progress(path, {'sources': sources, 'verified': True})
+        delete_sources(connection, output_path, sources)
+
+    path.unlink(missing_ok=True)
+
+    return published
+
+
+def compact_range(
+    output_path,
+    staging_directory,
+    start_time=None,
+    end_time=None,
+    period='day',
+    delete=False,
+    complib=COMPLIB,
+    complevel=COMPLEVEL
+):
+    # Compacts every period in [start_time, end_time) that is complete:
+    # it ends before the newest file and one list version covers it
+    # without gaps. Returns the archives published.
+    output_path = Path(output_path)
+    duration = PERIODS[period]
+    connection = nanny.open_catalog(output_path)
+    latest = catalog.latest_file(connection)
+
+    if latest is None:
+        connection.close()
+        return []
+
+    latest_end = isodate.parse_datetime(latest['end'])
+    end_time = min(end_time or latest_end, latest_end)
+    start_time = start_time or datetime.min
+    groups = {}
+
+    for row in catalog.files_between(connection, start_time, end_time):
+        file_start, _ = catalog.window_of(row)
+        groups.setdefault(
+            (period_start(file_start, period), row['list_version']),
+            []
+        ).append(row)
+
+    archives = []
+
+    for (start, list_version), rows in sorted(groups.items()):
+        if start < start_time or start + duration > end_time:
+            continue
+
+        archive = layout.create_archive_path(output_path, start).joinpath(
+            layout.get_output_filename(start, duration, list_version)
+        )
+        relative_path = archive.relative_to(output_path).as_posix()
+        sources = tile(
+            [row for row in rows if row['path'] != relative_path],
+            start,
+            start + duration
+        )
+
+        if sources is None:
+            logger.debug('Skipping %s, its files are not complete.',
+                         archive.name)
+            continue
+
+        try:
+            if compact_period(connection, output_path, staging_directory,
+                              archive, sources, delete, complib, complevel):
+                archives.append(archive)
+        except ValueError as error:
+            logger.error('Could not compact %s: %s', archive.name, error)
+
+    connection.close()
+
+    return archives
+
+
+def compact(**kwargs):
+    config = nanny.load_config()
+    nanny.config_logging(nanny.get_log_level(kwargs, config) or 'DEBUG')
+    output_path = nanny.get_output_path(kwargs, config) or Path('.')
+    staging_directory = nanny.get_staging_path(kwargs, config, output_path)
+    compact_config = get_compact_config(kwargs, config)
+    start_time = kwargs.get('start-time', kwargs.get('start_time', None))
+    end_time = kwargs.get('end-time', kwargs.get('end_time', None))
+    delete = kwargs.get('delete', False)
+
+    archives = compact_range(
+        output_path,
+        staging_directory,
+        start_time,
+        end_time,
+        delete=delete,
+        **compact_config
+    )
+    print(f'Compacted {len(archives)} {compact_config["period"]}s into '
+          f'{Path(output_path).joinpath(layout.ARCHIVE_DIRECTORY)}')
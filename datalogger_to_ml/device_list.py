@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+import json
+import logging
+import os
+import re
+import tempfile
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OWNER = 'fermi-ad'
+DEFAULT_REPO = 'linac-logger-device-cleaner'
+DEFAULT_FILE = 'linac_logger_drf_requests.txt'
+DEFAULT_CACHE = '.device_list_cache'
+# How long a checked release is trusted before GitHub is asked again
+DEFAULT_TTL = timedelta(hours=1)
+# Seconds to wait for GitHub before falling back to the cache
+DEFAULT_TIMEOUT = 10
+
+API_URL = 'https://api.github.com'
+DOWNLOAD_URL = 'https://github.com'
+
+_session = None
+
+
+def get_session():
+    # One pooled session per process, connections are reused between calls
+    global _session
+
+    if _session is None:
+        _session = requests.Session()
+        _session.mount('https://', HTTPAdapter(pool_maxsize=4))
+        _session.mount('http://', HTTPAdapter(pool_maxsize=4))
+
+    return _session
+
+
+def parse_device_list(text):
+    return [line.strip()  # Trim whitespace
+            for line in text.split('\n')
+            if line.strip()]  # Remove blank lines
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf8') as file_handle:
+            return json.load(file_handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, text):
+    # Concurrent nanny processes can share a cache, readers never see a
+    # partial file. Each writer has its own temporary file, which is
+    # removed if the write fails.
+    temp_path = None
+
+    try:
+        with tempfile.NamedTemporaryFile(
+            'w',
+            encoding='utf8',
+            dir=path.parent,
+            prefix=f'.{path.name}.',
+            suffix='.tmp',
+            delete=False
+        ) as file_handle:
+            temp_path = Path(file_handle.name)
+            file_handle.write(text)
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+
+        raise
+
+
+class DeviceListProvider:
+    # The device list of the latest release of a GitHub repo. Release
+    # metadata is revalidated with ETag/If-Modified-Since at most once per
+    # TTL, and the list of each release is downloaded once and kept on
+    # disk. When GitHub is slow or down, the cached release is used.
+
+    def __init__(
+        self,
+        owner=DEFAULT_OWNER,
+        repo=DEFAULT_REPO,
+        file_name=DEFAULT_FILE,
+        cache_directory=DEFAULT_CACHE,
+        ttl=DEFAULT_TTL,
+        timeout=DEFAULT_TIMEOUT,
+        api_url=API_URL,
+        download_url=DOWNLOAD_URL,
+        session=None
+    ):
+        self.owner = owner
+        self.repo = repo
+        self.file_name = file_name
+        self.cache_directory = Path(cache_directory).joinpath(owner, repo)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.api_url = api_url.rstrip('/')
+        self.download_url = download_url.rstrip('/')
+        self._session = session
+
+    @property
+    def session(self):
+        return self._session or get_session()
+
+    @property
+    def _release_path(self):
+        return self.cache_directory.joinpath('release.json')
+
+    def _list_path(self, tag):
+        # Release tags can contain slashes
+        tag = re.sub(r'[^A-Za-z0-9._-]+', '_', tag)
+
+        return self.cache_directory.joinpath(tag, self.file_name)
+
+    def _get(self, url, headers=None):
+        try:
+            return self.session.get(url, headers=headers,
+                                    timeout=self.timeout)
+        except requests.RequestException as error:
+            logger.warning('Could not fetch %s: %s', url, error)
+            return None
+
+    def latest_release(self):
+        # Returns {'name', 'tag', ...} of the latest release or None
+        cached = _read_json(self._release_path)
+        now = datetime.now()
+
+        if cached is not None and \
+                now - datetime.fromisoformat(cached['checked']) < self.ttl:
+            return cached
+
+        headers = {}
+
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        url = (f'{self.api_url}/repos/{self.owner}/{self.repo}/'
+               'releases/latest')
+        response = self._get(url, headers)
+
+        if response is not None and \
+                response.status_code == requests.codes.get('not_modified') \
+                and cached is not None:
+            logger.debug('Release of %s/%s is unchanged.',
+                         self.owner, self.repo)
+            release = cached
+        elif response is not None and \
+                response.status_code == requests.codes.get('ok'):
+            body = response.json()
+            release = {
+                'name': body['name'],
+                'tag': body['tag_name'],
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+        elif cached is not None:
+            logger.warning('Using the cached release %s of %s/%s.',
+                           cached['name'], self.owner, self.repo)
+            # Try again on the next call rather than after a TTL
+            return cached
+        else:
+            return None
+
+        release['checked'] = now.isoformat()
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self._release_path, json.dumps(release))
+
+        return release
+
+    def latest_version(self):
+        release = self.latest_release()
+
+        return None if release is None else release['name']
+
+    def device_list(self, release=None):
+        # Release assets don't change, a cached list is never fetched again
+        release = release or self.latest_release()
+
+        if release is None:
+            return None
+
+        list_path = self._list_path(release['tag'])
+
+        if list_path.exists():
+            with open(list_path, encoding='utf8') as file_handle:
+                return parse_device_list(file_handle.read())
+
+        url = (f'{self.download_url}/{self.owner}/{self.repo}/'
+               f'releases/download/{release["tag"]}/{self.file_name}')
+        response = self._get(url)
+
+        if response is None or \
+                response.status_code != requests.codes.get('ok'):
+            return None
+
+        list_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(list_path, response.text)
+
+        return parse_device_list(response.text)
+
+    def fetch(self):
+        # (version, device list) of the same release, either can be None
+        release = self.latest_release()
+
+        if release is None:
+            return None, None
+
+        return release['name'], self.device_list(release)
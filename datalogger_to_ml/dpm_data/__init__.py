@@ -5,6 +5,7 @@ from .dpm_data import local_to_utc_ms
 from .dpm_data import get_data
 from .dpm_data import compare_hdf_device_list
 from .dpm_data import generate_data_source
+from .dpm_data import pack_device_list
 
 # https://packaging.python.org/guides/single-sourcing-package-version/#single-sourcing-the-version
 try:
@@ -25,5 +26,6 @@ __all__ = [
     'local_to_utc_ms',
     'get_data',
     'compare_hdf_device_list',
-    'generate_data_source'
+    'generate_data_source',
+    'pack_device_list'
 ]
@@ -84,6 +84,120 @@ if __name__ == '__main__':
         required=False,
         type=str
     )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        help='Number of concurrent DPM contexts the device list is split into.'
+    )
+    parser.add_argument(
+        '--dpm-nodes',
+        nargs='+',
+        type=str,
+        help='DPM nodes to spread the device list over.'
+    )
+    parser.add_argument(
+        '--output-format',
+        choices=['hdf5', 'parquet'],
+        help='File format of the output. Parquet requires pyarrow.'
+    )
+    parser.add_argument(
+        '--complib',
+        type=str,
+        help=('Compression library of the output, e.g. blosc:lz4, '
+              'blosc:zstd or zlib.')
+    )
+    parser.add_argument(
+        '--complevel',
+        type=int,
+        help='Compression level of the output, 0-9.'
+    )
+    parser.add_argument(
+        '--expected-rows',
+        type=int,
+        help='Expected rows per device, used by PyTables to size chunks.'
+    )
+    parser.add_argument(
+        '--chunkshape',
+        type=int,
+        help='Rows per HDF5 chunk. Rewrites the file after acquisition.'
+    )
+    parser.add_argument(
+        '--device-flush-bytes',
+        type=int,
+        help=('Buffered bytes of one device that trigger a write to the '
+              'output file. 0 disables.')
+    )
+    parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='Use the built-in DPM simulator instead of DPM.'
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        help=('Times devices with a status or without a final reply are '
+              'requested again. Defaults to 2.')
+    )
+    parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        help='Seconds before the first retry, doubled for each following.'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=('Continue an output file left by an interrupted run with the '
+              'devices its checkpoint lacks.')
+    )
+    parser.add_argument(
+        '--record',
+        type=str,
+        help=('Write the raw reply stream to this binary log, or to '
+              '<output file name>.replies in this directory.')
+    )
+    parser.add_argument(
+        '--replay',
+        type=str,
+        help='Replay a recorded reply log instead of requesting DPM.'
+    )
+    parser.add_argument(
+        '--realtime',
+        action='store_true',
+        help='Replay at the pace the log was recorded.'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=('Profile acquisition, event processing and writing of each '
+              'window and print the top functions.')
+    )
+    parser.add_argument(
+        '--profile-output',
+        type=str,
+        help='Directory the profiles of each window are written to.'
+    )
+    parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='Also write the top memory allocations of each window.'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        type=str,
+        help=('Prometheus textfile collector file (.prom) the totals of '
+              'each window are written to.')
+    )
+    parser.add_argument(
+        '--metrics-log',
+        type=str,
+        help='JSON lines file each window appends its device metrics to.'
+    )
+    parser.add_argument(
+        '--flush-bytes',
+        type=int,
+        help=('Buffered bytes of all devices that trigger writing the '
+              'largest buffers. 0 disables.')
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
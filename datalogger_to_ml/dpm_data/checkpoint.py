@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Sidecar of a temporary output listing the devices whose data is complete
+# in it, so an interrupted window can resume with the remaining devices.
+# Devices that only wrote part of their data are found in the output
+# itself, they continue after their newest timestamp.
+
+from pathlib import Path
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.checkpoint'
+# Seconds between writes. A device completed after the last write is
+# requested again on resume, which only costs time.
+INTERVAL = 10.0
+
+
+def checkpoint_path(output_file):
+    output_file = Path(output_file)
+
+    return output_file.with_name(f'{output_file.name}{EXTENSION}')
+
+
+class Checkpoint:
+    # `store` is flushed before every write, so a device is never listed
+    # before its data is on disk
+
+    def __init__(self, output_file, data_source, store=None, done=(),
+                 interval=INTERVAL):
+        self.path = checkpoint_path(output_file)
+        self.data_source = data_source
+        self.store = store
+        self.interval = interval
+        self.devices = set(done)
+        self._saved = time.monotonic()
+
+    def done(self, device):
+        self.devices.add(device)
+
+        if time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+    def save(self):
+        if self.store is not None:
+            self.store.flush()
+
+        temp_path = self.path.with_name(f'.{self.path.name}.tmp')
+
+        with open(temp_path, 'w', encoding='utf8') as file_handle:
+            json.dump({
+                'data_source': self.data_source,
+                'done': sorted(self.devices)
+            }, file_handle)
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+
+        os.replace(temp_path, self.path)
+        self._saved = time.monotonic()
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def load(output_file, data_source):
+    # Devices complete in output_file, None without a checkpoint for this
+    # data source. Relative data sources can't be resumed.
+    path = checkpoint_path(output_file)
+
+    if not data_source.startswith('LOGGER:') or not path.exists():
+        return None
+
+    try:
+        with open(path, encoding='utf8') as file_handle:
+            checkpoint = json.load(file_handle)
+    except (OSError, ValueError) as error:
+        logger.warning('Ignoring unreadable checkpoint %s: %s', path, error)
+        return None
+
+    if checkpoint.get('data_source') != data_source:
+        logger.warning('Ignoring checkpoint %s of another window', path)
+        return None
+
+    return set(checkpoint.get('done', []))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+INITIAL_CAPACITY = 1024
+
+
+class DeviceBuffer:
+    # Accumulates the replies of a single device in growable columns.
+    # Capacity doubles when full so appending n rows costs O(n) overall
+    # instead of copying the whole frame on every reply.
+
+    def __init__(self, initial_capacity=INITIAL_CAPACITY):
+        self._initial_capacity = max(1, initial_capacity)
+        self._timestamps = None
+        self._data = None
+        self._size = 0
+        # Rows already handed out by `flush` so indexes keep counting
+        self.rows_flushed = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        # Allocated, not filled, bytes so flush thresholds bound memory
+        if self._data is None:
+            return 0
+
+        return self._timestamps.nbytes + self._data.nbytes
+
+    def _reserve(self, capacity, dtype):
+        if self._data is None:
+            size = max(self._initial_capacity, capacity)
+            self._timestamps = np.empty(size, dtype=np.int64)
+            self._data = np.empty(size, dtype=dtype)
+            return
+
+        if dtype != self._data.dtype:
+            self._data = self._data.astype(dtype)
+
+        if capacity <= len(self._data):
+            return
+
+        size = len(self._data)
+
+        while size < capacity:
+            size *= 2
+
+        timestamps = np.empty(size, dtype=np.int64)
+        timestamps[:self._size] = self._timestamps[:self._size]
+        data = np.empty(size, dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._timestamps = timestamps
+        self._data = data
+
+    def extend(self, micros, data):
+        count = len(data)
+
+        if count == 0:
+            return
+
+        values = np.asarray(data)
+
+        # Array devices reply with one array per timestamp
+        if values.ndim != 1:
+            values = np.empty(count, dtype=object)
+            values[:] = list(data)
+
+        dtype = values.dtype
+
+        if self._data is not None:
+            dtype = np.result_type(self._data.dtype, values.dtype)
+
+        end = self._size + count
+        self._reserve(end, dtype)
+        self._timestamps[self._size:end] = micros
+        self._data[self._size:end] = values
+        self._size = end
+
+    def to_data_frame(self):
+        # Builds a single frame from the filled part of the columns.
+        if self._size == 0:
+            return None
+
+        return pd.DataFrame(
+            data={
+                'Timestamps': self._timestamps[:self._size],
+                'Data': self._data[:self._size]
+            },
+            index=pd.RangeIndex(
+                self.rows_flushed,
+                self.rows_flushed + self._size
+            )
+        )
+
+    def flush(self):
+        # Hands out the buffered rows and releases the columns, a device
+        # doesn't hold on to its peak capacity between flushes
+        data_frame = self.to_data_frame()
+        self.rows_flushed += self._size
+        self._timestamps = None
+        self._data = None
+        self._size = 0
+
+        return data_frame
+
+    def clear(self):
+        self._timestamps = None
+        self._data = None
+        self._size = 0
+        self.rows_flushed = 0
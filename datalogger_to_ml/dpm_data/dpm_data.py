@@ -1,18 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import contextlib
 import datetime
+import heapq
 import logging
 import sys
 import warnings
 import os
 from pathlib import Path
 import signal
-import pandas as pd
+import time
 import acsys.dpm
+import numpy as np
 import pytz
 from backports.datetime_fromisoformat import MonkeyPatch
-import requests
+from .device_buffer import DeviceBuffer
+from . import checkpoint
+from . import reply_log
+from . import simulator
+from .metrics import AcquisitionMetrics
+from ..profiling import PROFILE_OUTPUT
+from ..profiling import Profiler
+from .. import device_list
+from .. import storage
 
 MonkeyPatch.patch_fromisoformat()
 
@@ -24,12 +36,61 @@ acsys_log.setLevel(logging.DEBUG)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+# Buffered replies are appended to the output once these sizes are reached.
+# A value of 0 keeps everything in memory until a device finishes.
+DEVICE_FLUSH_BYTES = 64 * 1024 * 1024  # 64 MiB
+TOTAL_FLUSH_BYTES = 512 * 1024 * 1024  # 512 MiB
+# Devices with a status or no final reply are requested again this many
+# times, waiting RETRY_BACKOFF seconds before the first retry and twice as
+# long before each following one
+RETRIES = 2
+RETRY_BACKOFF = 1.0
+
 
 def _signal_handler(signal_num, _):
     logger.warning('Signal handler called with signal %s', signal_num)
     sys.exit(130)
 
 
+def _cancel_on_signals(get_logger_data):
+    # While acquiring, signals cancel the request on the event loop instead
+    # of exiting wherever the loop waits for DPM. The contexts then flush
+    # what they buffered and the checkpoint is written before the output
+    # is closed.
+    async def _get_logger_data(con):
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        received = []
+        registered = []
+
+        def _cancel(signal_num):
+            logger.warning('Signal handler called with signal %s', signal_num)
+            received.append(signal_num)
+            task.cancel()
+
+        for signal_num in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_num, _cancel, signal_num)
+                registered.append(signal_num)
+            except (NotImplementedError, RuntimeError):
+                # E.g. not the main thread, the exiting handler stays
+                pass
+
+        try:
+            return await get_logger_data(con)
+        except asyncio.CancelledError:
+            if received:
+                sys.exit(130)
+
+            raise
+        finally:
+            for signal_num in registered:
+                loop.remove_signal_handler(signal_num)
+                signal.signal(signal_num, _signal_handler)
+
+    return _get_logger_data
+
+
 def local_to_utc_ms(date):
     utc_datetime_obj = date.astimezone(pytz.utc)
     time_in_ms = int(utc_datetime_obj.timestamp() * 1000)
@@ -66,19 +127,96 @@ def compare_hdf_device_list(hdf, device_list, status_replies):
     return True
 
 
-def _create_data_processor(device_list, hdf):
-    data_done = [None] * len(device_list)
+def _create_data_processor(
+    device_list,
+    hdf,
+    device_flush_bytes=DEVICE_FLUSH_BYTES,
+    total_flush_bytes=TOTAL_FLUSH_BYTES,
+    data_done=None,
+    metrics=None,
+    profiler=None,
+    last_written=None,
+    resume_after=None,
+    window_checkpoint=None
+):
+    # Callers may pass their own status list to inspect it after a
+    # stream that ended early. `last_written` collects the newest timestamp
+    # written per device, samples up to `resume_after` of a device were
+    # already written and are dropped. Devices whose data is complete are
+    # added to `window_checkpoint`.
+    if data_done is None:
+        data_done = [None] * len(device_list)
+
     data_store = {}
+    buffered_bytes = 0
+
+    def _append(tag, data_frame):
+        write_start = time.monotonic()
+        hdf.append(device_list[tag], data_frame)
+
+        if last_written is not None:
+            newest = int(data_frame['Timestamps'].max())
+            last_written[device_list[tag]] = max(
+                newest,
+                last_written.get(device_list[tag], newest)
+            )
+
+        if metrics is not None:
+            metrics.wrote(
+                device_list[tag],
+                time.monotonic() - write_start,
+                int(data_frame.memory_usage(index=False).sum())
+            )
+
+    def _flush(tag):
+        nonlocal buffered_bytes
+        device_data = data_store[tag]
+        buffered_bytes -= device_data.nbytes
+        data_frame = device_data.flush()
+
+        if data_frame is not None:
+            _append(tag, data_frame)
+
+    def _flush_largest():
+        # Write the biggest buffers until the total is under the threshold
+        by_size = sorted(
+            data_store,
+            key=lambda tag: data_store[tag].nbytes,
+            reverse=True
+        )
+
+        for tag in by_size:
+            if buffered_bytes <= total_flush_bytes:
+                break
+
+            logger.debug(
+                'Flushing %s bytes of %s, %s bytes buffered in total',
+                data_store[tag].nbytes,
+                device_list[tag],
+                buffered_bytes
+            )
+            _flush(tag)
+
+    def _flush_all():
+        # Writes what is buffered of unfinished devices, e.g. when the
+        # stream is interrupted, so a retry or resume continues after it
+        for tag in list(data_store):
+            _flush(tag)
+            del data_store[tag]
 
     def _run(event_response):
+        nonlocal buffered_bytes
+
         # This is a data response
         if isinstance(event_response, acsys.dpm.ItemData):
             request = device_list[event_response.tag]
-            dpm_data = {
-                'Timestamps': event_response.micros,
-                'Data': event_response.data
-            }
-            data_frame = pd.DataFrame(data=dpm_data)
+            micros = event_response.micros
+            data = event_response.data
+
+            if resume_after and request in resume_after and len(data) > 0:
+                keep = np.asarray(micros) > resume_after[request]
+                micros = np.asarray(micros)[keep]
+                data = np.asarray(data)[keep]
 
             # If we think data is done and more arrives, write it to the file
             if data_done[event_response.tag]:
@@ -86,19 +224,49 @@ def _create_data_processor(device_list, hdf):
                     'Data received after final response for %s',
                     request
                 )
-                hdf.append(request, data_frame)
+                late_data = DeviceBuffer(max(1, len(data)))
+                late_data.extend(micros, data)
+                data_frame = late_data.to_data_frame()
+
+                if data_frame is not None:
+                    _append(event_response.tag, data_frame)
+
+                if metrics is not None:
+                    metrics.reply(request, len(data))
             else:
-                if request in data_store.keys():
-                    data_store[request] = data_store[request].append(
-                        data_frame)
-                else:
-                    data_store[request] = data_frame
+                if event_response.tag not in data_store:
+                    data_store[event_response.tag] = DeviceBuffer()
+
+                device_data = data_store[event_response.tag]
+                buffered_bytes -= device_data.nbytes
+                device_data.extend(micros, data)
+                buffered_bytes += device_data.nbytes
+
+                if metrics is not None:
+                    metrics.reply(request, len(data), device_data.nbytes)
+
+                if device_flush_bytes and \
+                        device_data.nbytes >= device_flush_bytes:
+                    _flush(event_response.tag)
+
+                if total_flush_bytes and buffered_bytes > total_flush_bytes:
+                    _flush_largest()
 
             # DPM tells us there is no more data with an empty list
             if len(event_response.data) == 0:
-                # Write data to file
-                hdf.append(request, data_store[request])
+                # Write data to file, devices without data have no key
+                if event_response.tag in data_store:
+                    _flush(event_response.tag)
+                    del data_store[event_response.tag]
+
                 data_done[event_response.tag] = True
+
+                if metrics is not None:
+                    metrics.done(request)
+
+                if window_checkpoint is not None:
+                    window_checkpoint.done(request)
+
                 logger.debug(
                     '%s of %s requests still processing.',
                     data_done.count(None),
@@ -109,6 +277,12 @@ def _create_data_processor(device_list, hdf):
         elif isinstance(event_response, acsys.dpm.ItemStatus):
             # Want to make it status, but can't because of the bug
             data_done[event_response.tag] = event_response.status
+
+            if metrics is not None:
+                metrics.done(
+                    device_list[event_response.tag],
+                    event_response.status
+                )
             logger.warning(
                 'Returned status message %s for %s',
                 event_response.status,
@@ -132,53 +306,333 @@ def _create_data_processor(device_list, hdf):
 
         return False
 
+    # Writes are profiled on their own, inside event processing
+    if profiler is not None:
+        _append = profiler.wrap('writing', _append)
+        _run = profiler.wrap('processing', _run)
+
+    _run.flush = _flush_all
+
     return _run
 
 
-def _create_dpm_request(
+def _split_device_list(device_list, shards=1):
+    # Contiguous groups of device indexes with sizes differing by at most 1
+    shards = max(1, min(shards, len(device_list)))
+    size, remainder = divmod(len(device_list), shards)
+    groups = []
+    start = 0
+
+    for shard in range(shards):
+        end = start + size + (1 if shard < remainder else 0)
+        groups.append(list(range(start, end)))
+        start = end
+
+    return groups
+
+
+def pack_device_list(device_list, shards=1, costs=None):
+    # Groups of device indexes. `costs` maps devices to a predicted cost,
+    # devices are then added heaviest first to the group with the least
+    # cost so far, and the groups finish close together. Devices without
+    # a cost count as the median one. Without costs the groups are
+    # contiguous.
+    if not costs:
+        return _split_device_list(device_list, shards)
+
+    shards = max(1, min(shards, len(device_list)))
+    known = sorted(costs[device] for device in device_list if device in costs)
+    default = known[len(known) // 2] if known else 1.0
+    weights = [costs.get(device, default) for device in device_list]
+    groups = [[] for _ in range(shards)]
+    loads = [(0.0, shard) for shard in range(shards)]
+
+    for index in sorted(range(len(device_list)),
+                        key=lambda index: weights[index], reverse=True):
+        load, shard = heapq.heappop(loads)
+        groups[shard].append(index)
+        heapq.heappush(loads, (load + weights[index], shard))
+
+    return [sorted(group) for group in groups]
+
+
+async def _acquire_group(
+    con,
     device_list,
     hdf,
-    request_type=None,
-    dpm_node=None
+    request_type,
+    dpm_node,
+    processor_options,
+    context_factory=None,
+    record=None
 ):
-    async def _dpm_request(con):
-        # Setup context
-        async with acsys.dpm.DPMContext(con, dpm_node=dpm_node) as dpm:
-            drf_requests = []
+    # Setup context, the factory stands in for DPMContext, e.g. to simulate
+    context_factory = context_factory or acsys.dpm.DPMContext
+
+    async with context_factory(con, dpm_node=dpm_node) as dpm:
+        drf_requests = []
+
+        for index, device in enumerate(device_list):
+            drf_requests.append((index, device))
 
-            for index, device in enumerate(device_list):
-                drf_requests.append((index, device))
+        # Add acquisition requests
+        await dpm.add_entries(drf_requests)
 
-            # Add acquisition requests
-            await dpm.add_entries(drf_requests)
+        # Start acquisition
+        logger.debug('Starting DAQ of %s devices...', len(device_list))
 
-            # Start acquisition
-            logger.debug('Starting DAQ...')
-            await dpm.start(request_type)
+        if processor_options.get('metrics') is not None:
+            processor_options['metrics'].start()
 
-            # Track replies for each device
-            process_data = _create_data_processor(device_list, hdf)
-            data_done = []
+        await dpm.start(request_type)
+
+        # Track replies for each device
+        data_done = [None] * len(device_list)
+        process_data = _create_data_processor(
+            device_list,
+            hdf,
+            data_done=data_done,
+            **processor_options
+        )
 
-            # Process incoming data
+        # Process incoming data. Signals and dropped connections end up
+        # here as exceptions, buffered data is written rather than lost.
+        try:
             async for event_response in dpm:
-                data_done = process_data(event_response)
+                if record is not None:
+                    record(event_response)
 
-                if data_done:
+                if process_data(event_response):
                     logger.info('Data acquisition complete')
-                    for index, data in enumerate(data_done):
-                        if data is None:
-                            logger.debug(
-                                'No response from: %s',
-                                device_list[index]
-                            )
                     break
+        finally:
+            process_data.flush()
+
+        for index, data in enumerate(data_done):
+            if data is None:
+                logger.debug('No response from: %s', device_list[index])
 
-            compare_hdf_device_list(hdf, device_list, data_done)
+        return data_done
+
+
+def _create_dpm_request(
+    device_list,
+    hdf,
+    request_type=None,
+    dpm_node=None,
+    shards=1,
+    dpm_nodes=None,
+    context_factory=None,
+    recorder=None,
+    retries=0,
+    retry_backoff=RETRY_BACKOFF,
+    resume_after=None,
+    completed=None,
+    device_costs=None,
+    **processor_options
+):
+    # Devices `completed` by an earlier run of a resumed window aren't
+    # requested again
+    completed = completed or set()
+    requested = [
+        index for index, device in enumerate(device_list)
+        if device not in completed
+    ]
+    dpm_nodes = dpm_nodes or [dpm_node]
+    groups = [
+        [requested[index] for index in group]
+        for group in pack_device_list(
+            [device_list[index] for index in requested],
+            max(shards, len(dpm_nodes)),
+            device_costs
+        )
+        if group
+    ]
+
+    # Every context buffers its own devices, split the global budget
+    total_flush_bytes = processor_options.get('total_flush_bytes')
+
+    if total_flush_bytes and len(groups) > 1:
+        processor_options = dict(
+            processor_options,
+            total_flush_bytes=max(1, total_flush_bytes // len(groups))
+        )
+
+    # A resumed window continues after what an earlier run wrote, retries
+    # after what the first attempt wrote
+    last_written = dict(resume_after or {})
+    processor_options = dict(
+        processor_options,
+        last_written=last_written,
+        resume_after=dict(last_written)
+    )
+    retry_options = dict(processor_options, resume_after=last_written)
+
+    async def _dpm_request(con):
+        # Each group gets its own context, all on the same event loop.
+        # Tags are local to a context and map back through the groups.
+        group_replies = await asyncio.gather(*[
+            _acquire_group(
+                con,
+                [device_list[index] for index in group],
+                hdf,
+                request_type,
+                dpm_nodes[shard % len(dpm_nodes)],
+                processor_options,
+                context_factory,
+                _group_recorder(recorder, group)
+            )
+            for shard, group in enumerate(groups)
+        ])
+
+        data_done = [
+            True if device in completed else None for device in device_list
+        ]
+
+        for group, replies in zip(groups, group_replies):
+            for index, reply in zip(group, replies):
+                data_done[index] = reply
+
+        await _retry_failed(
+            con,
+            device_list,
+            data_done,
+            hdf,
+            request_type,
+            dpm_nodes[0],
+            retry_options,
+            context_factory,
+            retries,
+            retry_backoff,
+            recorder
+        )
+        compare_hdf_device_list(hdf, device_list, data_done)
+
+        if processor_options.get('metrics') is not None:
+            processor_options['metrics'].finish(
+                [device_list[index] for index in requested]
+            )
+
+        return data_done
 
     return _dpm_request
 
 
+async def _retry_failed(
+    con,
+    device_list,
+    data_done,
+    hdf,
+    request_type,
+    dpm_node,
+    processor_options,
+    context_factory,
+    retries,
+    retry_backoff,
+    recorder=None
+):
+    # Requests devices without a final reply again in one context, with
+    # exponential backoff, until all replied or the retries are used up
+    for attempt in range(retries):
+        failed = [
+            index for index, reply in enumerate(data_done) if reply is not True
+        ]
+
+        if not failed:
+            return
+
+        delay = retry_backoff * 2 ** attempt
+        logger.warning(
+            'Retry %s of %s for %s devices in %s seconds',
+            attempt + 1,
+            retries,
+            len(failed),
+            delay
+        )
+        await asyncio.sleep(delay)
+
+        if recorder is not None:
+            recorder.retry(failed)
+
+        replies = await _acquire_group(
+            con,
+            [device_list[index] for index in failed],
+            hdf,
+            request_type,
+            dpm_node,
+            processor_options,
+            context_factory,
+            _group_recorder(recorder, failed)
+        )
+
+        for index, reply in zip(failed, replies):
+            data_done[index] = reply
+
+
+def _group_recorder(recorder, group):
+    # Records replies of one context with the tags of the whole list
+    if recorder is None:
+        return None
+
+    def _record(reply):
+        tag = reply_log.reply_tag(reply)
+        recorder.write(reply, group[tag] if 0 <= tag < len(group) else tag)
+
+    return _record
+
+
+def _replay(replay_file, device_list, hdf, realtime=False,
+            **processor_options):
+    # Feeds a recorded reply stream to the data processor, as fast as
+    # possible or at the pace it was recorded. Like when acquiring, a retry
+    # gets a processor of its own that drops the samples of its devices
+    # the failed attempt already wrote.
+    data_done = [None] * len(device_list)
+    last_written = {}
+    process_data = _create_data_processor(
+        device_list,
+        hdf,
+        data_done=data_done,
+        last_written=last_written,
+        **processor_options
+    )
+    start = time.monotonic()
+
+    if processor_options.get('metrics') is not None:
+        processor_options['metrics'].start()
+
+    try:
+        for elapsed, event_response in reply_log.read_replies(replay_file):
+            if realtime:
+                time.sleep(max(0.0, start + elapsed - time.monotonic()))
+
+            if isinstance(event_response, reply_log.Retry):
+                process_data.flush()
+
+                for tag in event_response.tags:
+                    data_done[tag] = None
+
+                process_data = _create_data_processor(
+                    device_list,
+                    hdf,
+                    data_done=data_done,
+                    last_written=last_written,
+                    resume_after=last_written,
+                    **processor_options
+                )
+            else:
+                process_data(event_response)
+    finally:
+        process_data.flush()
+
+    compare_hdf_device_list(hdf, device_list, data_done)
+
+    if processor_options.get('metrics') is not None:
+        processor_options['metrics'].finish(device_list)
+
+    return data_done
+
+
 def generate_data_source(start_date, end_date, duration):
     result = ''
 
@@ -222,23 +676,18 @@ def _write_output(path, output):
 
 
 def _get_latest_device_list(output_filename=None):
-    url = ('https://github.com/fermi-ad/linac-logger-device-cleaner/'
-           'releases/latest/download/linac_logger_drf_requests.txt')
-    req = requests.get(url, allow_redirects=False)
+    provider = device_list.DeviceListProvider()
+    latest_device_list = provider.device_list()
 
-    if req.status_code == requests.codes.get('ok'):
-        device_list = [line.strip()  # Trim whitespace
-                       for line in req.text.split('\n')
-                       if line]  # Remove blank lines
+    if latest_device_list is None:
+        print(f'Could not fetch {provider.file_name}')
 
-        if output_filename:
-            _write_output(output_filename, device_list)
+        return None
 
-        return device_list
+    if output_filename:
+        _write_output(output_filename, latest_device_list)
 
-    print(f'Could not fetch {url}')
-
-    return None
+    return latest_device_list
 
 
 def _generate_device_list(device_limit, device_file=None):
@@ -261,19 +710,111 @@ def _generate_device_list(device_limit, device_file=None):
     return result
 
 
+def _resume_point(output_file, output_format, data_source):
+    # Devices complete in an interrupted output and the newest timestamp
+    # of every other device in it, None when the window starts over
+    completed = checkpoint.load(output_file, data_source)
+
+    if completed is None or not Path(output_file).exists() or \
+            not storage.store_class(output_format, output_file).resumable:
+        return None
+
+    resume_after = {}
+
+    try:
+        with storage.open_store(output_file, 'r', output_format) as store:
+            for key in store.keys():
+                device = key.lstrip('/')
+                nrows = store.nrows(key)
+
+                if device not in completed and nrows:
+                    resume_after[device] = int(
+                        store.select(key, start=nrows - 1)['Timestamps'].max()
+                    )
+    except Exception as error:
+        # E.g. killed in the middle of a write
+        logger.warning('Could not resume %s: %s', output_file, error)
+        return None
+
+    return completed, resume_after
+
+
 def get_data(**kwargs):
     signal.signal(signal.SIGINT, _signal_handler)
+    signal.signal(signal.SIGTERM, _signal_handler)
 
     start_date = kwargs.get('start-date', kwargs.get('start_date', None))
     end_date = kwargs.get('end-date', kwargs.get('end_date', None))
     duration = kwargs.get('duration', None)
     device_limit = kwargs.get('device-limit', 0)
     device_file = kwargs.get('device-file', kwargs.get('device_file', None))
+    output_format = kwargs.get(
+        'output-format',
+        kwargs.get('output_format', None)
+    )
     output_file = kwargs.get(
         'output-file',
-        kwargs.get('output_file', Path('data.h5'))
+        kwargs.get(
+            'output_file',
+            Path('data').with_suffix(
+                storage.store_class(output_format).extension
+            )
+        )
     )
     dpm_node = kwargs.get('dpm-node', kwargs.get('dpm_node', None))
+    dpm_nodes = kwargs.get('dpm-nodes', kwargs.get('dpm_nodes', None))
+    shards = kwargs.get('shards', 1)
+    device_flush_bytes = kwargs.get(
+        'device-flush-bytes',
+        kwargs.get('device_flush_bytes', DEVICE_FLUSH_BYTES)
+    )
+    total_flush_bytes = kwargs.get(
+        'flush-bytes',
+        kwargs.get('flush_bytes', TOTAL_FLUSH_BYTES)
+    )
+    complib = kwargs.get('complib', None)
+    complevel = kwargs.get('complevel', None)
+    expected_rows = kwargs.get(
+        'expected-rows',
+        kwargs.get('expected_rows', None)
+    )
+    chunkshape = kwargs.get('chunkshape', None)
+    metrics_file = kwargs.get(
+        'metrics-file',
+        kwargs.get('metrics_file', None)
+    )
+    metrics_log = kwargs.get('metrics-log', kwargs.get('metrics_log', None))
+    profile = kwargs.get('profile', False)
+    profile_output = kwargs.get(
+        'profile-output',
+        kwargs.get('profile_output', PROFILE_OUTPUT)
+    )
+    profile_memory = kwargs.get(
+        'profile-memory',
+        kwargs.get('profile_memory', False)
+    )
+    # `--simulate` selects the simulator with its defaults, like nanny
+    simulator_settings = kwargs.get(
+        'simulator',
+        True if kwargs.get('simulate', False) else None
+    )
+    record = kwargs.get('record', None)
+    replay_file = kwargs.get('replay', None)
+    realtime = kwargs.get('realtime', False)
+    retries = kwargs.get('retries', RETRIES)
+    retry_backoff = kwargs.get(
+        'retry-backoff',
+        kwargs.get('retry_backoff', RETRY_BACKOFF)
+    )
+    # A device list and an existing file to add to, e.g. for repairs
+    devices = kwargs.get('devices', None)
+    append = kwargs.get('append', False)
+    # Continue an output interrupted in an earlier run
+    resume = kwargs.get('resume', False)
+    # Predicted cost of each device to balance the shards by
+    device_costs = kwargs.get('device_costs', None)
+    # Return the metrics of each device even without a metrics output
+    collect_metrics = kwargs.get('collect_metrics', False)
     debug = kwargs.get('debug', False)
 
     # Silence STDOUT warnings
@@ -285,31 +826,195 @@ def get_data(**kwargs):
     logger.debug(
         (
             'start_date: %s, end_date: %s, duration: %s, device_file: %s, '
-            'dpm_node: %s, device_limit: %s, output_file: %s, debug: %s'
+            'dpm_node: %s, dpm_nodes: %s, shards: %s, '
+            'device_limit: %s, output_file: %s, '
+            'output_format: %s, '
+            'device_flush_bytes: %s, flush_bytes: %s, complib: %s, '
+            'complevel: %s, expected_rows: %s, chunkshape: %s, '
+            'metrics_file: %s, metrics_log: %s, profile: %s, '
+            'profile_output: %s, profile_memory: %s, simulator: %s, '
+            'record: %s, replay: %s, realtime: %s, retries: %s, '
+            'retry_backoff: %s, devices: %s, append: %s, resume: %s, '
+            'device_costs: %s, collect_metrics: %s, debug: %s'
         ),
         start_date,
         end_date,
         duration,
         device_file,
         dpm_node,
+        dpm_nodes,
+        shards,
         device_limit,
         output_file,
+        output_format,
+        device_flush_bytes,
+        total_flush_bytes,
+        complib,
+        complevel,
+        expected_rows,
+        chunkshape,
+        metrics_file,
+        metrics_log,
+        profile,
+        profile_output,
+        profile_memory,
+        simulator_settings,
+        record,
+        replay_file,
+        realtime,
+        retries,
+        retry_backoff,
+        devices,
+        append,
+        resume,
+        len(device_costs) if device_costs else None,
+        collect_metrics,
         debug
     )
 
-    if output_file.exists():
-        os.remove(output_file)
+    run_client = acsys.run_client
+    context_factory = None
+
+    if simulator_settings:
+        simulator_settings = simulator.get_settings(simulator_settings)
+        run_client = simulator.run_client
+        context_factory = simulator.context_factory(simulator_settings)
+
+    if replay_file is not None:
+        # The log knows what was requested, its tags index this list
+        replay_header = reply_log.load_header(replay_file)
+        device_list = replay_header['device_list']
+    elif devices is not None:
+        device_list = list(devices)
+    elif simulator_settings and device_file is None:
+        device_list = simulator.generate_device_list(
+            simulator_settings['devices']
+        )
+    else:
+        device_list = _generate_device_list(device_limit, device_file)
+
+    if replay_file is not None:
+        data_source = replay_header['data_source']
+    else:
+        data_source = generate_data_source(start_date, end_date, duration)
 
-    device_list = _generate_device_list(device_limit, device_file)
-    data_source = generate_data_source(start_date, end_date, duration)
     logger.debug('data_source: %s', data_source)
+    resume_point = None
 
-    with pd.HDFStore(output_file) as hdf:
-        get_logger_data = _create_dpm_request(
-            device_list,
-            hdf,
-            data_source,
-            dpm_node
+    if resume and replay_file is None:
+        resume_point = _resume_point(output_file, output_format, data_source)
+
+    if resume_point is not None:
+        completed, resume_after = resume_point
+        logger.info(
+            'Resuming %s, %s of %s devices are complete',
+            output_file,
+            len(completed),
+            len(device_list)
         )
+    else:
+        completed, resume_after = set(), {}
+        checkpoint.checkpoint_path(output_file).unlink(missing_ok=True)
+
+        if Path(output_file).exists() and not append:
+            os.remove(output_file)
+
+    recorder = None
+
+    if record is not None:
+        # A directory gets one log per output file
+        record_file = Path(record)
+
+        if record_file.is_dir():
+            record_file = record_file.joinpath(
+                Path(output_file).name.split('.')[0] + reply_log.EXTENSION
+            )
+
+        recorder = reply_log.ReplyRecorder(record_file, device_list,
+                                           data_source)
+
+    metrics = AcquisitionMetrics() \
+        if metrics_file or metrics_log or collect_metrics else None
+    profiler = Profiler(profile_output, profile_memory) if profile else None
+    # Everything outside event processing, e.g. the DPM protocol and
+    # closing the output, is profiled as acquisition
+    acquisition = profiler.section('acquisition') if profiler \
+        else contextlib.nullcontext()
+
+    try:
+        with acquisition, storage.open_store(
+            output_file,
+            mode='a',
+            output_format=output_format,
+            complib=complib,
+            complevel=complevel,
+            expected_rows=expected_rows,
+            chunkshape=chunkshape
+        ) as hdf:
+            window_checkpoint = None
+
+            if resume and replay_file is None and hdf.resumable:
+                window_checkpoint = checkpoint.Checkpoint(
+                    output_file,
+                    data_source,
+                    hdf,
+                    completed
+                )
+
+            processor_options = {
+                'device_flush_bytes': device_flush_bytes,
+                'total_flush_bytes': total_flush_bytes,
+                'metrics': metrics,
+                'profiler': profiler,
+                'window_checkpoint': window_checkpoint
+            }
+
+            try:
+                if replay_file is not None:
+                    _replay(replay_file, device_list, hdf, realtime,
+                            **processor_options)
+                else:
+                    get_logger_data = _create_dpm_request(
+                        device_list,
+                        hdf,
+                        data_source,
+                        dpm_node,
+                        shards=shards,
+                        dpm_nodes=dpm_nodes,
+                        context_factory=context_factory,
+                        recorder=recorder,
+                        retries=retries,
+                        retry_backoff=retry_backoff,
+                        resume_after=resume_after,
+                        completed=completed,
+                        device_costs=device_costs,
+                        **processor_options
+                    )
+
+                    run_client(_cancel_on_signals(get_logger_data))
+            except BaseException:
+                # Everything written so far is kept for the next run
+                if window_checkpoint is not None:
+                    window_checkpoint.save()
+
+                raise
+
+        if window_checkpoint is not None:
+            window_checkpoint.remove()
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+        # A stalled or failed window is worth recording too
+        if metrics_file or metrics_log:
+            metrics.write(
+                metrics_file,
+                metrics_log,
+                output_file=str(output_file),
+                data_source=data_source
+            )
+
+        if profiler is not None:
+            profiler.dump(Path(output_file).name.split('.')[0])
 
-        acsys.run_client(get_logger_data)
+    return metrics.devices if metrics is not None else None
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = 'datalogger'
+
+
+class AcquisitionMetrics:
+    # Per device timings and sizes of one acquisition window. Times are
+    # seconds since acquisition started. Devices are keyed by their DRF
+    # request so sharded contexts can share one instance.
+
+    def __init__(self):
+        self.devices = {}
+        self.window_start = None
+        self.started = None
+        self.finished = None
+
+    def _device(self, device):
+        if device not in self.devices:
+            self.devices[device] = {
+                'first_reply_seconds': None,
+                'final_reply_seconds': None,
+                'replies': 0,
+                'rows': 0,
+                'peak_bytes': 0,
+                'bytes': 0,
+                'write_seconds': 0.0,
+                'status': None
+            }
+
+        return self.devices[device]
+
+    def _elapsed(self):
+        if self.started is None:
+            self.start()
+
+        return time.monotonic() - self.started
+
+    def start(self):
+        # Shards start one after another, the first one starts the window
+        if self.started is None:
+            self.started = time.monotonic()
+            self.window_start = datetime.now()
+
+    def reply(self, device, rows, buffered_bytes=0):
+        metrics = self._device(device)
+        elapsed = self._elapsed()
+
+        if metrics['first_reply_seconds'] is None:
+            metrics['first_reply_seconds'] = elapsed
+
+        metrics['replies'] += 1
+        metrics['rows'] += rows
+        metrics['peak_bytes'] = max(metrics['peak_bytes'], buffered_bytes)
+
+    def wrote(self, device, seconds, nbytes=0):
+        metrics = self._device(device)
+        metrics['write_seconds'] += seconds
+        metrics['bytes'] += nbytes
+
+    def done(self, device, status='ok'):
+        metrics = self._device(device)
+        metrics['final_reply_seconds'] = self._elapsed()
+        metrics['status'] = status
+
+    def finish(self, device_list):
+        self.finished = self._elapsed()
+
+        for device in device_list:
+            metrics = self._device(device)
+
+            if metrics['status'] is None:
+                metrics['status'] = 'no_reply'
+
+    def summary(self):
+        devices = self.devices.values()
+        final_replies = [
+            metrics['final_reply_seconds'] for metrics in devices
+            if metrics['final_reply_seconds'] is not None
+        ]
+        statuses = {}
+
+        for metrics in devices:
+            status = 'ok' if metrics['status'] == 'ok' else \
+                'no_reply' if metrics['status'] in (None, 'no_reply') else \
+                'status'
+            statuses[status] = statuses.get(status, 0) + 1
+
+        return {
+            'window_start': (self.window_start.isoformat()
+                             if self.window_start else None),
+            'duration_seconds': self.finished,
+            'devices': len(self.devices),
+            'statuses': statuses,
+            'replies': sum(metrics['replies'] for metrics in devices),
+            'rows': sum(metrics['rows'] for metrics in devices),
+            'peak_bytes': sum(metrics['peak_bytes'] for metrics in devices),
+            'write_seconds': sum(metrics['write_seconds']
+                                 for metrics in devices),
+            'slowest_final_reply_seconds': max(final_replies, default=None)
+        }
+
+    def write_prometheus(self, path):
+        # Window totals for the node exporter textfile collector. Written
+        # to a temporary file and renamed so a scrape never sees half.
+        summary = self.summary()
+        lines = []
+
+        def _gauge(name, help_text, samples):
+            name = f'{PROMETHEUS_PREFIX}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f'{name}{labels} {value}')
+
+        _gauge('window_start_timestamp_seconds',
+               'Start of the last acquisition.',
+               [('', self.window_start.timestamp()
+                 if self.window_start else None)])
+        _gauge('window_duration_seconds',
+               'Time from the start of acquisition to the last reply.',
+               [('', summary['duration_seconds'])])
+        _gauge('window_slowest_device_seconds',
+               'Time to the final reply of the slowest device.',
+               [('', summary['slowest_final_reply_seconds'])])
+        _gauge('window_devices',
+               'Devices of the last window by final status.',
+               [(f'{{status="{status}"}}', count)
+                for status, count in sorted(summary['statuses'].items())])
+        _gauge('window_replies', 'Replies received in the last window.',
+               [('', summary['replies'])])
+        _gauge('window_rows', 'Rows received in the last window.',
+               [('', summary['rows'])])
+        _gauge('window_buffered_bytes',
+               'Sum of the peak buffered bytes of each device.',
+               [('', summary['peak_bytes'])])
+        _gauge('window_write_seconds', 'Time spent writing the output.',
+               [('', summary['write_seconds'])])
+
+        path = Path(path)
+        temp_path = path.with_name(f'.{path.name}.tmp')
+
+        with open(temp_path, 'w', encoding='utf8') as file_handle:
+            file_handle.write('\n'.join(lines) + '\n')
+
+        os.replace(temp_path, path)
+
+    def append_jsonl(self, path, **fields):
+        # One line per window with the totals and every device
+        record = dict(fields, **self.summary())
+        record['device_metrics'] = self.devices
+
+        with open(path, 'a', encoding='utf8') as file_handle:
+            file_handle.write(json.dumps(record, default=str) + '\n')
+
+    def write(self, metrics_file=None, metrics_log=None, **fields):
+        try:
+            if metrics_file:
+                self.write_prometheus(metrics_file)
+
+            if metrics_log:
+                self.append_jsonl(metrics_log, **fields)
+        except OSError as error:
+            logger.error('Could not write metrics: %s', error)
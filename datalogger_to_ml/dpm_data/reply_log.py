@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Binary log of a raw DPM reply stream. After a header with the device
+# list and data source, each reply is one record:
+#
+#   kind (B), tag (I), elapsed seconds (d)
+#   ItemData:   count (I), micros (count int64), data kind (B), data
+#   ItemStatus: status (i)
+#   Retry:      the number of devices instead of a tag, their tags (I)
+#
+# Numeric data is stored as a dtype string and the raw array, anything
+# else, e.g. array devices or strings, as JSON. Everything is
+# little-endian.
+
+import json
+import struct
+import time
+import acsys.dpm
+import acsys.status
+import numpy as np
+
+MAGIC = b'DPMREPLY'
+VERSION = 2
+EXTENSION = '.replies'
+
+ITEM_DATA = 0
+ITEM_STATUS = 1
+DEVICE_INFO = 2
+RETRY = 3
+
+NUMERIC = 0
+JSON = 1
+
+_RECORD = struct.Struct('<BId')
+_COUNT = struct.Struct('<I')
+_STATUS = struct.Struct('<i')
+_LENGTH = struct.Struct('<I')
+
+
+def _status_value(status):
+    return int(getattr(status, 'value', status))
+
+
+def _to_json(value):
+    # Arrays and NumPy scalars inside the data of a reply
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+
+    raise TypeError(f'Cannot record {type(value).__name__} data')
+
+
+class Retry:
+    # Marks a retry of the devices with `tags`. Their replies until the
+    # next retry can resend samples the failed attempt already received.
+
+    def __init__(self, tags):
+        self.tags = list(tags)
+
+
+def reply_tag(reply):
+    # DeviceInfo replies carry their tag as ref_id
+    return getattr(reply, 'tag', getattr(reply, 'ref_id', 0))
+
+
+class ReplyRecorder:
+    # Appends replies as they arrive. Tags are those of the whole device
+    # list, sharded contexts map their local tags before writing.
+
+    def __init__(self, path, device_list, data_source):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._start = time.monotonic()
+        header = json.dumps({
+            'device_list': list(device_list),
+            'data_source': data_source
+        }).encode('utf8')
+        self._file.write(MAGIC + struct.pack('<H', VERSION))
+        self._file.write(_LENGTH.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, reply, tag=None):
+        tag = reply_tag(reply) if tag is None else tag
+        elapsed = time.monotonic() - self._start
+
+        if isinstance(reply, acsys.dpm.ItemData):
+            self._file.write(_RECORD.pack(ITEM_DATA, tag, elapsed))
+            self._write_data(reply)
+        elif isinstance(reply, acsys.dpm.ItemStatus):
+            self._file.write(_RECORD.pack(ITEM_STATUS, tag, elapsed))
+            self._file.write(_STATUS.pack(_status_value(reply.status)))
+        elif isinstance(reply, acsys.dpm.DeviceInfo_reply):
+            self._file.write(_RECORD.pack(DEVICE_INFO, tag, elapsed))
+
+    def retry(self, tags):
+        elapsed = time.monotonic() - self._start
+        self._file.write(_RECORD.pack(RETRY, len(tags), elapsed))
+        self._file.write(np.asarray(tags, dtype='<u4').tobytes())
+
+    def _write_data(self, reply):
+        count = len(reply.data)
+        self._file.write(_COUNT.pack(count))
+        self._file.write(np.asarray(reply.micros, dtype='<i8').tobytes())
+        values = np.asarray(reply.data) if count else np.empty(0)
+
+        if values.ndim == 1 and values.dtype.kind in 'biuf':
+            dtype = values.dtype.newbyteorder('<').str.encode('ascii')
+            self._file.write(struct.pack('<BB', NUMERIC, len(dtype)) + dtype)
+            self._file.write(values.astype(dtype.decode('ascii'),
+                                           copy=False).tobytes())
+        else:
+            data = json.dumps(list(reply.data), default=_to_json) \
+                .encode('utf8')
+            self._file.write(struct.pack('<B', JSON))
+            self._file.write(_LENGTH.pack(len(data)) + data)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def _read(file_handle, size):
+    data = file_handle.read(size)
+
+    if len(data) != size:
+        raise EOFError('Truncated reply log')
+
+    return data
+
+
+def read_header(file_handle):
+    if _read(file_handle, len(MAGIC)) != MAGIC:
+        raise ValueError('Not a reply log')
+
+    version, = struct.unpack('<H', _read(file_handle, 2))
+
+    if version != VERSION:
+        raise ValueError(f'Unsupported reply log version {version}')
+
+    length, = _LENGTH.unpack(_read(file_handle, _LENGTH.size))
+
+    return json.loads(_read(file_handle, length).decode('utf8'))
+
+
+def _read_data(file_handle, tag):
+    count, = _COUNT.unpack(_read(file_handle, _COUNT.size))
+    micros = np.frombuffer(_read(file_handle, count * 8), dtype='<i8')
+    data_kind, = struct.unpack('<B', _read(file_handle, 1))
+
+    if data_kind == NUMERIC:
+        length, = struct.unpack('<B', _read(file_handle, 1))
+        dtype = np.dtype(_read(file_handle, length).decode('ascii'))
+        data = np.frombuffer(_read(file_handle, count * dtype.itemsize),
+                             dtype=dtype)
+    else:
+        length, = _LENGTH.unpack(_read(file_handle, _LENGTH.size))
+        data = json.loads(_read(file_handle, length).decode('utf8'))
+
+    return acsys.dpm.ItemData(tag, 0, 0, data, micros=micros)
+
+
+def read_replies(path):
+    # Yields (elapsed seconds, reply) in recorded order, retries as Retry
+    # markers. A log cut short, e.g. by a crash, ends at its last complete
+    # record.
+    with open(path, 'rb') as file_handle:
+        read_header(file_handle)
+
+        while True:
+            record = file_handle.read(_RECORD.size)
+
+            if not record:
+                return
+
+            try:
+                kind, tag, elapsed = _RECORD.unpack(record)
+
+                if kind == ITEM_DATA:
+                    reply = _read_data(file_handle, tag)
+                elif kind == ITEM_STATUS:
+                    status, = _STATUS.unpack(
+                        _read(file_handle, _STATUS.size)
+                    )
+                    reply = acsys.dpm.ItemStatus(
+                        tag,
+                        acsys.status.Status(status)
+                    )
+                elif kind == RETRY:
+                    reply = Retry(np.frombuffer(
+                        _read(file_handle, tag * 4),
+                        dtype='<u4'
+                    ).tolist())
+                else:
+                    reply = acsys.dpm.DeviceInfo_reply()
+                    reply.ref_id = tag
+            except (EOFError, struct.error):
+                return
+
+            yield elapsed, reply
+
+
+def load_header(path):
+    with open(path, 'rb') as file_handle:
+        return read_header(file_handle)
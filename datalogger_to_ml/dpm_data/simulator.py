@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+import acsys.dpm
+import acsys.status
+import numpy as np
+
+# Defaults of the simulated DPM, any of them can be set in the config
+SETTINGS = {
+    # Devices generated when there is no device file
+    'devices': 100,
+    # Samples per second of every device
+    'sample_rate': 15.0,
+    # Samples per ItemData reply
+    'reply_size': 1000,
+    # Seconds to wait before each round of replies, one per device
+    'latency': 0.0,
+    # Fraction of devices that answer with an ItemStatus instead of data
+    'status_fraction': 0.0,
+    # Facility and error code of those statuses
+    'status': [17, -1],
+    # Fraction of devices that send one more sample after their final reply
+    'late_fraction': 0.0,
+    # Send a DeviceInfo reply for every device first
+    'device_info': True,
+    'seed': 0
+}
+
+
+def get_settings(settings=None):
+    # `True` or an empty section selects the simulator with its defaults
+    if not isinstance(settings, dict):
+        settings = {}
+
+    unknown = set(settings) - set(SETTINGS)
+
+    if unknown:
+        raise ValueError(
+            f'Unknown simulator settings {", ".join(sorted(unknown))}. '
+            f'Use any of {", ".join(SETTINGS)}.'
+        )
+
+    return dict(SETTINGS, **settings)
+
+
+def generate_device_list(devices):
+    return [f'Z:SIM{index:06d}@p,15H' for index in range(devices)]
+
+
+def parse_data_source(data_source, now=None):
+    # Returns the [start, end) UTC microseconds of a LOGGER or
+    # LOGGERDURATION data source
+    source, *times = data_source.split(':')
+
+    if source == 'LOGGER':
+        return int(times[0]) * 1000, int(times[1]) * 1000
+
+    if source == 'LOGGERDURATION':
+        end = int((time.time() if now is None else now) * 1000000)
+
+        return end - int(times[0]) * 1000, end
+
+    raise ValueError(f'The simulator does not support {data_source}')
+
+
+class SimulatedDPMContext:
+    # Stands in for acsys.dpm.DPMContext. Every device replies with
+    # sample_rate samples per second of the requested range, split into
+    # replies of reply_size samples, one device after another in rounds.
+
+    def __init__(self, con, dpm_node=None, settings=None):
+        self.con = con
+        self.dpm_node = dpm_node
+        self.settings = get_settings(settings)
+        self.entries = []
+        self.data_source = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def add_entries(self, entries):
+        self.entries = list(entries)
+
+    async def start(self, data_source=None):
+        self.data_source = data_source
+
+    def __aiter__(self):
+        return self._replies()
+
+    def _device_info(self, tag, drf):
+        reply = acsys.dpm.DeviceInfo_reply()
+        reply.ref_id = tag
+        reply.name = drf.split('@')[0]
+
+        return reply
+
+    async def _replies(self):
+        settings = self.settings
+        rng = np.random.default_rng(settings['seed'])
+        start_us, end_us = parse_data_source(self.data_source)
+        period_us = 1000000 / settings['sample_rate']
+        samples = max(0, int((end_us - start_us) / period_us))
+        reply_size = max(1, int(settings['reply_size']))
+        tags = [tag for tag, _ in self.entries]
+        statuses = set(rng.choice(
+            tags,
+            int(len(tags) * settings['status_fraction']),
+            replace=False
+        ).tolist()) if tags else set()
+        data_tags = [tag for tag in tags if tag not in statuses]
+        # The stream ends with the final reply of the last device, so only
+        # the others can send late data
+        late = set(rng.choice(
+            data_tags[:-1],
+            min(len(data_tags) - 1,
+                int(len(tags) * settings['late_fraction'])),
+            replace=False
+        ).tolist()) if len(data_tags) > 1 else set()
+        status = acsys.status.Status.create(*settings['status'])
+
+        if settings['device_info']:
+            for tag, drf in self.entries:
+                yield self._device_info(tag, drf)
+
+        for tag in sorted(statuses):
+            yield acsys.dpm.ItemStatus(tag, status)
+
+        for offset in range(0, samples, reply_size):
+            if settings['latency']:
+                await asyncio.sleep(settings['latency'])
+
+            count = min(reply_size, samples - offset)
+            micros = start_us + (
+                (offset + np.arange(count)) * period_us
+            ).astype(np.int64)
+
+            for tag in data_tags:
+                yield acsys.dpm.ItemData(
+                    tag, 0, 0, rng.random(count), micros=micros
+                )
+
+            # Let other shards run between rounds
+            await asyncio.sleep(0)
+
+        # DPM ends the data of each device with an empty reply. Late data
+        # follows right away, before the stream is complete.
+        for tag in data_tags:
+            yield acsys.dpm.ItemData(tag, 0, 0, [], micros=[])
+
+            if tag in late:
+                yield acsys.dpm.ItemData(
+                    tag, 0, 0, rng.random(1), micros=[end_us - 1]
+                )
+
+
+def context_factory(settings=None):
+    # Callable with the signature of acsys.dpm.DPMContext
+    settings = get_settings(settings)
+
+    def _create_context(con, dpm_node=None):
+        return SimulatedDPMContext(con, dpm_node=dpm_node, settings=settings)
+
+    return _create_context
+
+
+def run_client(get_logger_data):
+    # acsys.run_client without a connection to ACSys
+    return asyncio.run(get_logger_data(None))
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import logging
+import re
+import struct
+import isodate
+import numpy as np
+from . import catalog
+from . import nanny
+from . import storage
+from .dpm_data import local_to_utc_ms
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'index.json'
+# Fixed .npy header size so the row count can be rewritten in place
+NPY_HEADER_LENGTH = 128
+
+
+def _local_to_utc_us(date):
+    return local_to_utc_ms(date) * 1000
+
+
+def device_directory(device):
+    # DRF requests contain characters that don't belong in file names
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', device).strip('_')
+    digest = hashlib.sha1(device.encode('utf8')).hexdigest()[:8]
+
+    return f'{slug}-{digest}'
+
+
+def _npy_header(dtype, rows):
+    header = repr({
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (rows,)
+    })
+    # magic string, version and header length take 10 bytes
+    header = header.ljust(NPY_HEADER_LENGTH - 10 - 1) + '\n'
+
+    return (np.lib.format.magic(1, 0)
+            + struct.pack('<H', len(header))
+            + header.encode('latin1'))
+
+
+def _read_npy_header(path, file_handle):
+    np.lib.format.read_magic(file_handle)
+    shape, _, dtype = np.lib.format.read_array_header_1_0(file_handle)
+
+    if file_handle.tell() != NPY_HEADER_LENGTH:
+        raise ValueError(f'{path} was not written by export')
+
+    return shape[0], dtype
+
+
+def append_npy(path, array):
+    # Appends to a 1-d .npy file written by this function, np.load with
+    # mmap_mode sees the new rows once the header is rewritten. Bytes
+    # after the rows of the header, e.g. of an interrupted append, are
+    # overwritten.
+    path = Path(path)
+
+    if not path.exists():
+        with open(path, 'wb') as file_handle:
+            file_handle.write(_npy_header(array.dtype, len(array)))
+            file_handle.write(array.tobytes())
+
+        return len(array)
+
+    with open(path, 'r+b') as file_handle:
+        rows, dtype = _read_npy_header(path, file_handle)
+
+        if not np.can_cast(array.dtype, dtype):
+            raise ValueError(f'Cannot append {array.dtype} to {dtype} of '
+                             f'{path}')
+
+        file_handle.seek(NPY_HEADER_LENGTH + rows * dtype.itemsize)
+        file_handle.write(array.astype(dtype, copy=False).tobytes())
+        file_handle.truncate()
+        rows += len(array)
+        file_handle.seek(0)
+        file_handle.write(_npy_header(dtype, rows))
+
+    return rows
+
+
+def truncate_npy(path, rows):
+    # Keeps the first `rows` rows of a file written by append_npy and
+    # returns its dtype, None if there is no file
+    path = Path(path)
+
+    if not path.exists():
+        return None
+
+    with open(path, 'r+b') as file_handle:
+        file_rows, dtype = _read_npy_header(path, file_handle)
+
+        if file_rows < rows:
+            raise ValueError(f'{path} has {file_rows} rows, expected {rows}')
+
+        file_handle.seek(0)
+        file_handle.write(_npy_header(dtype, rows))
+        file_handle.truncate(NPY_HEADER_LENGTH + rows * dtype.itemsize)
+
+    return dtype
+
+
+def widen_npy(path, dtype):
+    # Rewrites a file written by append_npy with a wider dtype
+    path = Path(path)
+    array = np.load(path).astype(dtype)
+    temp_path = path.with_name(f'{path.name}.tmp')
+
+    with open(temp_path, 'wb') as file_handle:
+        file_handle.write(_npy_header(array.dtype, len(array)))
+        file_handle.write(array.tobytes())
+
+    temp_path.replace(path)
+
+
+def load_index(export_path):
+    try:
+        with open(Path(export_path).joinpath(INDEX_FILENAME),
+                  encoding='utf8') as file_handle:
+            return json.load(file_handle)
+    except FileNotFoundError:
+        return {'files': [], 'end': None, 'devices': {}}
+
+
+def _write_index(export_path, index):
+    index_path = Path(export_path).joinpath(INDEX_FILENAME)
+    temp_path = index_path.with_suffix('.json.tmp')
+
+    with open(temp_path, 'w', encoding='utf8') as file_handle:
+        json.dump(index, file_handle, indent=2)
+
+    temp_path.replace(index_path)
+
+
+def load_device(export_path, device, mmap_mode='r'):
+    # Memory-mapped timestamps and values of one exported device
+    index = load_index(export_path)
+    directory = Path(export_path).joinpath(index['devices'][device]['path'])
+    timestamps = np.load(directory.joinpath('timestamps.npy'),
+                         mmap_mode=mmap_mode)
+    values = np.load(directory.joinpath('values.npy'), mmap_mode=mmap_mode)
+
+    return timestamps, values
+
+
+def time_slice(timestamps, values, start_us, end_us):
+    # Views of the rows in [start_us, end_us), nothing is copied
+    start, end = np.searchsorted(timestamps, [start_us, end_us])
+
+    return timestamps[start:end], values[start:end]
+
+
+def _export_device(export_path, index, device, data_frame, start_us, end_us):
+    order = np.argsort(data_frame['Timestamps'].to_numpy(), kind='stable')
+    timestamps = data_frame['Timestamps'].to_numpy()[order]
+    values = data_frame['Data'].to_numpy()[order]
+
+    if values.dtype == object:
+        logger.warning('Skipping %s, its values are not numeric.', device)
+        return
+
+    entry = index['devices'].get(device)
+    lower = start_us if entry is None else max(start_us, entry['last'] + 1)
+    keep = (timestamps >= lower) & (timestamps < end_us)
+    timestamps = timestamps[keep]
+    values = values[keep]
+
+    if len(timestamps) == 0:
+        return
+
+    path = f'devices/{device_directory(device)}' if entry is None \
+        else entry['path']
+    directory = Path(export_path).joinpath(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    timestamps_path = directory.joinpath('timestamps.npy')
+    values_path = directory.joinpath('values.npy')
+    # The arrays are appended one after the other and the index written
+    # later, rows an interrupted export appended after it are dropped
+    rows = 0 if entry is None else entry['rows']
+    truncate_npy(timestamps_path, rows)
+    stored_dtype = truncate_npy(values_path, rows)
+
+    # Values that don't fit the type of the earlier ones widen it, e.g.
+    # floats after integers
+    dtype = values.dtype if stored_dtype is None else \
+        np.result_type(stored_dtype, values.dtype)
+
+    if stored_dtype is not None and dtype != stored_dtype:
+        logger.info('Widening the values of %s from %s to %s', device,
+                    stored_dtype, dtype)
+        widen_npy(values_path, dtype)
+
+    append_npy(timestamps_path, timestamps)
+    rows = append_npy(values_path, values)
+    index['devices'][device] = {
+        'path': path,
+        'rows': rows,
+        'first': int(timestamps[0]) if entry is None else entry['first'],
+        'last': int(timestamps[-1]),
+        'dtype': str(dtype)
+    }
+
+
+def export_range(output_path, export_path, start_time, end_time, devices=None):
+    # Extends the export with the cataloged files overlapping the range.
+    # Files are taken in time order, a new file starting before the end of
+    # the export is skipped because the arrays must stay sorted.
+    Path(export_path).mkdir(parents=True, exist_ok=True)
+    index = load_index(export_path)
+    exported_files = set(index['files'])
+    start_us = _local_to_utc_us(start_time)
+    end_us = _local_to_utc_us(end_time)
+
+    connection = nanny.open_catalog(output_path)
+    rows = catalog.files_between(connection, start_time, end_time)
+    connection.close()
+
+    for row in rows:
+        if row['path'] in exported_files:
+            continue
+
+        if index['end'] is not None and row['start'] < index['end']:
+            logger.warning(
+                'Skipping %s, it starts before the end of the export %s.',
+                row['path'],
+                index['end']
+            )
+            continue
+
+        logger.info('Exporting %s', row['path'])
+
+        with storage.open_store(
+            Path(output_path).joinpath(row['path']),
+            mode='r'
+        ) as store:
+            for key in store.keys():
+                device = key.lstrip('/')
+
+                if devices and device not in devices:
+                    continue
+
+                _export_device(
+                    export_path,
+                    index,
+                    device,
+                    store.select(key),
+                    start_us,
+                    end_us
+                )
+
+        # A file cut by the end of the range is read again next time, the
+        # rows already exported are skipped by their timestamps
+        if row['end'] <= end_time.isoformat():
+            index['files'].append(row['path'])
+            index['end'] = row['end']
+
+        # Rows are on disk, record them before the next file
+        _write_index(export_path, index)
+
+    return index
+
+
+def export(**kwargs):
+    config = nanny.load_config()
+    output_path = nanny.get_output_path(kwargs, config) or Path('.')
+    export_path = kwargs.get('export-path', kwargs.get('export_path'))
+    devices = kwargs.get('devices', None)
+    start_time = kwargs.get('start-time', kwargs.get('start_time', None))
+    end_time = kwargs.get('end-time', kwargs.get('end_time', None))
+
+    connection = nanny.open_catalog(output_path)
+
+    if start_time is None:
+        first_file = connection.execute(
+            'SELECT start FROM files ORDER BY start LIMIT 1'
+        ).fetchone()
+        start_time = isodate.parse_datetime(first_file['start']) \
+            if first_file else datetime.now()
+
+    if end_time is None:
+        most_recent_file = catalog.latest_file(connection)
+        end_time = isodate.parse_datetime(most_recent_file['end']) \
+            if most_recent_file else datetime.now()
+
+    connection.close()
+
+    index = export_range(output_path, export_path, start_time, end_time,
+                         devices)
+    print(f'Exported {len(index["files"])} files with '
+          f'{len(index["devices"])} devices to {export_path}')
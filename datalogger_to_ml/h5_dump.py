@@ -1,16 +1,169 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from fnmatch import fnmatchcase
+import numpy as np
 import pandas as pd
-from . import helper_methods
+from . import storage
+
+# Rows read at a time, memory stays bounded by one chunk per key
+CHUNKSIZE = 100000
+
+
+def select_keys(keys, patterns=None):
+    # Keys matching any of the glob patterns, with or without the leading /
+    if not patterns:
+        return list(keys)
+
+    return [
+        key for key in keys
+        if any(fnmatchcase(key, pattern)
+               or fnmatchcase(key.lstrip('/'), pattern)
+               for pattern in patterns)
+    ]
+
+
+def _iter_head(store, key, rows, chunksize):
+    for chunk in store.iter_chunks(key, chunksize):
+        if rows <= 0:
+            return
+
+        yield chunk.iloc[:rows]
+        rows -= len(chunk)
+
+
+def _write_chunks(file_handle, chunks, header=True):
+    for chunk in chunks:
+        file_handle.write(chunk.to_string(header=header))
+        file_handle.write('\n')
+        header = False
+
+
+def dump_key(file_handle, store, key, head=None, tail=None,
+             chunksize=CHUNKSIZE):
+    nrows = store.nrows(key)
+    file_handle.write(f'{key}: {nrows} rows\n')
+
+    if head is None and tail is None:
+        _write_chunks(file_handle, store.iter_chunks(key, chunksize))
+        return
+
+    head = head or 0
+    tail = tail or 0
+
+    if head + tail >= nrows:
+        _write_chunks(file_handle, store.iter_chunks(key, chunksize))
+        return
+
+    _write_chunks(file_handle, _iter_head(store, key, head, chunksize))
+
+    if tail:
+        if head:
+            file_handle.write('...\n')
+
+        _write_chunks(file_handle, [store.select(key, start=nrows - tail)],
+                      header=not head)
+
+
+def print_key(file_handle, store, key):
+    # The key and its frame as pandas prints it, like dump always did. A
+    # long table is cut to its first and last rows, only those are read.
+    file_handle.write(f'{key}:\n')
+    nrows = store.nrows(key)
+    max_rows = pd.get_option('display.max_rows')
+
+    if not max_rows or nrows <= max_rows:
+        file_handle.write(f'{store.select(key)}\n')
+        return
+
+    half = max(1, min(pd.get_option('display.min_rows') or max_rows,
+                      max_rows) // 2)
+    head = store.select(key, start=0, stop=half)
+    tail = store.select(key, start=nrows - half)
+    # A row in between is cut like the rows that weren't read
+    data_frame = pd.concat([head, head.iloc[-1:], tail])
+    text = data_frame.to_string(max_rows=2 * half, min_rows=2 * half)
+    file_handle.write(
+        f'{text}\n\n[{nrows} rows x {len(data_frame.columns)} columns]\n'
+    )
+
+
+def key_stats(store, key, chunksize=CHUNKSIZE):
+    # Count, min, max and mean of Data and the first and last timestamp in
+    # one chunked pass. NaN is skipped, non-numeric data only gets a count
+    # and timestamps.
+    stats = {
+        'count': 0,
+        'min': np.nan,
+        'max': np.nan,
+        'mean': np.nan,
+        'first': None,
+        'last': None
+    }
+    total = 0.0
+    values_count = 0
+    numeric = True
+
+    for chunk in store.iter_chunks(key, chunksize):
+        if len(chunk) == 0:
+            continue
+
+        timestamps = chunk['Timestamps'].to_numpy()
+        data = chunk['Data'].to_numpy()
+        stats['count'] += len(chunk)
+        first = timestamps.min()
+        last = timestamps.max()
+        stats['first'] = first if stats['first'] is None \
+            else min(stats['first'], first)
+        stats['last'] = last if stats['last'] is None \
+            else max(stats['last'], last)
+        numeric = numeric and np.issubdtype(data.dtype, np.number)
+
+        if numeric:
+            if np.issubdtype(data.dtype, np.floating):
+                data = data[~np.isnan(data)]
+
+            if len(data) > 0:
+                stats['min'] = np.nanmin([stats['min'], data.min()])
+                stats['max'] = np.nanmax([stats['max'], data.max()])
+                total += data.sum(dtype=np.float64)
+                values_count += len(data)
+
+    if numeric and values_count > 0:
+        stats['mean'] = total / values_count
+    else:
+        stats['min'] = stats['max'] = np.nan
+
+    return stats
 
 
 def dump(**kwargs):
-    with pd.HDFStore(kwargs.get('input-file', kwargs.get('input_file')), 'r') as hdf:
-        output = []
+    input_file = kwargs.get('input-file', kwargs.get('input_file'))
+    output_file = kwargs.get('output-file', kwargs.get('output_file'))
+    patterns = kwargs.get('keys', None)
+    head = kwargs.get('head', None)
+    tail = kwargs.get('tail', None)
+
+    with storage.open_store(input_file, 'r') as store, \
+            open(output_file, 'w+', encoding='utf8') as file_handle:
+        keys = select_keys(store.keys(), patterns)
+
+        if kwargs.get('stats', False):
+            # One small row per key, never the data itself
+            stats = pd.DataFrame.from_dict(
+                {key: key_stats(store, key) for key in keys},
+                orient='index',
+                columns=['count', 'min', 'max', 'mean', 'first', 'last']
+            )
+            file_handle.write(stats.to_string() + '\n')
+            return
+
+        # Every row only when asked for with --keys, --head or --tail
+        if not patterns and head is None and tail is None:
+            for key in keys:
+                print_key(file_handle, store, key)
 
-        for key in list(hdf.keys()):
-            data_frame = hdf[key]
-            output.append(f'{key}:\n{data_frame}')
+            return
 
-        helper_methods.write_output(kwargs.get('output-file', kwargs.get('output_file')), output)
+        for key in keys:
+            dump_key(file_handle, store, key, head, tail)
@@ -1,27 +1,232 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from glob import glob
-from pathlib import PurePath
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import json
+import os
+import sys
+from . import catalog
+from . import storage
+
+# Files that passed, by size and mtime, so unchanged files aren't read again
+CACHE_FILENAME = '.validation.json'
+CHUNKSIZE = 100000
+
+
+def _cataloged(validate_path):
+    # Rows and checksums recorded by nanny, without creating a catalog
+    if not catalog.catalog_path(validate_path).exists():
+        return {}
+
+    connection = catalog.connect(validate_path)
+    expected = {
+        row['path']: {'checksum': row['checksum'], 'rows': {}}
+        for row in connection.execute('SELECT path, checksum FROM files')
+    }
+
+    for row in connection.execute('SELECT * FROM device_rows'):
+        if row['path'] in expected:
+            expected[row['path']]['rows'][row['device']] = row['rows']
+
+    connection.close()
+
+    return expected
+
+
+def check_file(path, expected=None, chunksize=CHUNKSIZE):
+    # Reads every key of a file chunk by chunk. Returns a report entry,
+    # `errors` is empty when the file is valid.
+    stat = os.stat(path)
+    result = {
+        'path': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'status': 'ok',
+        'rows': {},
+        'errors': []
+    }
+    errors = result['errors']
+    devices = None
+
+    try:
+        with storage.open_store(path, mode='r') as store:
+            keys = store.keys()
+            devices = {key.lstrip('/') for key in keys}
+
+            if len(keys) == 0:
+                errors.append('File is empty')
+
+            for key in keys:
+                device = key.lstrip('/')
+                rows = 0
+                last_timestamp = None
+
+                try:
+                    for chunk in store.iter_chunks(key, chunksize):
+                        timestamps = chunk['Timestamps'].to_numpy()
+
+                        if len(timestamps) == 0:
+                            continue
+
+                        if (last_timestamp is not None
+                                and timestamps[0] < last_timestamp) or \
+                                (timestamps[1:] < timestamps[:-1]).any():
+                            errors.append(
+                                f'{device}: timestamps are not monotonic'
+                            )
+                            last_timestamp = None
+                            rows = None
+                            break
+
+                        last_timestamp = timestamps[-1]
+                        rows += len(timestamps)
+                except Exception as error:  # pylint: disable=broad-except
+                    errors.append(f'{device}: could not be read: {error}')
+                    continue
+
+                if rows is None:
+                    continue
+
+                result['rows'][device] = rows
+
+                if rows != store.nrows(key):
+                    errors.append(
+                        f'{device}: read {rows} rows, '
+                        f'the table has {store.nrows(key)}'
+                    )
+    except Exception as error:  # pylint: disable=broad-except
+        errors.append(f'Could not open: {error}')
+
+    if expected is not None and devices is not None:
+        # Devices that couldn't be read already have an error
+        for device in sorted(set(expected['rows']) - devices):
+            errors.append(f'{device}: missing, the catalog has it')
+
+        for device in sorted(devices - set(expected['rows'])):
+            errors.append(f'{device}: not in the catalog')
+
+        for device, rows in expected['rows'].items():
+            if device in result['rows'] and result['rows'][device] != rows:
+                errors.append(
+                    f'{device}: read {result["rows"][device]} rows, '
+                    f'the catalog has {rows}'
+                )
+
+        if not errors and expected['checksum'] and \
+                catalog.file_checksum(path) != expected['checksum']:
+            errors.append('Checksum differs from the catalog')
+
+    if errors:
+        result['status'] = 'failed'
+
+    return result
+
+
+def _load_cache(validate_path):
+    try:
+        with open(Path(validate_path).joinpath(CACHE_FILENAME),
+                  encoding='utf8') as file_handle:
+            return json.load(file_handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(validate_path, cache):
+    cache_path = Path(validate_path).joinpath(CACHE_FILENAME)
+    temp_path = cache_path.with_name(f'{cache_path.name}.tmp')
+
+    with open(temp_path, 'w', encoding='utf8') as file_handle:
+        json.dump(cache, file_handle)
+
+    temp_path.replace(cache_path)
+
+
+def validate_tree(validate_path, workers=None, full=False):
+    # Validates every output file under validate_path. Files unchanged
+    # since they last passed are skipped unless `full` is set.
+    validate_path = Path(validate_path).resolve()
+    cache = {} if full else _load_cache(validate_path)
+    expected = _cataloged(validate_path)
+    skipped = []
+    to_check = []
+
+    for file in storage.find_outputs(validate_path, recursive=True):
+        relative_path = Path(file).relative_to(validate_path).as_posix()
+        stat = os.stat(file)
+        cached = cache.get(relative_path)
+
+        if cached is not None and cached['size'] == stat.st_size and \
+                cached['mtime_ns'] == stat.st_mtime_ns:
+            skipped.append({
+                'path': file,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'status': 'skipped',
+                'rows': {},
+                'errors': []
+            })
+        else:
+            to_check.append((file, relative_path))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            check_file,
+            [file for file, _ in to_check],
+            [expected.get(relative_path) for _, relative_path in to_check]
+        ))
+
+    for (_, relative_path), result in zip(to_check, results):
+        if result['status'] == 'ok':
+            cache[relative_path] = {
+                'size': result['size'],
+                'mtime_ns': result['mtime_ns']
+            }
+        else:
+            cache.pop(relative_path, None)
+
+    _write_cache(validate_path, cache)
+
+    files = sorted(results + skipped, key=lambda result: result['path'])
+
+    return {
+        'path': str(validate_path),
+        'checked': len(results),
+        'skipped': len(skipped),
+        'failed': sum(result['status'] == 'failed' for result in results),
+        'files': files
+    }
 
 
 def validate(**kwargs):
-    h5_outputs = PurePath(
-        kwargs.get('validate-path').resolve()
-    ).joinpath('*.h5')
-    # Glob allows the use of the * wildcard
-    files = glob(str(h5_outputs))
-
-    if len(files) > 0:
-        for file in files:
-            try:
-                with pd.HDFStore(file, mode='r') as hdf:
-                    if len(hdf) > 0:
-                        print(f'{file} was successfully read')
-                    else:
-                        print(f'{file} is empty')
-            except OSError as error:
-                print(f'Could not open {file} with error: {error}')
-    else:
+    validate_path = kwargs.get('validate-path').resolve()
+    report_path = kwargs.get('report', None)
+    report = validate_tree(
+        validate_path,
+        kwargs.get('workers', None),
+        kwargs.get('full', False)
+    )
+
+    # `--report -` prints only the JSON report
+    if str(report_path) == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+        return report
+
+    if len(report['files']) == 0:
         print('No files found to validate')
+
+    for result in report['files']:
+        if result['status'] == 'ok':
+            print(f'{result["path"]} was successfully read')
+        elif result['status'] == 'skipped':
+            print(f'{result["path"]} is unchanged since it was validated')
+        else:
+            print(f'{result["path"]} failed: {"; ".join(result["errors"])}')
+
+    if report_path is not None:
+        with open(report_path, 'w', encoding='utf8') as file_handle:
+            json.dump(report, file_handle, indent=2)
+
+    return report
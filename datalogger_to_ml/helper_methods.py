@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
+from . import device_list
 
 
 def write_output(path, output):
@@ -11,20 +11,15 @@ def write_output(path, output):
 
 
 def get_latest_device_list(output_filename=None):
-    url = ('https://github.com/fermi-ad/linac-logger-device-cleaner/'
-           'releases/latest/download/linac_logger_drf_requests.txt')
-    req = requests.get(url, allow_redirects=False)
+    provider = device_list.DeviceListProvider()
+    latest_device_list = provider.device_list()
 
-    if req.status_code == requests.codes.get('ok'):
-        device_list = [line.strip()  # Trim whitespace
-                       for line in req.text.split('\n')
-                       if line]  # Remove blank lines
+    if latest_device_list is None:
+        print(f'Could not fetch {provider.file_name}')
 
-        if output_filename:
-            write_output(output_filename, device_list)
+        return None
 
-        return device_list
+    if output_filename:
+        write_output(output_filename, latest_device_list)
 
-    print(f'Could not fetch {url}')
-
-    return None
+    return latest_device_list
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Where output files go and what they are called. Kept free of the other
+# modules of the package, so nanny, reader and compact can all use it.
+
+from pathlib import Path
+import logging
+import isodate
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Temporary files are written here, inside the output path by default
+STAGING_DIRECTORY = '.staging'
+# Daily and monthly archives made by `compact`, by month
+ARCHIVE_DIRECTORY = 'archive'
+
+
+def name_output_file(start_time, duration=None):
+    start_time_str = isodate.datetime_isoformat(start_time)
+    if duration is not None:
+        duration_str = isodate.duration_isoformat(duration)
+        output = (start_time_str + duration_str)\
+            .replace('-', '')\
+            .replace(':', '')
+        return output
+
+    output = (start_time_str).replace('-', '').replace(':', '')
+    return output
+
+
+def create_structured_path(outputs_directory, start_time):
+    month_directory = f'{start_time.year}{start_time.month:02d}'  # YYYYMM
+    day_directory = f'{start_time.day:02d}'  # DD
+    structured_path = Path(outputs_directory).joinpath(
+        month_directory,
+        day_directory
+    )
+
+    return structured_path
+
+
+def create_archive_path(outputs_directory, start_time):
+    month_directory = f'{start_time.year}{start_time.month:02d}'  # YYYYMM
+
+    return Path(outputs_directory).joinpath(ARCHIVE_DIRECTORY, month_directory)
+
+
+def get_output_filename(
+    start_time,
+    duration,
+    device_list_version,
+    output_format=None
+):
+    iso_datetime_duration = name_output_file(start_time, duration)
+    logger.debug('Named the output file: %s', iso_datetime_duration)
+    request_list_version = device_list_version.replace('.', '_')
+    extension = storage.store_class(output_format).extension
+
+    return f'{iso_datetime_duration}-{request_list_version}{extension}'
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from glob import glob
 from pathlib import Path
-from pathlib import PurePath
 from os import makedirs
 from datetime import datetime
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+import math
 import sys
 import shutil
 import logging
@@ -13,10 +14,17 @@ from logging.handlers import RotatingFileHandler
 import signal
 from typing import Any
 import isodate
-import requests
+import pandas as pd
 import yaml
+from . import align
+from . import catalog
+from . import device_list
+from . import storage
 from . import dpm_data
-
+from .layout import STAGING_DIRECTORY
+from .layout import create_structured_path
+from .layout import get_output_filename
+from .layout import name_output_file
 
 logger = logging.getLogger(__name__)
 
@@ -69,30 +77,13 @@ def write_output(file, output):
             file_handle.write(line + '\n')
 
 
-def get_latest_device_list_version(owner, repo):
-    url = f'https://api.github.com/repos/{owner}/{repo}/releases/latest'
-    response = requests.get(url, allow_redirects=False)
-
-    if response.status_code == requests.codes.get('ok'):
-        return response.json()['name']
-
-    return None
-
-
-def get_latest_device_list(owner, repo, file_name):
-    url = (f'https://github.com/{owner}/{repo}/'
-           f'releases/latest/download/{file_name}')
-    response = requests.get(url, allow_redirects=False)
-
-    if response.status_code == requests.codes.get('ok'):
-        return [line.strip()  # Trim whitespace
-                for line in response.text.split('\n')
-                if line]  # Remove blank lines
-
-    return None
-
-
 def parse_iso(date_time_duration_str):
+    # `--start-time` arrives parsed already
+    if isinstance(date_time_duration_str, datetime):
+        date_time_duration_str = isodate.datetime_isoformat(
+            date_time_duration_str
+        )
+
     try:
         date_time_str, duration_str = date_time_duration_str.split('P')
     except ValueError:
@@ -134,6 +125,10 @@ def get_duration_config(args, config):
             logger.debug('Config does not contain "duration".')
             return None
 
+    # Callers fall back to the file or a default duration
+    if duration is None:
+        return None
+
     return isodate.parse_duration(f'P{duration}')
 
 # Paths for `get_start_time`:
@@ -143,33 +138,60 @@ def get_duration_config(args, config):
 #     Time constraints with files
 
 
+def open_catalog(output_path):
+    # The first run over an existing tree builds the catalog from a scan
+    if not catalog.catalog_path(output_path).exists():
+        logger.info('No catalog in %s, scanning output files.', output_path)
+        makedirs(output_path, exist_ok=True)
+
+        return catalog.rebuild(output_path)
+
+    return catalog.connect(output_path)
+
+
+def rebuild_catalog(**kwargs):
+    config = load_config()
+    outputs_directory = get_output_path(kwargs, config) or Path('.')
+    connection = catalog.rebuild(outputs_directory)
+    count = connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    connection.close()
+    print(f'Cataloged {count} files in {outputs_directory}')
+
+
+def align_to_grid(start_time, duration, grid_start):
+    # The part of the window from start_time up to the next multiple of
+    # duration after grid_start
+    if grid_start is None or start_time <= grid_start or \
+            not isinstance(duration, timedelta):
+        return duration
+
+    offset = (start_time - grid_start) % duration
+
+    return duration - offset if offset else duration
+
+
 def get_start_time(output_path, args, config):
     start_time, _ = get_start_time_config(args, config)
+    grid_start = start_time
     duration = get_duration_config(args, config)
 
-    h5_outputs = output_path.joinpath('**', '*.h5')
-    # Glob allows the use of the * wildcard
-    file_paths = glob(str(h5_outputs), recursive=True)
-    files = list(map(lambda path: PurePath(path).name, file_paths))
-    # Sort modifies the list in place
-    files.sort()
+    connection = open_catalog(output_path)
+    most_recent_file = catalog.latest_file(connection)
+    # Archives span a day or a month, windows keep the duration of the
+    # newest file nanny wrote
+    most_recent_window = catalog.latest_file(connection, archives=False)
+    connection.close()
 
-    while len(files) > 0:
-        try:
-            most_recent_filename = PurePath(files[-1]).name
-            date_time_duration_str = most_recent_filename.split('-')[0]
-            file_start_time, file_duration = parse_iso(date_time_duration_str)
-            logger.debug('Parsed duration: %s', file_duration)
-            break
-        except ValueError:
-            logger.debug(
-                'Ignoring %s for calculating start time.',
-                files[-1]
-            )
-            files.pop()
+    if most_recent_file is not None:
+        file_start_time, file_duration = catalog.window_of(most_recent_file)
+        logger.debug(
+            'Most recent file %s, parsed duration: %s',
+            most_recent_file['path'],
+            file_duration
+        )
 
     try:
-        if file_start_time > start_time:
+        if file_start_time >= start_time:
             start_time = file_start_time + file_duration
     except NameError:
         if start_time is None:
@@ -183,13 +205,18 @@ def get_start_time(output_path, args, config):
     # This means the config didn't have a duration specified.
     if duration is None:
         # First try to get duration from file
-        try:
-            duration = file_duration
-        except NameError:
-            logger.debug('`file_duration` is undefined')
+        if most_recent_window is not None:
+            _, duration = catalog.window_of(most_recent_window)
+        else:
+            logger.debug('No file to take the duration from')
             # Otherwise, get the duration from the `start_time` or default.
             _, duration = parse_iso(start_time)
 
+    # After a shorter file, e.g. part of a window fetched in sub-windows,
+    # the window ends at the next boundary of the configured grid so the
+    # ones after it line up again
+    duration = align_to_grid(start_time, duration, grid_start)
+
     end_time = start_time + duration
     logger.debug('Calculated end time: %s', end_time)
     logger.debug('Start time, end time, and duration are %s, %s, and %s',
@@ -198,30 +225,6 @@ def get_start_time(output_path, args, config):
     return start_time, duration
 
 
-def name_output_file(start_time, duration=None):
-    start_time_str = isodate.datetime_isoformat(start_time)
-    if duration is not None:
-        duration_str = isodate.duration_isoformat(duration)
-        output = (start_time_str + duration_str)\
-            .replace('-', '')\
-            .replace(':', '')
-        return output
-
-    output = (start_time_str).replace('-', '').replace(':', '')
-    return output
-
-
-def create_structured_path(outputs_directory, start_time):
-    month_directory = f'{start_time.year}{start_time.month:02d}'  # YYYYMM
-    day_directory = f'{start_time.day:02d}'  # DD
-    structured_path = Path(outputs_directory).joinpath(
-        month_directory,
-        day_directory
-    )
-
-    return structured_path
-
-
 def load_config():
     try:
         with open('config.yaml', encoding='utf8') as file_handle:
@@ -265,43 +268,284 @@ def get_output_path(args, config):
     return outputs_directory
 
 
-def handle_device_list_version(config):
-    device_list_version = None
+def get_staging_path(args, config, outputs_directory):
+    # Outputs are renamed from here into the output tree, which is only
+    # atomic and free when both are on the same filesystem
+    staging_directory = args.get('staging', None)
+
+    if staging_directory is None and 'output' in config.keys():
+        staging_directory = config['output'].get('staging', None)
+
+    if staging_directory is None:
+        staging_directory = Path(outputs_directory).joinpath(
+            STAGING_DIRECTORY
+        )
+
+    staging_directory = Path(staging_directory)
+    makedirs(staging_directory, exist_ok=True)
+
+    return staging_directory
+
+
+def get_buffer_config(args, config):
+    # Only pass thresholds that were set so dpm_data defaults apply
+    buffer_config = {}
+    buffer_settings = (
+        ('device_flush_bytes', 'device-flush-bytes', 'device_bytes'),
+        ('flush_bytes', 'flush-bytes', 'total_bytes')
+    )
+
+    for keyword, cli_key, config_key in buffer_settings:
+        # Try to get the keyword argument from CLI, first
+        value = args.get(cli_key, args.get(keyword, None))
+
+        if value is None and 'buffer' in config.keys():
+            value = config['buffer'].get(config_key, None)
+
+        if value is not None:
+            buffer_config[keyword] = int(value)
+
+    return buffer_config
+
 
-    # Download latest device request list if it doesn't exist
-    # This means that the file must be deleted to get a newer version
+def get_storage_config(args, config):
+    # Compression and chunking of the output files
+    storage_config = {}
+    storage_settings = (
+        ('output_format', 'output-format', str),
+        ('complib', 'complib', str),
+        ('complevel', 'complevel', int),
+        ('expected_rows', 'expected-rows', int),
+        ('chunkshape', 'chunkshape', int)
+    )
+
+    for keyword, cli_key, cast in storage_settings:
+        # Try to get the keyword argument from CLI, first
+        value = args.get(cli_key, args.get(keyword, None))
+
+        if value is None and 'output' in config.keys():
+            value = config['output'].get(keyword.replace('output_', ''), None)
+
+        if value is not None:
+            storage_config[keyword] = cast(value)
+
+    return storage_config
+
+
+def get_align_config(args, config):
+    # Returns the settings of the aligned companion stage, or None
+    period = args.get('align-period', args.get('align_period', None))
+    mode = args.get('align-mode', args.get('align_mode', None))
+    devices = None
+
+    if 'align' in config.keys():
+        period = period or config['align'].get('period', None)
+        mode = mode or config['align'].get('mode', None)
+        devices = config['align'].get('devices', None)
+
+    if period is None:
+        return None
+
+    return {
+        'period': isodate.parse_duration(f'P{period}'),
+        'mode': mode or 'last',
+        'devices': devices
+    }
+
+
+def run_align_stage(output_path_and_filename, align_config):
+    start_time, duration, _ = catalog.parse_output_filename(
+        output_path_and_filename
+    )
+
+    # A failed companion shouldn't stop data collection
     try:
-        device_list_version = get_latest_device_list_version(
-            config['github']['owner'],
-            config['github']['repo']
+        align.align_file(
+            output_path_and_filename,
+            start_time,
+            duration,
+            align_config['period'],
+            align_config['mode'],
+            align_config['devices']
+        )
+    except Exception:
+        logger.exception(
+            'Could not write aligned companion of %s',
+            output_path_and_filename
         )
-    except KeyError:
-        logger.exception('GitHub config does not contain "owner" or "repo".')
 
-    # get_latest_device_list_version returns None if th fetch doesn't work
-    if device_list_version is None:
-        logger.error(
-            'Could not fetch latest device list version. Exiting.'
+
+def get_metrics_config(args, config):
+    metrics_config = {}
+    metrics_settings = (
+        ('metrics_file', 'metrics-file', 'prom'),
+        ('metrics_log', 'metrics-log', 'log')
+    )
+
+    for keyword, cli_key, config_key in metrics_settings:
+        # Try to get the keyword argument from CLI, first
+        value = args.get(cli_key, args.get(keyword, None))
+
+        if value is None and 'metrics' in config.keys():
+            value = config['metrics'].get(config_key, None)
+
+        if value is not None:
+            metrics_config[keyword] = str(value)
+
+    return metrics_config
+
+
+def get_profile_config(args):
+    # Profiling is for one-off runs, so it's only set from the CLI
+    profile_config = {}
+
+    if args.get('profile', False):
+        profile_config['profile'] = True
+        profile_config['profile_memory'] = args.get(
+            'profile-memory',
+            args.get('profile_memory', False)
+        )
+        profile_output = args.get(
+            'profile-output',
+            args.get('profile_output', None)
         )
-        sys.exit('Could not fetch latest device list version from GitHub.')
-    else:
-        logger.debug('Latest device list version identified successfully.')
 
-    return device_list_version
+        if profile_output is not None:
+            profile_config['profile_output'] = str(profile_output)
 
+    return profile_config
+
+
+def get_dpm_config(args, config):
+    dpm_config = {}
+    # Try to get the keyword argument from CLI, first
+    shards = args.get('shards', None)
+    dpm_nodes = args.get('dpm-nodes', args.get('dpm_nodes', None))
+
+    if 'dpm' in config.keys():
+        if shards is None:
+            shards = config['dpm'].get('shards', None)
+
+        if dpm_nodes is None:
+            dpm_nodes = config['dpm'].get('nodes', None)
+
+    # `simulator:` with or without settings replaces DPM, for benchmarks
+    simulator_settings = True if args.get('simulate', False) else None
+
+    if 'dpm' in config.keys() and \
+            config['dpm'].get('simulator', None) is not False and \
+            'simulator' in config['dpm'].keys():
+        simulator_settings = config['dpm']['simulator'] or True
+
+    if simulator_settings is not None:
+        dpm_config['simulator'] = simulator_settings
+
+    record = args.get('record', None)
+
+    if record is None and 'dpm' in config.keys():
+        record = config['dpm'].get('record', None)
+
+    if record is not None:
+        # One log per window, named after its file
+        makedirs(record, exist_ok=True)
+        dpm_config['record'] = str(Path(record).resolve())
+
+    if shards is not None:
+        dpm_config['shards'] = int(shards)
+
+    for keyword, cli_key, cast in (
+        ('retries', 'retries', int),
+        ('retry_backoff', 'retry-backoff', float)
+    ):
+        value = args.get(cli_key, args.get(keyword, None))
+
+        if value is None and 'dpm' in config.keys():
+            value = config['dpm'].get(keyword, None)
+
+        if value is not None:
+            dpm_config[keyword] = cast(value)
+
+    if dpm_nodes:
+        dpm_config['dpm_nodes'] = list(dpm_nodes)
+
+    return dpm_config
+
+
+def get_balance_config(args, config):
+    # The device cost shards are balanced by, or None for contiguous
+    # shards
+    balance = args.get('balance', None)
+
+    if balance is None and 'dpm' in config.keys():
+        balance = config['dpm'].get('balance', None)
+
+    balance = balance or 'rows'
+
+    if balance == 'none':
+        return None
+
+    if balance not in catalog.COSTS:
+        logger.error('Unknown balance cost %s, using "rows".', balance)
+        balance = 'rows'
+
+    return balance
+
+
+def with_device_costs(outputs_directory, dpm_options, balance):
+    # Adds the cost history to the options of sharded acquisitions
+    shards = max(
+        dpm_options.get('shards', 1),
+        len(dpm_options.get('dpm_nodes', None) or [])
+    )
+
+    if balance is None or shards < 2:
+        return dpm_options
+
+    connection = open_catalog(outputs_directory)
+    costs = catalog.device_costs(connection, balance)
+    connection.close()
+
+    if not costs:
+        return dpm_options
+
+    return dict(dpm_options, device_costs=costs)
+
+
+def get_device_list_provider(config):
+    github_config = config['github']
+    ttl = github_config.get('ttl', None)
 
-def handle_device_list(config, requests_list):
     try:
-        # This always overwrites the file at DRF_REQUESTS_LIST
-        latest_device_list = get_latest_device_list(
-            config['github']['owner'],
-            config['github']['repo'],
-            config['github']['file']
+        return device_list.DeviceListProvider(
+            github_config['owner'],
+            github_config['repo'],
+            github_config['file'],
+            cache_directory=github_config.get('cache',
+                                              device_list.DEFAULT_CACHE),
+            ttl=(isodate.parse_duration(f'P{ttl}') if ttl
+                 else device_list.DEFAULT_TTL)
         )
     except KeyError:
         logger.error(
             'GitHub config does not contain "owner", "repo", or "file".'
         )
+        sys.exit('GitHub config does not contain "owner", "repo", or "file".')
+
+
+def handle_device_list(config, requests_list):
+    # Answered from the on-disk cache when the release was checked within
+    # the TTL or GitHub can't be reached
+    device_list_version, latest_device_list = get_device_list_provider(
+        config
+    ).fetch()
+
+    if device_list_version is None:
+        logger.error(
+            'Could not fetch latest device list version. Exiting.'
+        )
+        sys.exit('Could not fetch latest device list version from GitHub.')
+    else:
+        logger.debug('Latest device list version identified successfully.')
 
     if latest_device_list is None:
         logger.error('Could not fetch latest device list. Exiting.')
@@ -313,6 +557,8 @@ def handle_device_list(config, requests_list):
             requests_list
         )
 
+    return device_list_version
+
 
 def get_request_list(args, config):
     # Try to get the keyword argument from CLI, first
@@ -326,8 +572,7 @@ def get_request_list(args, config):
     )
 
     if 'github' in config.keys():
-        device_list_version = handle_device_list_version(config)
-        handle_device_list(config, requests_list)
+        device_list_version = handle_device_list(config, requests_list)
     elif 'local' in config.keys():
         try:
             requests_list = config['local']['file']
@@ -338,8 +583,567 @@ def get_request_list(args, config):
     return requests_list, device_list_version
 
 
+def get_backfill_workers(args, config):
+    # Try to get the keyword argument from CLI, first
+    workers = args.get('backfill-workers', args.get('backfill_workers', None))
+
+    # Determine input to use for backfill configuration
+    if workers is None and 'backfill' in config.keys():
+        try:
+            workers = config['backfill']['workers']
+        except KeyError:
+            logger.error('Backfill config does not contain "workers".')
+
+    return max(1, int(workers or 1))
+
+
+def get_adaptive_config(args, config):
+    # Returns the limits windows are split by, or None to fetch whole
+    # windows
+    adaptive_config = dict(config.get('adaptive', None) or {})
+    adaptive_settings = (
+        ('max_rows', 'max-window-rows', int),
+        ('max_bytes', 'max-window-bytes', int)
+    )
+
+    for keyword, cli_key, cast in adaptive_settings:
+        # Try to get the keyword argument from CLI, first
+        value = args.get(cli_key, args.get(cli_key.replace('-', '_'), None))
+
+        if value is not None:
+            adaptive_config[keyword] = cast(value)
+
+    if not adaptive_config.get('max_rows') and \
+            not adaptive_config.get('max_bytes'):
+        return None
+
+    return {
+        'max_rows': adaptive_config.get('max_rows'),
+        'max_bytes': adaptive_config.get('max_bytes'),
+        'min_duration': isodate.parse_duration(
+            f'P{adaptive_config.get("min_duration", "T5M")}'
+        ),
+        # Newest files the data rate is estimated from
+        'history': int(adaptive_config.get('history', 6))
+    }
+
+
+def split_duration(duration, parts, min_duration):
+    # The longest duration that divides `duration` into at least `parts`
+    # equal sub-windows of whole seconds, but not below min_duration
+    seconds = int(duration.total_seconds())
+    min_seconds = max(1, int(min_duration.total_seconds()))
+    finest = 1
+
+    for count in range(1, seconds + 1):
+        if seconds % count:
+            continue
+
+        if seconds // count < min_seconds:
+            break
+
+        finest = count
+
+        if count >= parts:
+            break
+
+    return timedelta(seconds=seconds // finest)
+
+
+def plan_fetch_duration(outputs_directory, duration, adaptive_config):
+    # Duration of the sub-windows a window is fetched in, estimated from
+    # the rows and bytes per second of the newest files
+    if adaptive_config is None or not isinstance(duration, timedelta):
+        return duration
+
+    connection = open_catalog(outputs_directory)
+    volume = catalog.recent_volume(connection, adaptive_config['history'])
+    connection.close()
+
+    if volume is None:
+        return duration
+
+    seconds = duration.total_seconds()
+    parts = 1
+
+    for rate, limit in zip(
+        volume,
+        (adaptive_config['max_rows'], adaptive_config['max_bytes'])
+    ):
+        if limit:
+            parts = max(parts, math.ceil(rate * seconds / limit))
+
+    fetch_duration = split_duration(
+        duration,
+        parts,
+        adaptive_config['min_duration']
+    )
+
+    if fetch_duration != duration:
+        logger.info(
+            'Expecting %.0f rows and %.0f bytes, fetching %s windows as %s',
+            volume[0] * seconds,
+            volume[1] * seconds,
+            isodate.duration_isoformat(duration),
+            isodate.duration_isoformat(fetch_duration)
+        )
+
+    return fetch_duration
+
+
+def split_windows(windows, duration, fetch_duration):
+    # Start times of the sub-windows of every window
+    parts = int(duration / fetch_duration)
+
+    return [
+        window_start + part * fetch_duration
+        for window_start in windows
+        for part in range(parts)
+    ]
+
+
+def get_gaps_config(args, config):
+    # Returns the order gaps are filled in, or None to not fill gaps
+    fill_gaps = args.get('fill-gaps', args.get('fill_gaps', None))
+
+    if fill_gaps is None and 'gaps' in config.keys():
+        try:
+            fill_gaps = config['gaps']['fill']
+        except KeyError:
+            logger.error('Gaps config does not contain "fill".')
+
+    if fill_gaps not in (None, 'newest', 'oldest'):
+        logger.error('Unknown gap fill order %s, using "newest".', fill_gaps)
+        fill_gaps = 'newest'
+
+    return fill_gaps
+
+
+def get_gaps(outputs_directory, start_time, end_time, duration):
+    connection = open_catalog(outputs_directory)
+    gaps = catalog.find_gaps(connection, start_time, end_time, duration)
+    connection.close()
+    logger.info(
+        'Found %s missing windows between %s and %s',
+        len(gaps),
+        start_time,
+        end_time
+    )
+
+    return gaps
+
+
+def report_gaps(**kwargs):
+    config = load_config()
+    outputs_directory = get_output_path(kwargs, config) or Path('.')
+    start = kwargs.get('start-time', kwargs.get('start_time', None)) or \
+        config.get('start', None)
+    duration = get_duration_config(kwargs, config)
+
+    # Gaps are only meaningful on the grid nanny writes, so don't guess it
+    if start is None:
+        sys.exit('No start time, pass --start-time or set `start` in the '
+                 'config.')
+
+    if duration is None and 'P' not in str(start):
+        sys.exit('No window duration, pass --duration or set `duration` in '
+                 'the config.')
+
+    start_time, config_duration = get_start_time_config(kwargs, config)
+    duration = duration or config_duration
+    end_time = kwargs.get('end-time', kwargs.get('end_time', None))
+
+    if end_time is None:
+        connection = open_catalog(outputs_directory)
+        most_recent_file = catalog.latest_file(connection)
+        connection.close()
+        end_time = datetime.now()
+
+        if most_recent_file is not None:
+            end_time = isodate.parse_datetime(most_recent_file['end'])
+
+    for gap_start in get_gaps(
+        outputs_directory,
+        start_time,
+        end_time,
+        duration
+    ):
+        print(name_output_file(gap_start, duration))
+
+
+def fill_gaps(
+    outputs_directory,
+    start_time,
+    end_time,
+    duration,
+    order,
+    requests_list,
+    device_list_version,
+    dpm_options,
+    workers,
+    align_config=None,
+    staging_directory=Path('.')
+):
+    gaps = get_gaps(outputs_directory, start_time, end_time, duration)
+
+    if order == 'newest':
+        gaps.reverse()
+
+    if gaps:
+        # Windows are independent, one failure shouldn't stop the rest
+        backfill(
+            gaps,
+            duration,
+            outputs_directory,
+            requests_list,
+            device_list_version,
+            dpm_options,
+            workers,
+            stop_on_error=False,
+            align_config=align_config,
+            staging_directory=staging_directory
+        )
+
+
+def due_windows(start_time, duration, now=None):
+    # Start times of every complete window between start_time and now
+    now = now or datetime.now()
+    windows = []
+
+    while now > start_time + duration:
+        windows.append(start_time)
+        start_time = start_time + duration
+
+    return windows
+
+
+def fetch_window(
+    start_time,
+    duration,
+    requests_list,
+    temp_path_and_filename,
+    dpm_options
+):
+    end_time = start_time + duration
+    logger.info('Calling dpm_data.main...')
+    logger.debug(
+        ('start_date=%s, end_date=%s, device_file=%s, '
+         'output_file=%s, debug=True'),
+        start_time,
+        end_time,
+        requests_list,
+        temp_path_and_filename
+    )
+    # Begin data request and writing to local file. A temporary file left
+    # by an interrupted run is continued with the devices it lacks.
+    device_metrics = dpm_data.get_data(
+        start_date=start_time,
+        end_date=end_time,
+        device_file=requests_list,
+        output_file=temp_path_and_filename,
+        resume=True,
+        collect_metrics=True,
+        debug=True,
+        **dpm_options
+    )
+
+    return temp_path_and_filename, device_metrics
+
+
+def promote_window(
+    temp_path_and_filename,
+    outputs_directory,
+    start_time,
+    align_config=None,
+    device_metrics=None
+):
+    structured_outputs_directory = create_structured_path(
+        outputs_directory,
+        start_time
+    )
+    logger.debug('Structured path is: %s', structured_outputs_directory)
+    output_path_and_filename = Path(
+        structured_outputs_directory
+    ).joinpath(temp_path_and_filename.name)
+    logger.debug(
+        'Output path and filename is: %s',
+        output_path_and_filename
+    )
+
+    # Ensure that the folders exist
+    if not structured_outputs_directory.exists():
+        makedirs(structured_outputs_directory, exist_ok=True)
+
+    # Move the closed file to its final destination
+    storage.publish(temp_path_and_filename, output_path_and_filename)
+
+    connection = catalog.connect(outputs_directory)
+    catalog.record_file(
+        connection,
+        outputs_directory,
+        output_path_and_filename
+    )
+
+    if device_metrics:
+        start_time, duration, _ = catalog.parse_output_filename(
+            output_path_and_filename.name
+        )
+        catalog.record_costs(connection, duration, device_metrics,
+                             start_time)
+
+    connection.close()
+
+    if align_config is not None:
+        run_align_stage(output_path_and_filename, align_config)
+
+    return output_path_and_filename
+
+
+def backfill(
+    windows,
+    duration,
+    outputs_directory,
+    requests_list,
+    device_list_version,
+    dpm_options,
+    workers,
+    stop_on_error=True,
+    align_config=None,
+    staging_directory=Path('.')
+):
+    logger.info(
+        'Backfilling %s windows with %s workers',
+        len(windows),
+        workers
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                fetch_window,
+                window_start,
+                duration,
+                requests_list,
+                Path(staging_directory).joinpath(get_output_filename(
+                    window_start,
+                    duration,
+                    device_list_version,
+                    dpm_options.get('output_format')
+                )),
+                dpm_options
+            )
+            for window_start in windows
+        ]
+
+        # Promote strictly in window order. The newest file in the output
+        # tree decides the next start time, so a window finishing early
+        # must wait for every window before it.
+        for window_start, future in zip(windows, futures):
+            try:
+                temp_path_and_filename, device_metrics = future.result()
+            except Exception:
+                if not stop_on_error:
+                    logger.exception(
+                        'Backfill of window starting %s failed.',
+                        window_start
+                    )
+                    continue
+
+                logger.exception(
+                    'Backfill of window starting %s failed. '
+                    'Later windows will not be promoted.',
+                    window_start
+                )
+
+                for pending in futures:
+                    pending.cancel()
+
+                raise
+
+            promote_window(
+                temp_path_and_filename,
+                outputs_directory,
+                window_start,
+                align_config,
+                device_metrics
+            )
+
+
+def get_dpm_options(args, config):
+    # Everything dpm_data.get_data takes from the config and CLI
+    return {
+        **get_buffer_config(args, config),
+        **get_dpm_config(args, config),
+        **get_storage_config(args, config),
+        **get_metrics_config(args, config),
+        **get_profile_config(args)
+    }
+
+
+def read_device_list(requests_list):
+    with open(requests_list, encoding='utf8') as file_handle:
+        return [line.strip() for line in file_handle if line.strip()]
+
+
+def repair_file(
+    outputs_directory,
+    row,
+    devices,
+    dpm_options,
+    staging_directory=Path('.')
+):
+    # Appends the devices to a copy of the file, which replaces it once
+    # complete so a failed repair leaves the original untouched
+    output_path_and_filename = Path(outputs_directory).joinpath(row['path'])
+    temp_path_and_filename = Path(staging_directory).joinpath(
+        output_path_and_filename.name
+    )
+    start_time, duration = catalog.window_of(row)
+    shutil.copy2(output_path_and_filename, temp_path_and_filename)
+
+    try:
+        dpm_data.get_data(
+            start_date=start_time,
+            end_date=start_time + duration,
+            devices=devices,
+            output_file=temp_path_and_filename,
+            append=True,
+            debug=True,
+            **dpm_options
+        )
+    except BaseException:
+        temp_path_and_filename.unlink(missing_ok=True)
+        raise
+
+    storage.publish(temp_path_and_filename, output_path_and_filename)
+
+    return output_path_and_filename
+
+
+def repair(**kwargs):
+    config = load_config()
+    config_logging(get_log_level(kwargs, config) or 'DEBUG')
+    outputs_directory = get_output_path(kwargs, config) or Path('.')
+    staging_directory = get_staging_path(kwargs, config, outputs_directory)
+    requests_list, device_list_version = get_request_list(kwargs, config)
+    dpm_options = get_dpm_options(kwargs, config)
+    start_time = kwargs.get('start-time', kwargs.get('start_time', None))
+    end_time = kwargs.get('end-time', kwargs.get('end_time', None))
+    device_list = read_device_list(requests_list)
+    list_version = device_list_version.replace('.', '_')
+
+    connection = open_catalog(outputs_directory)
+    # Archives would refetch a missing device for a whole day or month
+    rows = catalog.files_between(
+        connection,
+        start_time or datetime.min,
+        end_time or datetime.max,
+        archives=False
+    )
+    repaired = 0
+
+    for row in rows:
+        # Keys of another list version can't be compared with this list
+        if row['list_version'] != list_version:
+            logger.info(
+                'Skipping %s, it is of device list version %s.',
+                row['path'],
+                row['list_version']
+            )
+            continue
+
+        present = {
+            device_row['device'] for device_row in connection.execute(
+                'SELECT device FROM device_rows WHERE path = ? AND rows > 0',
+                (row['path'],)
+            )
+        }
+        missing = [device for device in device_list if device not in present]
+
+        if not missing:
+            continue
+
+        logger.info('Repairing %s devices of %s', len(missing), row['path'])
+
+        try:
+            output_path_and_filename = repair_file(
+                outputs_directory,
+                row,
+                missing,
+                dpm_options,
+                staging_directory
+            )
+        except Exception:
+            logger.exception('Could not repair %s', row['path'])
+            continue
+
+        catalog.record_file(
+            connection,
+            outputs_directory,
+            output_path_and_filename
+        )
+        repaired += 1
+
+    connection.close()
+    print(f'Repaired {repaired} of {len(rows)} files in {outputs_directory}')
+
+
+def plan(**kwargs):
+    config = load_config()
+    config_logging(get_log_level(kwargs, config) or 'DEBUG')
+    outputs_directory = get_output_path(kwargs, config) or Path('.')
+    requests_list, _ = get_request_list(kwargs, config)
+    dpm_config = get_dpm_config(kwargs, config)
+    balance = get_balance_config(kwargs, config)
+    duration = get_duration_config(kwargs, config) or timedelta(hours=1)
+    device_list = read_device_list(requests_list)
+    dpm_nodes = dpm_config.get('dpm_nodes', None) or [None]
+    shards = max(dpm_config.get('shards', 1), len(dpm_nodes))
+
+    connection = open_catalog(outputs_directory)
+    costs = {
+        cost: catalog.device_costs(connection, cost) for cost in catalog.COSTS
+    }
+    connection.close()
+
+    groups = dpm_data.pack_device_list(
+        device_list,
+        shards,
+        costs[balance] if balance else None
+    )
+    seconds = duration.total_seconds()
+    rows = []
+
+    # Devices without a history are predicted as free
+    for shard, group in enumerate(groups):
+        devices = [device_list[index] for index in group]
+        rows.append({
+            'node': dpm_nodes[shard % len(dpm_nodes)] or '-',
+            'devices': len(devices),
+            'rows': round(seconds * sum(
+                costs['rows'].get(device, 0.0) for device in devices
+            )),
+            'bytes': round(seconds * sum(
+                costs['bytes'].get(device, 0.0) for device in devices
+            )),
+            'slowest_seconds': round(seconds * max(
+                (costs['seconds'].get(device, 0.0) for device in devices),
+                default=0.0
+            ), 1)
+        })
+
+    known = sum(device in costs['rows'] for device in device_list)
+    print(pd.DataFrame(rows).to_string())
+    print(
+        f'Predicted per {isodate.duration_isoformat(duration)} window, '
+        f'balanced by {balance or "list order"}. {known} of '
+        f'{len(device_list)} devices have a cost history.'
+    )
+
+
 def get_data(**kwargs):
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
     # Load values from config file
     config = load_config()
 
@@ -347,65 +1151,109 @@ def get_data(**kwargs):
     config_logging(get_log_level(kwargs, config) or 'DEBUG')
 
     outputs_directory = get_output_path(kwargs, config) or Path('.')
+    staging_directory = get_staging_path(kwargs, config, outputs_directory)
 
     requests_list, device_list_version = get_request_list(kwargs, config)
+    dpm_options = get_dpm_options(kwargs, config)
+    backfill_workers = get_backfill_workers(kwargs, config)
+    align_config = get_align_config(kwargs, config)
+    adaptive_config = get_adaptive_config(kwargs, config)
+    balance = get_balance_config(kwargs, config)
+    configured_duration = get_duration_config(kwargs, config)
+    run_once = kwargs.get('run-once', kwargs.get('run_once'))
+
+    gaps_order = get_gaps_config(kwargs, config)
 
     # get_start_time always returns
     start_time, duration = get_start_time(outputs_directory, kwargs, config)
     end_time = start_time + duration
 
+    # Holes can only be between the configured start and the newest file.
+    # They are found on the grid of whole windows, `duration` can be the
+    # rest of a window fetched in sub-windows.
+    if gaps_order is not None:
+        gaps_start, _ = get_start_time_config(kwargs, config)
+        fill_gaps(
+            outputs_directory,
+            gaps_start,
+            start_time,
+            configured_duration or duration,
+            gaps_order,
+            requests_list,
+            device_list_version,
+            with_device_costs(outputs_directory, dpm_options, balance),
+            backfill_workers,
+            align_config,
+            staging_directory
+        )
+
     continue_loop = True
 
     while datetime.now() > end_time and continue_loop:
-        structured_outputs_directory = create_structured_path(
-            outputs_directory,
-            start_time
-        )
-        logger.debug('Structured path is: %s', structured_outputs_directory)
+        windows = [start_time]
 
-        iso_datetime_duration = name_output_file(
-            start_time,
-            duration
-        )
-        logger.debug('Named the output file: %s', iso_datetime_duration)
-
-        request_list_version = device_list_version.replace('.', '_')
-        output_filename = f'{iso_datetime_duration}-{request_list_version}.h5'
-        temp_path_and_filename = Path('.').joinpath(output_filename)
-        output_path_and_filename = Path(
-            structured_outputs_directory
-        ).joinpath(output_filename)
-        logger.debug(
-            'Output path and filename is: %s',
-            output_path_and_filename
-        )
+        # A window shortened to line up with the grid is fetched alone
+        if backfill_workers > 1 and not run_once and \
+                configured_duration in (None, duration):
+            windows = due_windows(start_time, duration)
 
-        logger.info('Calling dpm_data.main...')
-        logger.debug(
-            ('start_date=%s, end_date=%s, device_file=%s, '
-             'output_file=%s, debug=True'),
-            start_time,
-            end_time,
-            requests_list,
-            temp_path_and_filename
+        # Heavy windows are fetched and stored as several shorter files
+        fetch_duration = plan_fetch_duration(
+            outputs_directory,
+            duration,
+            adaptive_config
         )
-        # Begin data request and writing to local file
-        dpm_data.get_data(
-            start_date=start_time,
-            end_date=end_time,
-            device_file=requests_list,
-            output_file=temp_path_and_filename,
-            debug=True
+        windows = split_windows(windows, duration, fetch_duration)
+        # Costs are updated with every window
+        window_options = with_device_costs(
+            outputs_directory,
+            dpm_options,
+            balance
         )
 
-        # Ensure that the folders exist
-        if not structured_outputs_directory.exists():
-            makedirs(structured_outputs_directory, exist_ok=True)
-
-        # Move local closed file to final destination
-        shutil.move(temp_path_and_filename, output_path_and_filename)
-        start_time = end_time
+        if len(windows) > 1 and backfill_workers > 1:
+            backfill(
+                windows,
+                fetch_duration,
+                outputs_directory,
+                requests_list,
+                device_list_version,
+                window_options,
+                backfill_workers,
+                align_config=align_config,
+                staging_directory=staging_directory
+            )
+        else:
+            for window_start in windows:
+                output_filename = get_output_filename(
+                    window_start,
+                    fetch_duration,
+                    device_list_version,
+                    dpm_options.get('output_format')
+                )
+                temp_path_and_filename, device_metrics = fetch_window(
+                    window_start,
+                    fetch_duration,
+                    requests_list,
+                    staging_directory.joinpath(output_filename),
+                    window_options
+                )
+                promote_window(
+                    temp_path_and_filename,
+                    outputs_directory,
+                    window_start,
+                    align_config,
+                    device_metrics
+                )
+
+        # The catalog knows where the next window starts, also after
+        # windows of a different duration
+        start_time, duration = get_start_time(
+            outputs_directory,
+            kwargs,
+            config
+        )
         end_time = start_time + duration
 
         # Check if should continue
-        continue_loop = not kwargs.get('run-once', kwargs.get('run_once'))
+        continue_loop = not run_once
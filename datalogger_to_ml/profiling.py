@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+from pathlib import Path
+import cProfile
+import io
+import logging
+import pstats
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_OUTPUT = 'profiles'
+# Functions shown per section in the summary
+TOP = 20
+
+
+class Profiler:
+    # cProfile per named section, e.g. acquisition, processing and
+    # writing. Sections nest: entering one pauses the enclosing section,
+    # so each function call is counted in the innermost section only.
+
+    def __init__(self, output_path=PROFILE_OUTPUT, trace_memory=False,
+                 top=TOP):
+        self.output_path = Path(output_path)
+        self.trace_memory = trace_memory
+        self.top = top
+        self._profiles = {}
+        self._stack = []
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def section(self, name):
+        if name not in self._profiles:
+            self._profiles[name] = cProfile.Profile()
+
+        profile = self._profiles[name]
+
+        if self._stack:
+            self._stack[-1].disable()
+
+        self._stack.append(profile)
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._stack.pop()
+
+            if self._stack:
+                self._stack[-1].enable()
+
+    def wrap(self, name, function):
+        # Runs every call of function in a section
+        def _wrapped(*args, **kwargs):
+            with self.section(name):
+                return function(*args, **kwargs)
+
+        return _wrapped
+
+    def summary(self):
+        output = io.StringIO()
+
+        for name, profile in self._profiles.items():
+            output.write(f'--- {name} ---\n')
+            stats = pstats.Stats(profile, stream=output)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+
+        return output.getvalue()
+
+    def dump(self, window):
+        # Writes <window>.<section>.prof for pstats or snakeviz, and the
+        # top allocations to <window>.memory.txt when tracing memory. The
+        # sections start over for the next window.
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        paths = []
+
+        for name, profile in self._profiles.items():
+            path = self.output_path.joinpath(f'{window}.{name}.prof')
+            profile.dump_stats(path)
+            paths.append(path)
+
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            path = self.output_path.joinpath(f'{window}.memory.txt')
+
+            with open(path, 'w', encoding='utf8') as file_handle:
+                current, peak = tracemalloc.get_traced_memory()
+                file_handle.write(f'current: {current} peak: {peak}\n')
+
+                for statistic in snapshot.statistics('lineno')[:self.top]:
+                    file_handle.write(f'{statistic}\n')
+
+            tracemalloc.reset_peak()
+            paths.append(path)
+
+        print(self.summary())
+        logger.info('Wrote profiles %s', ', '.join(map(str, paths)))
+        self._profiles = {}
+
+        return paths
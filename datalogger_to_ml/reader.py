@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+from pathlib import Path
+import logging
+from . import catalog
+from . import layout
+from . import storage
+from .dpm_data import local_to_utc_ms
+
+logger = logging.getLogger(__name__)
+
+# Rows per yielded chunk
+CHUNKSIZE = 100000
+# How far before the range a file can start and still overlap it. The
+# default covers nanny windows of up to one day.
+LOOKBACK = timedelta(days=1)
+
+
+def _overlapping(directory, start_time, end_time):
+    files = []
+
+    if directory.is_dir():
+        for path in storage.find_outputs(directory):
+            try:
+                file_start, duration, _ = catalog.parse_output_filename(path)
+            except ValueError:
+                logger.debug('Ignoring %s for reading.', path)
+                continue
+
+            if file_start < end_time and file_start + duration > start_time:
+                files.append((file_start, duration, Path(path)))
+
+    return files
+
+
+def _contains(archive, file):
+    return archive[0] <= file[0] and \
+        file[0] + file[1] <= archive[0] + archive[1]
+
+
+def files_for_range(output_path, start_time, end_time, lookback=LOOKBACK):
+    # Output files whose window overlaps [start_time, end_time), found by
+    # listing only the YYYYMM/DD directories of the range and the
+    # archive/YYYYMM directories of its months. Files inside an archive
+    # are left out, the archive holds their rows. Returns
+    # (start, duration, path) tuples in time order.
+    files = []
+    day = (start_time - lookback).date()
+
+    while day <= end_time.date():
+        directory = layout.create_structured_path(output_path, day)
+        files.extend(_overlapping(directory, start_time, end_time))
+        day += timedelta(days=1)
+
+    archives = []
+    month = start_time.date().replace(day=1)
+
+    while month <= end_time.date():
+        directory = layout.create_archive_path(output_path, month)
+        archives.extend(_overlapping(directory, start_time, end_time))
+        month = (month + timedelta(days=31)).replace(day=1)
+
+    files = [
+        file for file in files
+        if not any(_contains(archive, file) for archive in archives)
+    ] + [
+        archive for archive in archives
+        if not any(
+            _contains(other, archive) and not _contains(archive, other)
+            for other in archives
+        )
+    ]
+    files.sort(key=lambda file: (file[0], file[0] + file[1]))
+
+    return files
+
+
+def read(
+    output_path,
+    devices,
+    start_time,
+    end_time,
+    chunksize=CHUNKSIZE,
+    lookback=LOOKBACK
+):
+    # Lazily yields (device, DataFrame) chunks with Timestamps in
+    # [start_time, end_time), file by file in time order. At most one file
+    # is open and one chunk is in memory at a time.
+    start_us = local_to_utc_ms(start_time) * 1000
+    end_us = local_to_utc_ms(end_time) * 1000
+
+    for _, _, path in files_for_range(output_path, start_time, end_time,
+                                      lookback):
+        with storage.open_store(path, mode='r') as store:
+            keys = set(store.keys())
+
+            for device in devices:
+                key = f'/{device}'
+
+                if key not in keys:
+                    logger.debug('%s is not in %s', device, path)
+                    continue
+
+                for chunk in store.iter_range(key, start_us, end_us,
+                                              chunksize):
+                    yield device, chunk
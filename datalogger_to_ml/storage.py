@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from glob import glob
+from pathlib import Path
+import errno
+import os
+import logging
+import shutil
+import numpy as np
+import pandas as pd
+import tables
+
+logger = logging.getLogger(__name__)
+
+# Rows written per Parquet row group unless a chunk shape is configured
+ROW_GROUP_ROWS = 1048576
+# Rows of a column read at a time when scanning a table
+SCAN_ROWS = 1048576
+
+
+def repack(output_file, chunkshape='auto'):
+    # Rewrites a closed HDF5 file like ptrepack, without the space of
+    # removed tables. pandas doesn't pass a chunk shape to PyTables, 'auto'
+    # sizes the chunks of every table from its rows. Compression filters
+    # and indexes are kept.
+    output_file = Path(output_file)
+    repacked_file = output_file.with_name(f'{output_file.name}.repack')
+
+    if isinstance(chunkshape, int):
+        chunkshape = (chunkshape,)
+
+    with tables.open_file(output_file, mode='r') as source:
+        source.copy_file(
+            str(repacked_file),
+            overwrite=True,
+            chunkshape=chunkshape,
+            propindexes=True
+        )
+
+    os.replace(repacked_file, output_file)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            'The parquet output format requires pyarrow. Install it with '
+            '`pip install datalogger-to-ml[parquet]`.'
+        ) from error
+
+    return pyarrow, pyarrow.parquet
+
+
+class Hdf5Store:
+    # One PyTables table per device, keyed by the DRF request. New tables
+    # use the int64 Timestamps as their index, kept in order and indexed
+    # by PyTables, so range queries read only matching chunks. Timestamps
+    # stays a column as well.
+    extension = '.h5'
+    # Flushed tables survive an interrupted acquisition
+    resumable = True
+
+    def __init__(
+        self,
+        path,
+        mode='r',
+        complib=None,
+        complevel=None,
+        expected_rows=None,
+        chunkshape=None
+    ):
+        self.path = Path(path)
+        self._mode = mode
+        self._chunkshape = chunkshape
+        self._append_options = {}
+        # Newest timestamp appended per key, and keys appended out of order
+        self._newest = {}
+        self._created = set()
+        self._indexed = set()
+        self._unsorted = set()
+
+        if expected_rows:
+            self._append_options['expectedrows'] = expected_rows
+
+        self._hdf = pd.HDFStore(
+            self.path,
+            mode=mode,
+            complevel=complevel,
+            complib=complib
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.keys())
+
+    def append(self, key, data_frame):
+        timestamps = data_frame['Timestamps'].to_numpy()
+
+        if key not in self._newest:
+            self._newest[key] = self._last_timestamp(key)
+
+        if len(timestamps) > 0:
+            newest = self._newest[key]
+
+            if (newest is not None and timestamps[0] < newest) or \
+                    np.any(timestamps[1:] < timestamps[:-1]):
+                self._unsorted.add(key)
+
+            self._newest[key] = timestamps.max() if newest is None \
+                else max(newest, timestamps.max())
+
+        self._write(key, data_frame)
+
+    def _last_timestamp(self, key):
+        # Tables already in the file keep their own layout
+        if key in self._hdf:
+            if getattr(self._hdf.get_storer(key).attrs, 'timestamp_index',
+                       False):
+                self._created.add(key)
+                self._indexed.add(key)
+
+            return self._max_timestamp(key)
+
+        self._created.add(key)
+
+        return None
+
+    def _max_timestamp(self, key):
+        # Newest timestamp of a table, not of its last row, which is older
+        # when late data was appended, e.g. before a resume. The indexed
+        # column is read a chunk at a time.
+        storer = self._hdf.get_storer(key)
+
+        if getattr(storer.attrs, 'timestamp_index', False):
+            column = 'index'
+        elif 'Timestamps' in (storer.data_columns or []):
+            column = 'Timestamps'
+        else:
+            column = None
+
+        if column is None:
+            chunks = (
+                chunk['Timestamps']
+                for chunk in self._hdf.select(key, chunksize=SCAN_ROWS)
+            )
+        else:
+            chunks = (
+                self._hdf.select_column(key, column, start=start,
+                                        stop=start + SCAN_ROWS)
+                for start in range(0, self.nrows(key), SCAN_ROWS)
+            )
+
+        newest = None
+
+        for chunk in chunks:
+            if len(chunk) > 0:
+                newest = chunk.max() if newest is None \
+                    else max(newest, chunk.max())
+
+        return newest
+
+    def _write(self, key, data_frame):
+        if key not in self._created:
+            self._hdf.append(key, data_frame, **self._append_options)
+            return
+
+        # The index is created with the table, PyTables keeps it up to
+        # date on later appends
+        create_index = key not in self._indexed
+        data_frame = data_frame.set_axis(
+            pd.Index(data_frame['Timestamps'].to_numpy())
+        )
+        self._hdf.append(
+            key,
+            data_frame,
+            data_columns=['Timestamps'],
+            index=['index'] if create_index else False,
+            **self._append_options
+        )
+
+        if create_index:
+            self._hdf.get_storer(key).attrs.timestamp_index = True
+            self._indexed.add(key)
+
+    def _sort(self, key):
+        # Late data was appended after newer rows. Tables can't insert
+        # rows, so PyTables copies the table in order of a completely
+        # sorted timestamp index, out of core, and the copy replaces it.
+        # Tables without a timestamp index keep the order of appends.
+        if key not in self._indexed:
+            logger.warning('Not sorting %s of %s, it has no timestamp index',
+                           key, self.path)
+            return
+
+        logger.debug('Sorting %s of %s', key, self.path)
+        table = self._hdf.get_storer(key).table
+        column = table.colinstances['index']
+
+        if column.is_indexed and not column.index.is_csi:
+            column.remove_index()
+
+        if not column.is_indexed:
+            column.create_csindex()
+
+        sorted_table = table.copy(
+            newname=f'{table.name}_sorted',
+            sortby='index',
+            propindexes=True
+        )
+        table.remove()
+        sorted_table.move(newname='table')
+
+    def truncate(self, key, nrows):
+        # Drops the rows after the first nrows, e.g. those of an
+        # interrupted append, or the whole table
+        if nrows == 0:
+            self._hdf.remove(key)
+            self._indexed.discard(key)
+        elif nrows < self.nrows(key):
+            self._hdf.remove(key, start=nrows, stop=self.nrows(key))
+
+        self._newest.pop(key, None)
+
+    def flush(self):
+        self._hdf.flush(fsync=True)
+
+    def keys(self):
+        return self._hdf.keys()
+
+    def nrows(self, key):
+        return int(self._hdf.get_storer(key).nrows or 0)
+
+    def select(self, key, start=None, stop=None):
+        return self._hdf.select(key, start=start, stop=stop)
+
+    def iter_chunks(self, key, chunksize):
+        yield from self._hdf.select(key, chunksize=chunksize)
+
+    def iter_range(self, key, start_us, end_us, chunksize):
+        # Rows with Timestamps in [start_us, end_us). Tables indexed by
+        # timestamp or with a Timestamps data column are queried, older
+        # ones are scanned.
+        storer = self._hdf.get_storer(key)
+        data_columns = storer.data_columns or []
+
+        if getattr(storer.attrs, 'timestamp_index', False):
+            yield from self._hdf.select(
+                key,
+                where=f'index >= {start_us} & index < {end_us}',
+                chunksize=chunksize
+            )
+            return
+
+        if 'Timestamps' in data_columns:
+            yield from self._hdf.select(
+                key,
+                where=f'Timestamps >= {start_us} & Timestamps < {end_us}',
+                chunksize=chunksize
+            )
+            return
+
+        for chunk in self._hdf.select(key, chunksize=chunksize):
+            timestamps = chunk['Timestamps']
+            chunk = chunk[(timestamps >= start_us) & (timestamps < end_us)]
+
+            if len(chunk) > 0:
+                yield chunk
+
+    def close(self):
+        if not self._hdf.is_open:
+            return
+
+        if self._mode != 'r':
+            for key in self._unsorted:
+                self._sort(key)
+
+        self._hdf.close()
+
+        if self._chunkshape and self._mode != 'r':
+            repack(self.path, self._chunkshape)
+
+
+class ParquetStore:
+    # All devices in one Parquet file in long format. The `Device` column
+    # holds the key, appends are batched into row groups sorted by device
+    # so readers can skip row groups by their statistics.
+    extension = '.parquet'
+    # The footer is only written on close, a crash loses the whole file
+    resumable = False
+    compressions = {
+        'zlib': 'gzip',
+        'bzip2': 'brotli',
+        'lzo': 'lz4',
+        'blosc': 'zstd',
+        'blosc:blosclz': 'zstd',
+        'blosc:lz4': 'lz4',
+        'blosc:lz4hc': 'lz4',
+        'blosc:snappy': 'snappy',
+        'blosc:zlib': 'gzip',
+        'blosc:zstd': 'zstd'
+    }
+
+    def __init__(
+        self,
+        path,
+        mode='r',
+        complib=None,
+        complevel=None,
+        expected_rows=None,
+        chunkshape=None
+    ):
+        self._pa, self._pq = _import_pyarrow()
+        self.path = Path(path)
+        self._mode = mode
+        self._row_group_rows = chunkshape or ROW_GROUP_ROWS
+        self._compression = self.compressions.get(complib, 'none')
+        self._compression_level = complevel if complib else None
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+        self._rows = {}
+
+        if mode == 'r':
+            self._file = self._pq.ParquetFile(self.path)
+            devices = self._file.read(columns=['Device']).column('Device')
+
+            for count in devices.value_counts().to_pylist():
+                self._rows[count['values']] = count['counts']
+        elif mode == 'a' and self.path.exists():
+            self._copy_forward()
+        elif self.path.exists():
+            os.remove(self.path)
+
+    def _copy_forward(self):
+        # Parquet files can't be reopened for writing, so appending starts
+        # a new file with the row groups of the existing one
+        previous_path = self.path.with_name(f'{self.path.name}.previous')
+        os.replace(self.path, previous_path)
+        previous = self._pq.ParquetFile(previous_path)
+
+        for index in range(previous.num_row_groups):
+            self._write(previous.read_row_group(index))
+
+        os.remove(previous_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _write(self, table):
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(
+                self.path,
+                table.schema,
+                compression=self._compression,
+                compression_level=self._compression_level
+            )
+
+        for device, count in zip(
+            *self._pa.compute.value_counts(table.column('Device'))
+            .flatten()
+        ):
+            device = device.as_py()
+            self._rows[device] = self._rows.get(device, 0) + count.as_py()
+
+        self._writer.write_table(
+            table.cast(self._writer.schema),
+            row_group_size=self._row_group_rows
+        )
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        table = self._pa.concat_tables(self._pending)
+        self._pending = []
+        self._pending_rows = 0
+        self._write(table.sort_by('Device'))
+
+    def flush(self):
+        self._flush()
+
+    def append(self, key, data_frame):
+        table = self._pa.Table.from_pandas(data_frame, preserve_index=False)
+        table = table.add_column(
+            0,
+            'Device',
+            self._pa.array([key.lstrip('/')] * len(table), self._pa.string())
+        )
+        self._pending.append(table)
+        self._pending_rows += len(table)
+
+        if self._pending_rows >= self._row_group_rows:
+            self._flush()
+
+    def keys(self):
+        return [f'/{device}' for device in self._rows]
+
+    def nrows(self, key):
+        return self._rows.get(key.lstrip('/'), 0)
+
+    def _row_groups(self, device):
+        # Indexes of row groups whose device range can contain `device`
+        metadata = self._file.metadata
+        device_column = self._file.schema_arrow.get_field_index('Device')
+
+        for index in range(metadata.num_row_groups):
+            statistics = metadata.row_group(index) \
+                .column(device_column).statistics
+
+            if statistics is None or not statistics.has_min_max or \
+                    statistics.min <= device <= statistics.max:
+                yield index
+
+    def _read_device(self, device, row_group, start_us=None, end_us=None):
+        compute = self._pa.compute
+        table = self._file.read_row_group(row_group)
+        mask = compute.equal(table.column('Device'), device)
+
+        if start_us is not None:
+            timestamps = table.column('Timestamps')
+            mask = compute.and_(mask, compute.and_(
+                compute.greater_equal(timestamps, start_us),
+                compute.less(timestamps, end_us)
+            ))
+
+        return table.filter(mask).drop_columns(['Device']).to_pandas()
+
+    def select(self, key, start=None, stop=None):
+        device = key.lstrip('/')
+        frames = [
+            self._read_device(device, row_group)
+            for row_group in self._row_groups(device)
+        ]
+        frames = [frame for frame in frames if len(frame) > 0]
+
+        if not frames:
+            return pd.DataFrame(columns=['Timestamps', 'Data'])
+
+        data_frame = pd.concat(frames, ignore_index=True)
+
+        return data_frame.iloc[start:stop]
+
+    def iter_chunks(self, key, chunksize):
+        device = key.lstrip('/')
+        offset = 0
+
+        for row_group in self._row_groups(device):
+            data_frame = self._read_device(device, row_group)
+
+            for start in range(0, len(data_frame), chunksize):
+                chunk = data_frame.iloc[start:start + chunksize]
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+
+    def iter_range(self, key, start_us, end_us, chunksize):
+        device = key.lstrip('/')
+
+        for row_group in self._row_groups(device):
+            data_frame = self._read_device(device, row_group, start_us, end_us)
+
+            for start in range(0, len(data_frame), chunksize):
+                yield data_frame.iloc[start:start + chunksize]
+
+    def close(self):
+        if self._mode == 'r':
+            self._file.close()
+            return
+
+        self._flush()
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+FORMATS = {
+    'hdf5': Hdf5Store,
+    'parquet': ParquetStore
+}
+
+EXTENSIONS = [store.extension for store in FORMATS.values()]
+
+
+def store_class(output_format=None, path=None):
+    # The format wins over the extension of the path, HDF5 is the default
+    if output_format is not None:
+        try:
+            return FORMATS[output_format]
+        except KeyError as error:
+            raise ValueError(
+                f'Unknown output format {output_format}. '
+                f'Use one of {", ".join(FORMATS)}.'
+            ) from error
+
+    if path is not None:
+        for store in FORMATS.values():
+            if Path(path).suffix == store.extension:
+                return store
+
+    return Hdf5Store
+
+
+def open_store(path, mode='r', output_format=None, **options):
+    return store_class(output_format, path)(path, mode=mode, **options)
+
+
+def find_outputs(directory, recursive=False):
+    # Output files of every format in a directory, sorted by path
+    file_paths = []
+
+    for extension in EXTENSIONS:
+        if recursive:
+            pattern = Path(directory).joinpath('**', f'*{extension}')
+        else:
+            pattern = Path(directory).joinpath(f'*{extension}')
+
+        # Glob allows the use of the * wildcard
+        file_paths.extend(glob(str(pattern), recursive=recursive))
+
+    return sorted(file_paths)
+
+
+def _fsync(path):
+    with open(path, 'rb') as file_handle:
+        os.fsync(file_handle.fileno())
+
+
+def _fsync_directory(directory):
+    # Makes a rename durable. Not every platform can open a directory.
+    try:
+        directory_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(directory_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(directory_fd)
+
+
+def publish(source, destination):
+    # Moves a closed output to its final name so readers see all of it or
+    # nothing. On the same filesystem that's a rename, across filesystems
+    # the file is copied to a hidden name next to the destination first.
+    source = Path(source)
+    destination = Path(destination)
+    _fsync(source)
+
+    try:
+        os.replace(source, destination)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+
+        logger.warning(
+            'Copying %s to %s, the staging directory is on another '
+            'filesystem.',
+            source,
+            destination
+        )
+        temp_path = destination.with_name(f'.{destination.name}.tmp')
+        shutil.copy2(source, temp_path)
+        _fsync(temp_path)
+        os.replace(temp_path, destination)
+        os.remove(source)
+
+    _fsync_directory(destination.parent)
+
+    return destination
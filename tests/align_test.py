@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+from datalogger_to_ml import align
+
+
+def chunks(*frames):
+    for timestamps, data in frames:
+        yield 'G:AMANDA@e,12', pd.DataFrame(data={
+            'Timestamps': timestamps,
+            'Data': data
+        })
+
+
+class TestClass:
+    @pytest.mark.parametrize('mode, expected', [
+        ('last', [1.0, 1.0, 2.0, 3.0, 4.0]),
+        ('linear', [1.0, 5 / 3, 7 / 3, 3.0, np.nan]),
+        ('mean', [1.0, 2.0, np.nan, 3.5, np.nan])
+    ])
+    def test_align_chunks(self, mode, expected):
+        # Samples at 0, 15 | 30, 35 on a grid with a period of 10, the
+        # chunk boundary falls between two grid points
+        grid, matrix = align.align_chunks(
+            chunks(([0, 15], [1.0, 2.0]), ([30, 35], [3.0, 4.0])),
+            ['G:AMANDA@e,12', 'G:MISSING@e,12'],
+            0,
+            50,
+            10,
+            mode
+        )
+
+        assert list(grid) == [0, 10, 20, 30, 40]
+        np.testing.assert_allclose(matrix[:, 0], expected)
+        assert np.isnan(matrix[:, 1]).all()
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            align.align_chunks(chunks(), [], 0, 10, 1, 'nearest')
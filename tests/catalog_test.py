@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+import isodate
+import pandas as pd
+import pytest
+from datalogger_to_ml import catalog
+
+
+def write_output_file(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'Timestamps': list(range(rows)),
+        'Data': [float(row) for row in range(rows)]
+    }
+
+    with pd.HDFStore(path) as hdf:
+        hdf.append('G:AMANDA@e,12', pd.DataFrame(data=data))
+
+
+class TestClass:
+    def test_parse_output_filename(self):
+        start_time, duration, list_version = catalog.parse_output_filename(
+            '20200101T000000PT1H-1_0_0.h5'
+        )
+        assert start_time == datetime(2020, 1, 1)
+        assert duration == timedelta(hours=1)
+        assert list_version == '1_0_0'
+
+    def test_rebuild(self, tmp_path):
+        write_output_file(
+            tmp_path.joinpath('202001', '01', '20200101T000000PT1H-1_0_0.h5'),
+            3
+        )
+        write_output_file(
+            tmp_path.joinpath('202001', '01', '20200101T010000PT1H-1_0_0.h5'),
+            5
+        )
+        write_output_file(tmp_path.joinpath('not_nanny.h5'), 1)
+
+        connection = catalog.rebuild(tmp_path)
+        latest = catalog.latest_file(connection)
+        assert latest['path'] == '202001/01/20200101T010000PT1H-1_0_0.h5'
+        assert latest['rows'] == 5
+        assert catalog.window_of(latest) == (
+            datetime(2020, 1, 1, 1),
+            timedelta(hours=1)
+        )
+
+        files = catalog.files_between(
+            connection,
+            datetime(2020, 1, 1, 0, 30),
+            datetime(2020, 1, 1, 0, 45)
+        )
+        assert [row['rows'] for row in files] == [3]
+        connection.close()
+
+    def test_archives(self, tmp_path):
+        hour = '202001/02/20200102T000000PT1H-1_0_0.h5'
+        archive = 'archive/202001/20200101T000000P1D-1_0_0.h5'
+        write_output_file(tmp_path.joinpath(hour), 1)
+        write_output_file(tmp_path.joinpath(archive), 24)
+
+        # A catalog from before archives were flagged
+        connection = catalog.rebuild(tmp_path)
+        connection.executescript(
+            'ALTER TABLE files DROP COLUMN archive;'
+        )
+        connection.close()
+
+        connection = catalog.connect(tmp_path)
+        assert {row['path']: row['archive'] for row in connection.execute(
+            'SELECT path, archive FROM files'
+        )} == {hour: 0, archive: 1}
+        assert catalog.latest_file(connection)['path'] == hour
+
+        files = catalog.files_between(connection, datetime(2020, 1, 1),
+                                      datetime(2020, 1, 3))
+        assert [row['path'] for row in files] == [archive, hour]
+        files = catalog.files_between(connection, datetime(2020, 1, 1),
+                                      datetime(2020, 1, 3), archives=False)
+        assert [row['path'] for row in files] == [hour]
+        connection.close()
+
+    def test_find_gaps(self, tmp_path):
+        for hour, rows in [(0, 1), (1, 1), (3, 0), (5, 2)]:
+            write_output_file(
+                tmp_path.joinpath('202001', '01',
+                                  f'20200101T{hour:02d}0000PT1H-1_0_0.h5'),
+                rows
+            )
+
+        connection = catalog.rebuild(tmp_path)
+        start_time = datetime(2020, 1, 1)
+        hour = timedelta(hours=1)
+        gaps = catalog.find_gaps(connection, start_time, start_time + 6 * hour, hour)
+        connection.close()
+        # Hour 3 was fetched and came back empty, it isn't fetched again
+        assert gaps == [start_time + 2 * hour, start_time + 4 * hour]
+
+    def test_record_costs(self, tmp_path):
+        connection = catalog.connect(tmp_path)
+        metrics = {
+            'first_reply_seconds': 1.0,
+            'final_reply_seconds': 10.0,
+            'rows': 3600,
+            'bytes': 57600,
+            'status': 'ok'
+        }
+        catalog.record_costs(connection, timedelta(hours=1), {'A': metrics})
+        assert catalog.device_costs(connection) == {'A': 1.0}
+
+        # Later windows move the cost part of the way, failed devices keep
+        # their history
+        catalog.record_costs(connection, timedelta(minutes=30), {
+            'A': dict(metrics, rows=3600 * 3),
+            'B': dict(metrics, status=-42)
+        })
+        assert catalog.device_costs(connection) == {
+            'A': pytest.approx(1.0 + catalog.COST_SMOOTHING * 5.0)
+        }
+        assert catalog.device_costs(connection, 'seconds') == {
+            'A': pytest.approx(9.0 / 3600 + catalog.COST_SMOOTHING * 9.0 / 3600)
+        }
+
+        # A month is as long as the month it starts
+        catalog.record_costs(connection, isodate.Duration(months=1),
+                             {'C': dict(metrics, rows=31 * 86400)},
+                             datetime(2020, 1, 1))
+        assert catalog.device_costs(connection)['C'] == pytest.approx(1.0)
+        connection.close()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+import pandas as pd
+import pytest
+from datalogger_to_ml import catalog
+from datalogger_to_ml import compact
+from datalogger_to_ml import reader
+from datalogger_to_ml import storage
+
+HOUR = timedelta(hours=1)
+DEVICES = ['G:AMANDA@e,12', 'M:OUTTMP@e,12']
+
+
+def write_hour(output_path, start_time):
+    path = output_path.joinpath(
+        start_time.strftime('%Y%m'),
+        start_time.strftime('%d'),
+        start_time.strftime('%Y%m%dT%H%M%SPT1H-1_0_0.h5')
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    hour = int((start_time - datetime(2020, 1, 1)) / HOUR)
+
+    with storage.Hdf5Store(path, mode='w') as store:
+        for device in DEVICES:
+            store.append(device, pd.DataFrame(data={
+                'Timestamps': [hour * 10 + sample for sample in range(3)],
+                'Data': [float(hour)] * 3
+            }))
+
+
+class TestClass:
+    def test_tile(self):
+        def row(start, duration, rows=1):
+            return {
+                'path': f'{start}{duration}',
+                'start': f'2020-01-01T{start:02d}:00:00',
+                'duration': f'PT{duration}H',
+                'rows': rows
+            }
+
+        start_time = datetime(2020, 1, 1)
+        end_time = datetime(2020, 1, 1, 4)
+        assert compact.tile(
+            [row(2, 2), row(0, 1), row(1, 1), row(2, 1), row(4, 1)],
+            start_time,
+            end_time
+        ) == ['01', '11', '22']
+        # Missing, empty and partly overlapping hours
+        assert compact.tile([row(0, 1), row(2, 2)], start_time, end_time) \
+            is None
+        assert compact.tile([row(0, 2), row(2, 2, 0)], start_time, end_time) \
+            is None
+        assert compact.tile([row(0, 3), row(2, 2)], start_time, end_time) \
+            is None
+
+    def test_compact(self, tmp_path, monkeypatch):
+        output_path = tmp_path.joinpath('output')
+        staging_path = tmp_path.joinpath('staging')
+        staging_path.mkdir()
+        start_time = datetime(2020, 1, 1)
+
+        # The day is complete once a newer file exists
+        for hour in range(25):
+            write_hour(output_path, start_time + hour * HOUR)
+
+        catalog.rebuild(output_path).close()
+        monkeypatch.setattr(compact, 'BATCH_SOURCES', 5)
+        append = storage.Hdf5Store.append
+        appends = []
+
+        def interrupted_append(store, key, data_frame):
+            # Stops after the first device of the second batch, sources are
+            # appended one by one
+            if len(appends) == 2 * 5 + 1:
+                raise KeyboardInterrupt
+            appends.append(key)
+            append(store, key, data_frame)
+
+        monkeypatch.setattr(storage.Hdf5Store, 'append', interrupted_append)
+
+        with pytest.raises(KeyboardInterrupt):
+            compact.compact_range(output_path, staging_path)
+
+        archive = output_path.joinpath(
+            'archive', '202001', '20200101T000000P1D-1_0_0.h5'
+        )
+        assert compact.progress_path(staging_path.joinpath(archive.name)) \
+            .exists()
+
+        monkeypatch.setattr(storage.Hdf5Store, 'append', append)
+        archives = compact.compact_range(output_path, staging_path,
+                                         delete=True)
+        assert archives == [archive]
+        assert list(staging_path.iterdir()) == []
+        assert list(output_path.joinpath('202001', '01').iterdir()) == []
+
+        with storage.open_store(archive) as store:
+            data_frame = store.select('/G:AMANDA@e,12')
+
+        assert list(data_frame['Timestamps']) == [
+            hour * 10 + sample for hour in range(24) for sample in range(3)
+        ]
+
+        connection = catalog.connect(output_path)
+        assert [row['path'] for row in connection.execute(
+            'SELECT path FROM files ORDER BY start'
+        )] == [
+            'archive/202001/20200101T000000P1D-1_0_0.h5',
+            '202001/02/20200102T000000PT1H-1_0_0.h5'
+        ]
+        connection.close()
+
+        files = reader.files_for_range(
+            output_path,
+            start_time + 23 * HOUR,
+            start_time + 25 * HOUR
+        )
+        assert [file[2].name for file in files] == [
+            '20200101T000000P1D-1_0_0.h5',
+            '20200102T000000PT1H-1_0_0.h5'
+        ]
+
+    def test_compact_staged_copy_gone(self, tmp_path):
+        output_path = tmp_path.joinpath('output')
+        staging_path = tmp_path.joinpath('staging')
+        staging_path.mkdir()
+        start_time = datetime(2020, 1, 1)
+
+        for hour in range(25):
+            write_hour(output_path, start_time + hour * HOUR)
+
+        catalog.rebuild(output_path).close()
+        archive_name = '20200101T000000P1D-1_0_0.h5'
+        sources = [
+            f'202001/01/20200101T{hour:02d}0000PT1H-1_0_0.h5'
+            for hour in range(24)
+        ]
+
+        # Progress of a run whose staged copy was removed, e.g. by a reboot
+        compact.save_progress(
+            compact.progress_path(staging_path.joinpath(archive_name)),
+            {
+                'sources': sources,
+                'done': sources,
+                'rows': {f'/{device}': 72 for device in DEVICES},
+                'source_rows': {device: 72 for device in DEVICES}
+            }
+        )
+        archive = output_path.joinpath('archive', '202001', archive_name)
+
+        assert compact.compact_range(output_path, staging_path) == [archive]
+        assert catalog.count_rows(archive) \
+            == {device: 72 for device in DEVICES}
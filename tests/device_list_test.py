@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import threading
+import pytest
+from datalogger_to_ml import device_list
+
+
+class GitHubStandIn(BaseHTTPRequestHandler):
+    # Serves the latest release and its device list like GitHub
+    etag = '"v1"'
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+
+        if self.path == '/repos/owner/repo/releases/latest':
+            if self.headers.get('If-None-Match') == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            body = json.dumps({'name': 'v1.0.0', 'tag_name': 'v1.0.0'})
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+        elif self.path == '/owner/repo/releases/download/v1.0.0/list.txt':
+            body = 'G:AMANDA@e,12\n\nM:OUTTMP@e,12\n'
+            self.send_response(200)
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.end_headers()
+        self.wfile.write(body.encode('utf8'))
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def server():
+    GitHubStandIn.paths = []
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubStandIn)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{http_server.server_port}'
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def provider(url, cache_directory, ttl):
+    return device_list.DeviceListProvider(
+        'owner',
+        'repo',
+        'list.txt',
+        cache_directory=cache_directory,
+        ttl=ttl,
+        timeout=1,
+        api_url=url,
+        download_url=url
+    )
+
+
+class TestClass:
+    def test_cached_fetch(self, server, tmp_path):
+        expected = ('v1.0.0', ['G:AMANDA@e,12', 'M:OUTTMP@e,12'])
+
+        assert provider(server, tmp_path, timedelta(hours=1)).fetch() \
+            == expected
+        assert len(GitHubStandIn.paths) == 2
+
+        # Within the TTL, e.g. after a restart, nothing is requested
+        assert provider(server, tmp_path, timedelta(hours=1)).fetch() \
+            == expected
+        assert len(GitHubStandIn.paths) == 2
+
+        # After the TTL the release is revalidated, the list is cached
+        assert provider(server, tmp_path, timedelta(0)).fetch() == expected
+        assert GitHubStandIn.paths[2:] == ['/repos/owner/repo/releases/latest']
+
+    def test_unreachable(self, server, tmp_path):
+        provider(server, tmp_path, timedelta(0)).fetch()
+        unreachable = 'http://127.0.0.1:9'
+
+        assert provider(unreachable, tmp_path, timedelta(0)).fetch() \
+            == ('v1.0.0', ['G:AMANDA@e,12', 'M:OUTTMP@e,12'])
+        assert provider(unreachable, tmp_path.joinpath('empty'),
+                        timedelta(0)).fetch() == (None, None)
+
+    def test_write_atomic(self, tmp_path):
+        # Writers sharing a cache don't clobber each other's temporary file
+        path = tmp_path.joinpath('list.txt')
+        texts = [f'Z:DEV{index}@e,12\n' * 1000 for index in range(8)]
+        threads = [
+            threading.Thread(target=device_list._write_atomic,
+                             args=(path, text))
+            for text in texts
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert path.read_text() in texts
+        assert list(tmp_path.iterdir()) == [path]
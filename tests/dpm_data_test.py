@@ -1,10 +1,145 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import datetime
+import json
 import math
+import os
+import signal
 import pandas as pd
+import pytest
+import acsys.dpm
 from datalogger_to_ml import dpm_data
+from datalogger_to_ml.dpm_data.dpm_data import _create_data_processor
+from datalogger_to_ml.dpm_data.device_buffer import DeviceBuffer
+from datalogger_to_ml.dpm_data.metrics import AcquisitionMetrics
+
+class FakeDPMContext:
+    # Replies with one sample per device whose value is the number in the
+    # device name, so the tag to device mapping can be checked
+    contexts = []
+
+    def __init__(self, con, dpm_node=None):
+        self.dpm_node = dpm_node
+        self.entries = []
+        FakeDPMContext.contexts.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def add_entries(self, entries):
+        self.entries = list(entries)
+
+    async def start(self, data_source=None):
+        self.data_source = data_source
+
+    async def _replies(self):
+        for tag, drf in self.entries:
+            value = float(drf.split(':DEV')[1].split('@')[0])
+            yield acsys.dpm.ItemData(tag, 0, 0, [value], micros=[tag])
+            await asyncio.sleep(0)
+
+        for tag, _ in self.entries:
+            yield acsys.dpm.ItemData(tag, 0, 0, [], micros=[])
+
+    def __aiter__(self):
+        return self._replies()
+
+
+class FlakyDPMContext(FakeDPMContext):
+    # The first context answers DEV1 with a status and stops after two of
+    # the three samples of DEV2 without a final reply. Later ones reply
+    # with all three samples of every device.
+    async def _replies(self):
+        first = len(FakeDPMContext.contexts) == 1
+
+        for tag, drf in self.entries:
+            device = int(drf.split(':DEV')[1].split('@')[0])
+
+            if first and device == 1:
+                yield acsys.dpm.ItemStatus(tag, -42)
+                continue
+
+            samples = 2 if first and device == 2 else 3
+            yield acsys.dpm.ItemData(
+                tag, 0, 0,
+                [float(device)] * samples,
+                micros=list(range(samples))
+            )
+
+            if not (first and device == 2):
+                yield acsys.dpm.ItemData(tag, 0, 0, [], micros=[])
+
+
+class InterruptedDPMContext(FakeDPMContext):
+    # The first context completes DEV0, sends two of the three samples of
+    # DEV1 and drops the connection. Later ones reply with all three
+    # samples of every device.
+    async def _replies(self):
+        first = len(FakeDPMContext.contexts) == 1
+
+        for tag, drf in self.entries:
+            device = int(drf.split(':DEV')[1].split('@')[0])
+
+            if first and device == 1:
+                yield acsys.dpm.ItemData(tag, 0, 0, [1.0, 1.0], micros=[0, 1])
+                raise ConnectionError('DPM went away')
+
+            yield acsys.dpm.ItemData(
+                tag, 0, 0, [float(device)] * 3, micros=[0, 1, 2]
+            )
+            yield acsys.dpm.ItemData(tag, 0, 0, [], micros=[])
+
+
+class BlockedDPMContext(FakeDPMContext):
+    # Completes DEV0, sends two samples of DEV1 and waits for DPM, which
+    # is when the process is told to stop
+    async def _replies(self):
+        yield acsys.dpm.ItemData(0, 0, 0, [0.0] * 3, micros=[0, 1, 2])
+        yield acsys.dpm.ItemData(0, 0, 0, [], micros=[])
+        yield acsys.dpm.ItemData(1, 0, 0, [1.0, 1.0], micros=[0, 1])
+        asyncio.get_running_loop().call_later(
+            0.01, os.kill, os.getpid(), signal.SIGTERM
+        )
+        await asyncio.Event().wait()
+
+
+@pytest.fixture
+def fake_dpm(tmp_path, monkeypatch):
+    # get_data against fake contexts on a local event loop. Selects the
+    # context class and returns a requests file with `devices` devices.
+    FakeDPMContext.contexts = []
+    monkeypatch.setattr(
+        acsys,
+        'run_client',
+        lambda get_logger_data: asyncio.run(get_logger_data(None))
+    )
+
+    def _fake_dpm(context_class, devices=3):
+        monkeypatch.setattr(acsys.dpm, 'DPMContext', context_class)
+        device_file = tmp_path.joinpath('requests.txt')
+        device_file.write_text(''.join(
+            f'Z:DEV{index}@e,12\n' for index in range(devices)
+        ))
+
+        return device_file
+
+    return _fake_dpm
+
+
+def run_until_complete(get_logger_data):
+    # Runs the client on a loop of its own, like acsys does
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(get_logger_data(None))
+    finally:
+        loop.close()
+
 
 class TestClass:
     def test_local_to_utc_ms(self):
@@ -41,3 +176,239 @@ class TestClass:
             None
         )
         assert data_source == f'LOGGER:{output_start_time}:{output_end_time}'
+
+    def test_device_buffer(self):
+        device_data = DeviceBuffer(initial_capacity=2)
+        assert device_data.to_data_frame() is None
+
+        for index in range(5):
+            device_data.extend([index * 2, index * 2 + 1], [float(index)] * 2)
+
+        data_frame = device_data.to_data_frame()
+        assert len(device_data) == 10
+        assert list(data_frame['Timestamps']) == list(range(10))
+        assert data_frame['Data'].dtype == 'float64'
+        assert data_frame['Data'].iloc[-1] == 4.0
+
+    def test_device_buffer_nbytes(self):
+        buffers = [DeviceBuffer(initial_capacity=2) for _ in range(3)]
+
+        for index in range(4):
+            for size, device_data in enumerate(buffers, 1):
+                device_data.extend(list(range(size * 3)), [1.0] * size * 3)
+
+            # What is accounted is what is allocated, not what is filled
+            assert sum(device_data.nbytes for device_data in buffers) == sum(
+                device_data._timestamps.nbytes + device_data._data.nbytes
+                for device_data in buffers
+            )
+            assert buffers[0].nbytes >= 16 * len(buffers[0])
+
+            data_frame = buffers[index % 3].flush()
+            assert buffers[index % 3].nbytes == 0
+            assert buffers[index % 3]._data is None
+            assert data_frame.index[0] == buffers[index % 3].rows_flushed \
+                - len(data_frame)
+
+    def test_create_data_processor(self, tmp_path):
+        device_list = ['G:AMANDA@e,12', 'M:OUTTMP@e,12']
+
+        with pd.HDFStore(tmp_path.joinpath('test.h5')) as hdf:
+            process_data = _create_data_processor(device_list, hdf)
+            replies = [
+                acsys.dpm.ItemData(0, 0, 0, [1.0, 2.0], micros=[1, 2]),
+                acsys.dpm.ItemData(0, 0, 0, [3.0], micros=[3]),
+                acsys.dpm.ItemData(1, 0, 0, [], micros=[]),
+                acsys.dpm.ItemData(0, 0, 0, [], micros=[])
+            ]
+
+            for reply in replies[:-1]:
+                assert process_data(reply) is False
+
+            assert process_data(replies[-1]) == [True, True]
+            assert hdf.keys() == ['/' + device_list[0]]
+            assert list(hdf[device_list[0]]['Data']) == [1.0, 2.0, 3.0]
+
+    def test_create_data_processor_metrics(self, tmp_path):
+        device_list = ['G:AMANDA@e,12', 'M:OUTTMP@e,12', 'Z:ACLTST@e,12']
+        metrics = AcquisitionMetrics()
+
+        with pd.HDFStore(tmp_path.joinpath('test.h5')) as hdf:
+            process_data = _create_data_processor(device_list, hdf,
+                                                  metrics=metrics)
+            process_data(acsys.dpm.ItemData(0, 0, 0, [1.0, 2.0],
+                                            micros=[1, 2]))
+            process_data(acsys.dpm.ItemData(0, 0, 0, [], micros=[]))
+            process_data(acsys.dpm.ItemStatus(1, -42))
+            metrics.finish(device_list)
+
+        amanda = metrics.devices['G:AMANDA@e,12']
+        assert (amanda['replies'], amanda['rows'], amanda['status']) \
+            == (2, 2, 'ok')
+        assert amanda['write_seconds'] > 0
+        assert metrics.devices['M:OUTTMP@e,12']['status'] == -42
+        assert metrics.summary()['statuses'] \
+            == {'ok': 1, 'status': 1, 'no_reply': 1}
+
+        metrics.write(tmp_path.joinpath('nanny.prom'),
+                      tmp_path.joinpath('metrics.jsonl'))
+        prom = tmp_path.joinpath('nanny.prom').read_text()
+        assert 'datalogger_window_devices{status="no_reply"} 1' in prom
+        assert len(tmp_path.joinpath('metrics.jsonl')
+                   .read_text().splitlines()) == 1
+
+    def test_create_data_processor_flush(self, tmp_path):
+        device_list = ['G:AMANDA@e,12', 'M:OUTTMP@e,12']
+        replies = [
+            acsys.dpm.ItemData(
+                index % 2, 0, 0,
+                [float(index)] * 10,
+                micros=list(range(index * 10, index * 10 + 10))
+            )
+            for index in range(20)
+        ] + [
+            acsys.dpm.ItemData(0, 0, 0, [], micros=[]),
+            acsys.dpm.ItemData(1, 0, 0, [], micros=[])
+        ]
+        outputs = []
+
+        for options in [
+            {'device_flush_bytes': 0, 'total_flush_bytes': 0},
+            {'device_flush_bytes': 300, 'total_flush_bytes': 0},
+            {'device_flush_bytes': 0, 'total_flush_bytes': 500}
+        ]:
+            with pd.HDFStore(tmp_path.joinpath(f'{len(outputs)}.h5')) as hdf:
+                process_data = _create_data_processor(
+                    device_list,
+                    hdf,
+                    **options
+                )
+
+                for reply in replies:
+                    process_data(reply)
+
+                outputs.append({key: hdf[key] for key in hdf.keys()})
+
+        for output in outputs[1:]:
+            assert output.keys() == outputs[0].keys()
+
+            for key, data_frame in output.items():
+                pd.testing.assert_frame_equal(data_frame, outputs[0][key])
+
+    def test_get_data_retries(self, tmp_path, fake_dpm):
+        device_file = fake_dpm(FlakyDPMContext)
+        output_file = tmp_path.joinpath('data.h5')
+
+        dpm_data.get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 20),
+            device_file=device_file,
+            output_file=output_file,
+            device_flush_bytes=1,
+            retry_backoff=0
+        )
+
+        # Only the failed and the silent device are requested again, the
+        # samples DEV2 already wrote aren't written twice
+        assert [len(context.entries) for context in FakeDPMContext.contexts] \
+            == [3, 2]
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert {key: list(hdf[key]['Timestamps']) for key in hdf.keys()} \
+                == {f'/Z:DEV{index}@e,12': [0, 1, 2] for index in range(3)}
+
+    def test_get_data_resume(self, tmp_path, fake_dpm):
+        device_file = fake_dpm(InterruptedDPMContext)
+        output_file = tmp_path.joinpath('data.h5')
+        options = {
+            'start_date': datetime.datetime(2021, 2, 1, 19),
+            'end_date': datetime.datetime(2021, 2, 1, 20),
+            'device_file': device_file,
+            'output_file': output_file,
+            'retries': 0,
+            'resume': True
+        }
+
+        with pytest.raises(ConnectionError):
+            dpm_data.get_data(**options)
+
+        # The buffered samples of DEV1 were written before giving up
+        checkpoint_file = tmp_path.joinpath('data.h5.checkpoint')
+        assert json.loads(checkpoint_file.read_text())['done'] \
+            == ['Z:DEV0@e,12']
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert list(hdf['Z:DEV1@e,12']['Timestamps']) == [0, 1]
+
+        dpm_data.get_data(**options)
+
+        # Only the unfinished devices are requested, DEV1 continues after
+        # its last written sample
+        assert [len(context.entries) for context in FakeDPMContext.contexts] \
+            == [3, 2]
+        assert not checkpoint_file.exists()
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert {key: list(hdf[key]['Timestamps']) for key in hdf.keys()} \
+                == {f'/Z:DEV{index}@e,12': [0, 1, 2] for index in range(3)}
+
+    def test_get_data_signal(self, tmp_path, monkeypatch, fake_dpm):
+        device_file = fake_dpm(BlockedDPMContext)
+        monkeypatch.setattr(acsys, 'run_client', run_until_complete)
+        output_file = tmp_path.joinpath('data.h5')
+
+        with pytest.raises(SystemExit):
+            dpm_data.get_data(
+                start_date=datetime.datetime(2021, 2, 1, 19),
+                end_date=datetime.datetime(2021, 2, 1, 20),
+                device_file=device_file,
+                output_file=output_file,
+                retries=0,
+                resume=True
+            )
+
+        # Buffered samples are written and the finished device recorded
+        # before the output is closed
+        checkpoint_file = tmp_path.joinpath('data.h5.checkpoint')
+        assert json.loads(checkpoint_file.read_text())['done'] \
+            == ['Z:DEV0@e,12']
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert {key: list(hdf[key]['Timestamps']) for key in hdf.keys()} \
+                == {'/Z:DEV0@e,12': [0, 1, 2], '/Z:DEV1@e,12': [0, 1]}
+
+    def test_pack_device_list(self):
+        device_list = ['A', 'B', 'C', 'D', 'E']
+        costs = {'A': 10.0, 'B': 1.0, 'C': 6.0, 'D': 4.0}
+
+        assert dpm_data.pack_device_list(device_list, 2) \
+            == [[0, 1, 2], [3, 4]]
+        # E has no history and counts as the median cost, 6
+        assert dpm_data.pack_device_list(device_list, 2, costs) \
+            == [[0, 3], [1, 2, 4]]
+
+    def test_get_data_shards(self, tmp_path, fake_dpm):
+        device_list = [f'Z:DEV{index}@e,12' for index in range(7)]
+        device_file = fake_dpm(FakeDPMContext, len(device_list))
+        output_file = tmp_path.joinpath('data.h5')
+
+        dpm_data.get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 20),
+            device_file=device_file,
+            output_file=output_file,
+            shards=3,
+            dpm_nodes=['DPM01', 'DPM02']
+        )
+
+        contexts = FakeDPMContext.contexts
+        assert [len(context.entries) for context in contexts] == [3, 2, 2]
+        assert [context.dpm_node for context in contexts] == [
+            'DPM01', 'DPM02', 'DPM01'
+        ]
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert len(hdf.keys()) == len(device_list)
+
+            for index, device in enumerate(device_list):
+                assert list(hdf[device]['Data']) == [float(index)]
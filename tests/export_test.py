@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datalogger_to_ml import export
+
+
+class TestClass:
+    def test_append_npy(self, tmp_path):
+        path = tmp_path.joinpath('timestamps.npy')
+        assert export.append_npy(path, np.arange(3, dtype=np.int64)) == 3
+        assert export.append_npy(path, np.arange(3, 10, dtype=np.int64)) == 10
+
+        timestamps = np.load(path, mmap_mode='r')
+        assert isinstance(timestamps, np.memmap)
+        assert list(timestamps) == list(range(10))
+
+        sliced, values = export.time_slice(timestamps, timestamps * 2.0, 4, 7)
+        assert list(sliced) == [4, 5, 6]
+        assert list(values) == [8.0, 10.0, 12.0]
+
+    def test_device_directory(self):
+        assert export.device_directory('G:AMANDA@e,12').startswith('G_AMANDA_e_12-')
+        assert export.device_directory('G:AMANDA@e,12') != \
+            export.device_directory('G_AMANDA@e,12')
+
+    def test_export_device(self, tmp_path):
+        index = export.load_index(tmp_path)
+        device = 'G:AMANDA@e,12'
+
+        def export_rows(timestamps, values):
+            export._export_device(
+                tmp_path,
+                index,
+                device,
+                pd.DataFrame(data={'Timestamps': timestamps, 'Data': values}),
+                0,
+                100
+            )
+
+        export_rows([0, 1], np.array([1, 2], dtype=np.int64))
+        # Floats after integers widen the values rather than truncating
+        export_rows([2], [2.5])
+        export._write_index(tmp_path, index)
+        timestamps, values = export.load_device(tmp_path, device)
+        assert index['devices'][device]['dtype'] == 'float64'
+        assert list(values) == [1.0, 2.0, 2.5]
+
+        # An export interrupted between the two appends left rows the index
+        # doesn't have, they are dropped before appending
+        directory = tmp_path.joinpath(index['devices'][device]['path'])
+        export.append_npy(directory.joinpath('timestamps.npy'),
+                          np.array([3, 4], dtype=np.int64))
+        export_rows([3], [3.5])
+        export._write_index(tmp_path, index)
+        timestamps, values = export.load_device(tmp_path, device)
+        assert list(timestamps) == [0, 1, 2, 3]
+        assert list(values) == [1.0, 2.0, 2.5, 3.5]
+        assert index['devices'][device]['rows'] == 4
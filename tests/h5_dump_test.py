@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import pandas as pd
+from datalogger_to_ml import h5_dump
+from datalogger_to_ml import storage
+
+
+class TestClass:
+    def test_dump(self, tmp_path):
+        path = tmp_path.joinpath('dump.h5')
+
+        with pd.HDFStore(path) as hdf:
+            hdf.append('G:AMANDA@e,12', pd.DataFrame(data={
+                'Timestamps': range(10, 20),
+                'Data': [float(value) for value in range(10)]
+            }))
+            hdf.append('M:OUTTMP@e,12', pd.DataFrame(data={
+                'Timestamps': [1],
+                'Data': [1.0]
+            }))
+
+        with storage.open_store(path) as store:
+            keys = h5_dump.select_keys(store.keys(), ['G:*'])
+            assert keys == ['/G:AMANDA@e,12']
+
+            output = io.StringIO()
+            h5_dump.dump_key(output, store, keys[0], head=3, tail=2,
+                             chunksize=2)
+            rows = [line.split() for line in output.getvalue().splitlines()]
+            assert [row[0] for row in rows[2:]] == ['0', '1', '2', '...',
+                                                    '8', '9']
+
+            stats = h5_dump.key_stats(store, keys[0], chunksize=3)
+            assert stats == {'count': 10, 'min': 0.0, 'max': 9.0,
+                             'mean': 4.5, 'first': 10, 'last': 19}
+
+    def test_dump_default(self, tmp_path):
+        path = tmp_path.joinpath('dump.h5')
+        output_file = tmp_path.joinpath('dump.txt')
+        data_frame = pd.DataFrame(data={
+            'Timestamps': range(100),
+            'Data': [float(value) for value in range(100)]
+        })
+
+        with pd.HDFStore(path) as hdf:
+            hdf.append('G:AMANDA@e,12', data_frame)
+
+        # Without --keys, --head or --tail frames print as pandas cuts them
+        h5_dump.dump(input_file=path, output_file=output_file)
+        assert output_file.read_text() == f'/G:AMANDA@e,12:\n{data_frame}\n'
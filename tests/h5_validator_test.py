@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from datalogger_to_ml import catalog
+from datalogger_to_ml import h5_validator
+
+
+def write_file(path, timestamps):
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with pd.HDFStore(path) as hdf:
+        hdf.append('G:AMANDA@e,12', pd.DataFrame(data={
+            'Timestamps': timestamps,
+            'Data': [0.0] * len(timestamps)
+        }))
+
+
+class TestClass:
+    def test_validate_tree(self, tmp_path):
+        valid = tmp_path.joinpath('202001', '01',
+                                  '20200101T000000PT1H-1_0_0.h5')
+        unordered = tmp_path.joinpath('202001', '01',
+                                      '20200101T010000PT1H-1_0_0.h5')
+        write_file(valid, [1, 2, 3])
+        write_file(unordered, [1, 3, 2])
+
+        report = h5_validator.validate_tree(tmp_path, workers=2)
+        assert (report['checked'], report['skipped'], report['failed']) \
+            == (2, 0, 1)
+        assert report['files'][0]['rows'] == {'G:AMANDA@e,12': 3}
+        assert report['files'][1]['status'] == 'failed'
+
+        # Only the file that failed is read again
+        report = h5_validator.validate_tree(tmp_path, workers=2)
+        assert (report['checked'], report['skipped']) == (1, 1)
+
+        # A changed file is compared with the catalog
+        catalog.rebuild(tmp_path).close()
+        write_file(valid, [4])
+        report = h5_validator.validate_tree(tmp_path, workers=2)
+        assert report['files'][0]['status'] == 'failed'
+        assert 'the catalog has 3' in report['files'][0]['errors'][0]
+
+        # So is a file that lost a device
+        with pd.HDFStore(valid) as hdf:
+            hdf.append('M:OUTTMP@e,12', pd.DataFrame(data={
+                'Timestamps': [1],
+                'Data': [0.0]
+            }))
+
+        catalog.rebuild(tmp_path).close()
+
+        with pd.HDFStore(valid) as hdf:
+            hdf.remove('G:AMANDA@e,12')
+
+        report = h5_validator.validate_tree(tmp_path, workers=2)
+        assert report['files'][0]['status'] == 'failed'
+        assert report['files'][0]['errors'] == [
+            'G:AMANDA@e,12: missing, the catalog has it'
+        ]
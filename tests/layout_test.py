@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+from datalogger_to_ml import layout
+
+
+class TestClass:
+    def test_get_output_filename(self):
+        output_filename = layout.get_output_filename(
+            datetime(2020, 1, 1),
+            timedelta(hours=1),
+            '1.0.0'
+        )
+        assert output_filename == '20200101T000000PT1H-1_0_0.h5'
+
+    def test_paths(self):
+        start_time = datetime(2020, 1, 2, 3)
+        assert layout.create_structured_path('output', start_time) \
+            == Path('output', '202001', '02')
+        assert layout.create_archive_path('output', start_time) \
+            == Path('output', 'archive', '202001')
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+import pandas as pd
+import pytest
+from datalogger_to_ml import catalog
+from datalogger_to_ml import nanny
+
+
+class TestClass:
+    def test_due_windows(self):
+        start_time = datetime(2020, 1, 1)
+        duration = timedelta(hours=1)
+        windows = nanny.due_windows(
+            start_time,
+            duration,
+            datetime(2020, 1, 1, 3, 30)
+        )
+        assert windows == [
+            start_time,
+            start_time + duration,
+            start_time + 2 * duration
+        ]
+        assert nanny.due_windows(start_time, duration, start_time) == []
+
+    def test_get_duration_config(self):
+        assert nanny.get_duration_config({}, {}) is None
+        assert nanny.get_duration_config({'duration': 'T15M'}, {}) \
+            == timedelta(minutes=15)
+
+    def test_report_gaps_without_duration(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+        with pytest.raises(SystemExit, match='--duration'):
+            nanny.report_gaps(
+                output_path=tmp_path,
+                start_time=datetime(2020, 1, 1)
+            )
+
+    def test_report_gaps(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        nanny.report_gaps(
+            output_path=tmp_path,
+            start_time=datetime(2020, 1, 1),
+            end_time=datetime(2020, 1, 1, 2),
+            duration='T1H'
+        )
+
+        assert capsys.readouterr().out.split() == [
+            '20200101T000000PT1H',
+            '20200101T010000PT1H'
+        ]
+
+    def test_split_duration(self):
+        hour = timedelta(hours=1)
+        minimum = timedelta(minutes=5)
+        assert nanny.split_duration(hour, 1, minimum) == hour
+        assert nanny.split_duration(hour, 3, minimum) \
+            == timedelta(minutes=20)
+        assert nanny.split_duration(hour, 7, minimum) \
+            == timedelta(minutes=7, seconds=30)
+        assert nanny.split_duration(hour, 1000, minimum) == minimum
+
+    def test_get_start_time_mixed_durations(self, tmp_path):
+        # A window fetched in two of four parts continues up to the next
+        # hour, then whole hours again
+        for name in ['20200101T000000PT1H-1_0_0.h5',
+                     '20200101T010000PT15M-1_0_0.h5',
+                     '20200101T011500PT15M-1_0_0.h5']:
+            with pd.HDFStore(tmp_path.joinpath(name)) as hdf:
+                hdf.append('Z:DEV0@e,12', pd.DataFrame(data={
+                    'Timestamps': [1],
+                    'Data': [1.0]
+                }))
+
+        config = {'start': '20200101T000000', 'duration': 'T1H'}
+        assert nanny.get_start_time(tmp_path, {}, config) \
+            == (datetime(2020, 1, 1, 1, 30), timedelta(minutes=30))
+
+        config['start'] = '20200101T013000'
+        assert nanny.get_start_time(tmp_path, {}, config) \
+            == (datetime(2020, 1, 1, 1, 30), timedelta(hours=1))
+
+    def test_get_start_time_after_archive(self, tmp_path):
+        # The hours of a day were compacted and deleted, windows continue
+        # after the archive with the duration of the hourly files
+        for name in ['20191231T230000PT1H-1_0_0.h5',
+                     'archive/202001/20200101T000000P1D-1_0_0.h5']:
+            path = tmp_path.joinpath(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            with pd.HDFStore(path) as hdf:
+                hdf.append('Z:DEV0@e,12', pd.DataFrame(data={
+                    'Timestamps': [1],
+                    'Data': [1.0]
+                }))
+
+        config = {'start': '20191231T230000'}
+        assert nanny.get_start_time(tmp_path, {}, config) \
+            == (datetime(2020, 1, 2), timedelta(hours=1))
+
+    def test_repair(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tmp_path.joinpath('requests.txt').write_text(
+            'Z:SIM000000@p,15H\nZ:SIM000001@p,15H\n'
+        )
+        tmp_path.joinpath('config.yaml').write_text(
+            'local:\n'
+            '  file: requests.txt\n'
+            '  version: 1.0.0\n'
+            'output:\n'
+            '  path: output\n'
+            'logging:\n'
+            '  level: WARNING\n'
+            'dpm:\n'
+            '  simulator:\n'
+            '    sample_rate: 0.01\n'
+        )
+        path = tmp_path.joinpath('output', '202001', '01',
+                                 '20200101T000000PT1H-1_0_0.h5')
+        path.parent.mkdir(parents=True)
+
+        with pd.HDFStore(path) as hdf:
+            hdf.append('Z:SIM000000@p,15H', pd.DataFrame(data={
+                'Timestamps': [1],
+                'Data': [1.0]
+            }))
+
+        nanny.repair()
+
+        assert catalog.count_rows(path) == {
+            'Z:SIM000000@p,15H': 1,
+            'Z:SIM000001@p,15H': 36
+        }
+        assert list(tmp_path.joinpath('output', '.staging').iterdir()) == []
+
+    def test_fill_gaps_after_split(self, tmp_path, monkeypatch):
+        # The newest window was fetched in sub-windows, gaps are still
+        # found and fetched as whole windows
+        monkeypatch.chdir(tmp_path)
+        tmp_path.joinpath('requests.txt').write_text('Z:SIM000000@p,15H\n')
+        tmp_path.joinpath('config.yaml').write_text(
+            'local:\n'
+            '  file: requests.txt\n'
+            '  version: 1.0.0\n'
+            'output:\n'
+            '  path: output\n'
+            'logging:\n'
+            '  level: WARNING\n'
+            'start: 20200101T000000\n'
+            'duration: T1H\n'
+            'gaps:\n'
+            '  fill: oldest\n'
+            'dpm:\n'
+            '  simulator:\n'
+            '    sample_rate: 0.01\n'
+        )
+
+        for name in ['20200101T010000PT1H-1_0_0.h5',
+                     '20200101T020000PT15M-1_0_0.h5']:
+            path = tmp_path.joinpath('output', '202001', '01', name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            with pd.HDFStore(path) as hdf:
+                hdf.append('Z:SIM000000@p,15H', pd.DataFrame(data={
+                    'Timestamps': [1],
+                    'Data': [1.0]
+                }))
+
+        backfills = []
+        monkeypatch.setattr(
+            nanny,
+            'backfill',
+            lambda windows, duration, *args, **kwargs:
+                backfills.append((windows, duration))
+        )
+        nanny.get_data(run_once=True)
+
+        assert backfills == [([datetime(2020, 1, 1)], timedelta(hours=1))]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pstats
+import tracemalloc
+from datalogger_to_ml import profiling
+
+
+def write():
+    return sum(range(1000))
+
+
+def process(append):
+    return append()
+
+
+class TestClass:
+    def test_sections(self, tmp_path, capsys):
+        profiler = profiling.Profiler(tmp_path, trace_memory=True)
+        append = profiler.wrap('writing', write)
+
+        with profiler.section('acquisition'):
+            for _ in range(3):
+                profiler.wrap('processing', process)(append)
+
+        paths = profiler.dump('window')
+        tracemalloc.stop()
+        assert sorted(path.name for path in paths) == [
+            'window.acquisition.prof',
+            'window.memory.txt',
+            'window.processing.prof',
+            'window.writing.prof'
+        ]
+
+        # Calls are only counted in the innermost section
+        functions = {
+            name: {function[2] for function in pstats.Stats(
+                str(tmp_path.joinpath(f'window.{name}.prof'))
+            ).stats}
+            for name in ['acquisition', 'processing', 'writing']
+        }
+        assert 'write' in functions['writing']
+        assert 'write' not in functions['processing']
+        assert 'process' in functions['processing']
+        assert 'process' not in functions['acquisition']
+        assert '--- writing ---' in capsys.readouterr().out
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from datetime import timedelta
+import pandas as pd
+import pytest
+from datalogger_to_ml import reader
+from datalogger_to_ml.dpm_data import local_to_utc_ms
+
+HOUR = timedelta(hours=1)
+
+
+def write_hour(output_path, start_time, data_columns):
+    path = output_path.joinpath(
+        start_time.strftime('%Y%m'),
+        start_time.strftime('%d'),
+        start_time.strftime('%Y%m%dT%H%M%SPT1H-1_0_0.h5')
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start_us = local_to_utc_ms(start_time) * 1000
+    # One sample every 10 minutes
+    timestamps = [start_us + minutes * 60000000 for minutes in range(0, 60, 10)]
+    data_frame = pd.DataFrame(data={
+        'Timestamps': timestamps,
+        'Data': [float(minutes) for minutes in range(0, 60, 10)]
+    })
+
+    with pd.HDFStore(path) as hdf:
+        hdf.append('G:AMANDA@e,12', data_frame, data_columns=data_columns)
+        hdf.append('M:OUTTMP@e,12', data_frame, data_columns=data_columns)
+
+
+class TestClass:
+    @pytest.mark.parametrize('data_columns', [None, ['Timestamps']])
+    def test_read(self, tmp_path, data_columns):
+        start_time = datetime(2020, 1, 1, 23)
+
+        for hour in range(3):
+            write_hour(tmp_path, start_time + hour * HOUR, data_columns)
+
+        files = reader.files_for_range(
+            tmp_path,
+            start_time + HOUR / 2,
+            start_time + 2 * HOUR
+        )
+        assert [file[0] for file in files] == [start_time, start_time + HOUR]
+
+        chunks = list(reader.read(
+            tmp_path,
+            ['G:AMANDA@e,12', 'G:MISSING@e,12'],
+            start_time + HOUR / 2,
+            start_time + 2 * HOUR,
+            chunksize=4
+        ))
+        assert {device for device, _ in chunks} == {'G:AMANDA@e,12'}
+        assert all(len(chunk) <= 4 for _, chunk in chunks)
+        data = pd.concat([chunk for _, chunk in chunks])['Data']
+        assert list(data) == [30.0, 40.0, 50.0, 0.0, 10.0, 20.0, 30.0, 40.0, 50.0]
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import acsys.dpm
+import numpy as np
+import pandas as pd
+from datalogger_to_ml.dpm_data import get_data
+from datalogger_to_ml.dpm_data import reply_log
+from .dpm_data_test import FakeDPMContext
+from .dpm_data_test import FlakyDPMContext
+from .dpm_data_test import fake_dpm
+
+
+class OutOfOrderDPMContext(FakeDPMContext):
+    # Replies with samples of one device out of time order
+    async def _replies(self):
+        for micros in ([10], [20], [15]):
+            yield acsys.dpm.ItemData(0, 0, 0, [float(micros[0])],
+                                     micros=micros)
+
+        yield acsys.dpm.ItemData(0, 0, 0, [], micros=[])
+
+
+class TestClass:
+    def test_record_replay(self, tmp_path):
+        recorded_file = tmp_path.joinpath('recorded.h5')
+        replayed_file = tmp_path.joinpath('replayed.h5')
+
+        get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 19, 1),
+            output_file=recorded_file,
+            shards=2,
+            record=tmp_path,
+            retries=0,
+            simulator={
+                'devices': 6,
+                'reply_size': 100,
+                'status_fraction': 0.5,
+                'late_fraction': 0.5
+            }
+        )
+        log_file = tmp_path.joinpath(f'recorded{reply_log.EXTENSION}')
+        header = reply_log.load_header(log_file)
+        assert len(header['device_list']) == 6
+        assert header['data_source'].startswith('LOGGER:')
+
+        replies = [reply for _, reply in reply_log.read_replies(log_file)]
+        assert {type(reply) for reply in replies} == {
+            acsys.dpm.ItemData,
+            acsys.dpm.ItemStatus,
+            acsys.dpm.DeviceInfo_reply
+        }
+        assert {reply_log.reply_tag(reply) for reply in replies} \
+            == set(range(6))
+
+        get_data(output_file=replayed_file, replay=log_file)
+
+        with pd.HDFStore(recorded_file, 'r') as recorded, \
+                pd.HDFStore(replayed_file, 'r') as replayed:
+            assert recorded.keys() == replayed.keys()
+
+            for key in recorded.keys():
+                pd.testing.assert_frame_equal(recorded[key], replayed[key])
+
+    def test_record_replay_retries(self, tmp_path, fake_dpm):
+        device_file = fake_dpm(FlakyDPMContext)
+        recorded_file = tmp_path.joinpath('recorded.h5')
+        replayed_file = tmp_path.joinpath('replayed.h5')
+
+        get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 20),
+            device_file=device_file,
+            output_file=recorded_file,
+            device_flush_bytes=1,
+            record=tmp_path,
+            retry_backoff=0
+        )
+        log_file = tmp_path.joinpath(f'recorded{reply_log.EXTENSION}')
+        replies = [reply for _, reply in reply_log.read_replies(log_file)]
+        # The retry of DEV1 and DEV2 is recorded with their tags in the list
+        assert [
+            reply_log.reply_tag(reply) for reply in replies
+            if isinstance(reply, acsys.dpm.ItemData) and len(reply.data)
+        ] == [0, 2, 1, 2]
+
+        get_data(output_file=replayed_file, replay=log_file)
+
+        with pd.HDFStore(recorded_file, 'r') as recorded, \
+                pd.HDFStore(replayed_file, 'r') as replayed:
+            assert recorded.keys() == replayed.keys()
+
+            for key in recorded.keys():
+                pd.testing.assert_frame_equal(recorded[key], replayed[key])
+
+    def test_replay_out_of_order(self, tmp_path, fake_dpm):
+        device_file = fake_dpm(OutOfOrderDPMContext, 1)
+        recorded_file = tmp_path.joinpath('recorded.h5')
+        replayed_file = tmp_path.joinpath('replayed.h5')
+
+        get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 20),
+            device_file=device_file,
+            output_file=recorded_file,
+            device_flush_bytes=1,
+            record=tmp_path
+        )
+        log_file = tmp_path.joinpath(f'recorded{reply_log.EXTENSION}')
+        get_data(output_file=replayed_file, replay=log_file,
+                 device_flush_bytes=1)
+
+        # Late samples outside a retry are kept
+        with pd.HDFStore(recorded_file, 'r') as recorded, \
+                pd.HDFStore(replayed_file, 'r') as replayed:
+            assert sorted(recorded['/Z:DEV0@e,12']['Timestamps']) \
+                == [10, 15, 20]
+            pd.testing.assert_frame_equal(recorded['/Z:DEV0@e,12'],
+                                          replayed['/Z:DEV0@e,12'])
+
+    def test_array_data(self, tmp_path):
+        log_file = tmp_path.joinpath('array.replies')
+
+        with reply_log.ReplyRecorder(log_file, ['B:ARRAY[0:2]@e,12'],
+                                     'LOGGER:0:1') as recorder:
+            recorder.write(acsys.dpm.ItemData(
+                0, 0, 0, [[1.0, 2.0], [3.0, 4.0]], micros=[1, 2]
+            ))
+            recorder.write(acsys.dpm.ItemData(
+                0, 0, 0, np.array(['on', 'off']), micros=[3, 4]
+            ))
+            recorder.retry([0])
+
+        # A truncated last record is dropped
+        with open(log_file, 'ab') as file_handle:
+            file_handle.write(b'\x00\x00')
+
+        (_, reply), (_, strings), (_, retry) = \
+            reply_log.read_replies(log_file)
+        assert list(reply.micros) == [1, 2]
+        np.testing.assert_array_equal(reply.data, [[1.0, 2.0], [3.0, 4.0]])
+        # Nothing is unpickled, strings come back as JSON
+        assert strings.data == ['on', 'off']
+        assert retry.tags == [0]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import pandas as pd
+import pytest
+from datalogger_to_ml.dpm_data import get_data
+from datalogger_to_ml.dpm_data import simulator
+
+
+class TestClass:
+    def test_get_data(self, tmp_path):
+        output_file = tmp_path.joinpath('data.h5')
+
+        get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 19, 1),
+            output_file=output_file,
+            shards=2,
+            retries=0,
+            simulator={
+                'devices': 6,
+                'sample_rate': 2,
+                'reply_size': 25,
+                'status_fraction': 0.5,
+                'late_fraction': 0.5
+            }
+        )
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            rows = sorted(len(hdf[key]) for key in hdf.keys())
+
+        # Each shard answers one of its three devices with a status, and
+        # the late sample of a device is appended to its table
+        assert rows == [120, 120, 121, 121]
+
+    def test_get_data_simulate(self, tmp_path, monkeypatch):
+        factories = []
+        context_factory = simulator.context_factory
+
+        def _context_factory(settings=None):
+            factories.append(settings)
+            return context_factory(settings)
+
+        monkeypatch.setattr(simulator, 'context_factory', _context_factory)
+        output_file = tmp_path.joinpath('data.h5')
+
+        get_data(
+            start_date=datetime.datetime(2021, 2, 1, 19),
+            end_date=datetime.datetime(2021, 2, 1, 19, 1),
+            output_file=output_file,
+            retries=0,
+            simulate=True
+        )
+
+        assert factories == [simulator.SETTINGS]
+
+        with pd.HDFStore(output_file, 'r') as hdf:
+            assert len(hdf.keys()) == simulator.SETTINGS['devices']
+
+    def test_settings(self):
+        assert simulator.get_settings(True) == simulator.SETTINGS
+
+        with pytest.raises(ValueError):
+            simulator.get_settings({'sample_rates': 1})
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import errno
+import os
+import pandas as pd
+import pytest
+from datalogger_to_ml import storage
+
+
+@pytest.fixture(params=['hdf5', 'parquet'])
+def output_format(request):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+
+    return request.param
+
+
+class TestClass:
+    def test_store_class(self):
+        assert storage.store_class(path='a.parquet') is storage.ParquetStore
+        assert storage.store_class(path='a.h5') is storage.Hdf5Store
+        assert storage.store_class() is storage.Hdf5Store
+
+        with pytest.raises(ValueError):
+            storage.store_class('csv')
+
+    def test_timestamp_index(self, tmp_path):
+        path = tmp_path.joinpath('data.h5')
+
+        # Late data is merged in order
+        with storage.open_store(path, mode='a') as store:
+            store.append('G:AMANDA@e,12', pd.DataFrame(data={
+                'Timestamps': [10, 20, 30],
+                'Data': [1.0, 2.0, 3.0]
+            }))
+            store.append('G:AMANDA@e,12', pd.DataFrame(data={
+                'Timestamps': [15],
+                'Data': [1.5]
+            }))
+
+        with pd.HDFStore(path, 'r') as hdf:
+            table = hdf.get_storer('G:AMANDA@e,12').table
+            assert table.colindexed['index']
+            assert list(hdf.select('G:AMANDA@e,12', where='index >= 15')
+                        ['Data']) == [1.5, 2.0, 3.0]
+
+        with storage.open_store(path) as store:
+            chunks = list(store.iter_range('G:AMANDA@e,12', 15, 30, 10))
+            assert list(pd.concat(chunks)['Timestamps']) == [15, 20]
+
+    def test_sort_out_of_core(self, tmp_path, monkeypatch):
+        path = tmp_path.joinpath('data.h5')
+
+        with storage.open_store(path, mode='a') as store:
+            store.append('G:AMANDA@e,12', pd.DataFrame(data={
+                'Timestamps': [10, 20, 30],
+                'Data': [1.0, 2.0, 3.0]
+            }))
+
+        # A resumed file was left with late data as its last row
+        with pd.HDFStore(path, 'a') as hdf:
+            hdf.append('G:AMANDA@e,12', pd.DataFrame(
+                data={'Timestamps': [15], 'Data': [1.5]},
+                index=[15]
+            ))
+
+        select = pd.HDFStore.select
+
+        def _select(hdf, key, *args, **kwargs):
+            # Only bounded reads, tables are never read whole
+            assert kwargs.get('chunksize') or kwargs.get('where') or \
+                kwargs.get('stop') is not None
+            return select(hdf, key, *args, **kwargs)
+
+        monkeypatch.setattr(pd.HDFStore, 'select', _select)
+
+        # The newest timestamp is 30, not the 15 of the last row
+        with storage.open_store(path, mode='a') as store:
+            store.append('G:AMANDA@e,12', pd.DataFrame(data={
+                'Timestamps': [25],
+                'Data': [2.5]
+            }))
+
+        monkeypatch.setattr(pd.HDFStore, 'select', select)
+
+        with pd.HDFStore(path, 'r') as hdf:
+            assert list(hdf['G:AMANDA@e,12']['Timestamps']) \
+                == [10, 15, 20, 25, 30]
+            assert hdf.get_storer('G:AMANDA@e,12').table \
+                .colinstances['index'].index.is_csi
+
+    def test_publish(self, tmp_path, monkeypatch):
+        source = tmp_path.joinpath('staging', 'data.h5')
+        source.parent.mkdir()
+        source.write_bytes(b'data')
+        destination = tmp_path.joinpath('data.h5')
+
+        # Another filesystem, renames only work within the output tree
+        replace = os.replace
+
+        def _replace(source_path, destination_path):
+            if 'staging' in str(source_path):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+            replace(source_path, destination_path)
+
+        monkeypatch.setattr(os, 'replace', _replace)
+        storage.publish(source, destination)
+
+        assert destination.read_bytes() == b'data'
+        assert not source.exists()
+        assert sorted(path.name for path in tmp_path.iterdir()) \
+            == ['data.h5', 'staging']
+
+    def test_round_trip(self, tmp_path, output_format):
+        extension = storage.FORMATS[output_format].extension
+        path = tmp_path.joinpath(f'data{extension}')
+        first = pd.DataFrame(data={'Timestamps': [1, 2], 'Data': [1.0, 2.0]})
+        second = pd.DataFrame(data={'Timestamps': [3], 'Data': [3.0]})
+
+        with storage.open_store(path, mode='a', chunkshape=2) as store:
+            store.append('G:AMANDA@e,12', first)
+            store.append('M:OUTTMP@e,12', second)
+            store.append('G:AMANDA@e,12', second)
+
+        # Appending to an existing file keeps its rows
+        with storage.open_store(path, mode='a') as store:
+            store.append('M:OUTTMP@e,12', first)
+
+        assert storage.find_outputs(tmp_path) == [str(path)]
+
+        with storage.open_store(path) as store:
+            assert sorted(store.keys()) == ['/G:AMANDA@e,12', '/M:OUTTMP@e,12']
+            assert store.nrows('/G:AMANDA@e,12') == 3
+            data_frame = store.select('G:AMANDA@e,12')
+            assert list(data_frame['Timestamps']) == [1, 2, 3]
+            assert list(data_frame['Data']) == [1.0, 2.0, 3.0]
+            chunks = list(store.iter_chunks('M:OUTTMP@e,12', 2))
+            assert all(0 < len(chunk) <= 2 for chunk in chunks)
+            # HDF5 tables are kept in timestamp order, Parquet keeps the
+            # order of appends
+            assert list(pd.concat(chunks)['Timestamps']) \
+                == ([1, 2, 3] if output_format == 'hdf5' else [3, 1, 2])